@@ -51,7 +51,11 @@ class AdminRoutes:
 
     @roles_accepted('admin')
     def _close_order(self):
-        self._mett_store.process_order()
+        try:
+            charges = self._mett_store.process_order()
+            flash('Charged {:.2f} $ from {} accounts'.format(sum(charges.values()), len(charges)), 'success')
+        except StorageException as error:
+            flash(str(error), 'warning')
         return self._show_admin_home()
 
     @roles_accepted('admin')
@@ -120,7 +124,10 @@ class AdminRoutes:
     @roles_accepted('admin')
     def _assign_bun(self):
         if request.method == 'POST':
-            self._mett_store.order_bun(request.form['username'], request.form['bun'])
+            try:
+                self._mett_store.order_bun(request.form['username'], request.form['bun'])
+            except StorageException as error:
+                flash(str(error), 'warning')
             return render_template('admin.html', order_exists=self._mett_store.active_order_exists(), store_stats=get_store_stats(self._mett_store))
         return render_template('admin/assign.html', bun_classes=self._mett_store.list_bun_classes(), users=[name for _id, name in self._mett_store.list_accounts()], order_exists=self._mett_store.active_order_exists())
 
@@ -143,11 +150,11 @@ def _get_change_of_balance(request):
 
 
 def get_store_stats(mett_store: MettStore) -> Dict[str, Union[int, float]]:
-    deposits = sum(deposit['amount'] for deposit in mett_store.get_deposits())
-    purchases = sum(purchase['price'] for purchase in mett_store.list_purchases(processed=True))
+    deposits = mett_store.sum_of_deposits()
+    purchases = mett_store.sum_of_purchases()
     return {
         'sum_of_deposits': deposits,
         'sum_of_purchases': purchases,
         'balance': deposits - purchases,
-        'sum_of_buns': sum(len(order['orders']) for order in mett_store.get_all_order_information()),
+        'sum_of_buns': mett_store.count_ordered_buns(),
     }
@@ -1,4 +1,22 @@
 from app.app_setup import AppSetup
 
+try:
+    from uwsgidecorators import postfork
+except ImportError:  # not running in uwsgi
+    postfork = None
 
-APP = AppSetup().app.wsgi_app
+
+APP_SETUP = AppSetup(serving=True)
+APP_SETUP.initialize()  # in the uwsgi master, so once and not in every worker
+APP = APP_SETUP.app.wsgi_app
+
+
+def _start_worker():
+    APP_SETUP.reconnect()
+    APP_SETUP.prepare_worker()
+
+
+if postfork is not None:
+    postfork(_start_worker)
+else:
+    APP_SETUP.prepare_worker()
@@ -1,3 +1,4 @@
+import logging
 import os
 from configparser import ConfigParser
 from pathlib import Path
@@ -7,11 +8,15 @@ from flask import Flask
 
 from app.admin import AdminRoutes
 from app.dashboard import DashboardRoutes
+from app.metrics import MetricsRoutes, instrument_store, register_command_counter
 from app.orders import OrderRoutes
 from app.profile import ProfileRoutes
 from app.security.authentication import add_flask_security_to_app
+from app.template_cache import add_bytecode_cache, compile_templates
 from app.user import UserRoutes
+from database.client import reset_clients
 from database.mett_store import MettStore
+from database.store_calls import track_store_calls
 
 
 class Filter:
@@ -42,6 +47,9 @@ class ReverseProxied:
         self.server = server
 
     def __call__(self, environ, start_response):
+        return self.app(self.rewrite(environ), start_response)
+
+    def rewrite(self, environ):
         script_name = environ.get('HTTP_X_SCRIPT_NAME', '') or self.script_name
         if script_name:
             environ['SCRIPT_NAME'] = script_name
@@ -54,30 +62,77 @@ class ReverseProxied:
         server = environ.get('HTTP_X_FORWARDED_SERVER', '') or self.server
         if server:
             environ['HTTP_HOST'] = server
-        return self.app(environ, start_response)
+        return environ
+
+
+def create_template_app(config):
+    # flask app with templates, filters and bytecode cache only, e.g. to compile templates without any database
+    app = Flask(__name__)
+    add_bytecode_cache(app, config)
+    Filter(app, config)
+    return app
 
 
 class AppSetup:
-    def __init__(self, config=None):
+    def __init__(self, config=None, serving=False):
+        # serving: created by a server entry point, which calls initialize once and prepare_worker in each worker
         if not config:
             self.config = ConfigParser()
             self.config.read(str(Path(Path(__file__).parent.parent, 'config', 'app.config')))
         else:
             self.config = config
 
-        self.app = Flask(__name__)
+        self.app = create_template_app(self.config)
         self.app.secret_key = os.urandom(24)
 
-        self.user_interface = add_flask_security_to_app(self.app, self.config)
+        metrics = self.config.getboolean('Metrics', 'enabled', fallback=False)
+        if metrics:
+            register_command_counter()  # before any mongo client is created
 
-        self.mett_store = MettStore(config=self.config)
+        self._initialization_deferred = serving and self.config.getboolean('Startup', 'defer_initialization', fallback=False)
+        self.user_interface = add_flask_security_to_app(self.app, self.config, initialize=not self._initialization_deferred)
+
+        self.mett_store = MettStore(config=self.config, initialize=not self._initialization_deferred)
+
+        if metrics:
+            instrument_store(self.mett_store, 'mett_store')
+            instrument_store(self.user_interface, 'user_store')
+            MetricsRoutes(self.app, self.config)
+        elif self.config.getboolean('SlowQueries', 'enabled', fallback=False):  # slow query log needs the current store call
+            track_store_calls(self.mett_store, 'mett_store')
+            track_store_calls(self.user_interface, 'user_store')
 
         OrderRoutes(self.app, self.config, self.mett_store)
         DashboardRoutes(self.app, self.config, self.mett_store)
         AdminRoutes(self.app, self.config, self.mett_store)
         ProfileRoutes(self.app, self.config, self.user_interface)
         UserRoutes(self.app, self.config, self.mett_store, self.user_interface)
-        Filter(self.app, self.config)
 
         if self.config.getboolean('Runtime', 'behind_proxy'):
             self.app.wsgi_app = ReverseProxied(self.app.wsgi_app, script_name='/{}'.format(self.config.get('Runtime', 'proxy_suffix').strip()))
+
+    def reconnect(self):
+        # new connection pools in forked worker processes, sockets and monitor threads of the parent must not be shared
+        reset_clients()
+        self.mett_store.reconnect()
+        self.user_interface.reconnect()
+
+    def initialize(self):
+        # create indexes and default data if deferred, once before workers are forked (uwsgi master, see app.app)
+        if self._initialization_deferred:
+            self.mett_store.initialize()
+            self.user_interface.initialize()
+            self._initialization_deferred = False
+
+    def prepare_worker(self):
+        # called in each worker before it serves requests (uwsgi postfork hook, ASGI lifespan startup, or right away)
+        # no database setup here, postfork runs on every fork and respawn
+        if self.config.getboolean('Startup', 'prewarm', fallback=False):
+            self.prewarm()
+
+    def prewarm(self):
+        # load bun catalog into the read cache and compile all templates, so the first requests do not pay for it
+        self.mett_store.list_bun_classes_with_price()
+        _, errors = compile_templates(self.app)
+        for template, error in errors:
+            logging.warning('Could not compile template %s: %s', template, error)
@@ -0,0 +1,187 @@
+'''
+ASGI entry point, run with an ASGI server, e.g. uvicorn --factory --workers 5 app.asgi:create_asgi_app
+
+GET / and GET /order are served by coroutines querying the database concurrently through AsyncStore.
+All other requests, and hot requests the coroutines cannot answer (e.g. login redirects), are passed to the WSGI app
+on the same bounded thread pool. Flask contexts are only ever used inside a single executor job, because they are
+thread local and must not be held across awaits.
+'''
+import asyncio
+import io
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from flask_security import current_user
+
+from app.app_setup import AppSetup, ReverseProxied
+from app.dashboard import render_dashboard
+from app.metrics import observe_request
+from app.orders import render_order_page
+from database.async_store import AsyncStore
+from database.mett_store import StorageException
+
+
+class AsgiApp:
+    def __init__(self, app_setup: AppSetup):
+        self._app_setup = app_setup
+        self._flask = app_setup.app
+        self._config = app_setup.config
+        self._executor = ThreadPoolExecutor(max_workers=self._config.getint('Async', 'executor_workers', fallback=32), thread_name_prefix='asgi')
+
+        self.mett_store = AsyncStore(app_setup.mett_store, self._executor)
+        self.user_store = AsyncStore(app_setup.user_interface, self._executor)
+
+        self._routes = {'/': ('', self._dashboard), '/order': ('order', self._order_page)}  # path: (flask endpoint, handler)
+        self._metrics = 'metrics' in self._flask.view_functions
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self._run(self._app_setup.initialize)  # ASGI servers have no hook before fork, tables are set up race free
+                await self._run(self._app_setup.prepare_worker)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self._executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        environ = build_environ(scope, await _read_body(receive))
+        if isinstance(self._flask.wsgi_app, ReverseProxied):
+            self._flask.wsgi_app.rewrite(environ)
+
+        response = None
+        endpoint, handler = self._routes.get(environ['PATH_INFO'], (None, None)) if environ['REQUEST_METHOD'] == 'GET' else (None, None)
+        if handler:
+            started = perf_counter()
+            response = await self._try_handler(handler, environ)
+            if response is not None and self._metrics:  # rendered outside the flask request cycle, not seen by MetricsRoutes
+                observe_request(endpoint, 'GET', response[0], perf_counter() - started)
+        if response is None:
+            response = await self._run(_call_wsgi, self._flask.wsgi_app, environ)
+
+        status, headers, body = response
+        await send({'type': 'http.response.start', 'status': status, 'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _try_handler(self, handler, environ):
+        try:
+            return await handler(environ)
+        except StorageException as error:  # e.g. order processed meanwhile, the WSGI app shows the regular result
+            logging.debug('Passing %s to WSGI app: %s', environ['PATH_INFO'], error)
+            return None
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    # -------------- hot routes --------------
+
+    async def _dashboard(self, environ):
+        user = await self._run(self._authenticated_user, environ)
+        if user is None:
+            return None
+        information, order, (order_history, mean_buns) = await asyncio.gather(
+            self.mett_store.get_account_information(user), self._current_user_buns(user), self.mett_store.get_order_history(user)
+        )
+        return await self._run(self._render, environ, render_dashboard, user, information['balance'], order, order_history, mean_buns)
+
+    async def _current_user_buns(self, user):
+        try:
+            return await self.mett_store.get_current_user_buns(user)
+        except StorageException:
+            return None
+
+    async def _order_page(self, environ):
+        user, order_exists = await asyncio.gather(self._run(self._authenticated_user, environ), self.mett_store.active_order_exists())
+        if user is None:
+            return None
+        if order_exists:
+            expired, buns, mett, bun_classes = await asyncio.gather(
+                self.mett_store.current_order_is_expired(), self.mett_store.get_current_bun_order(),
+                self.mett_store.get_current_mett_order(), self.mett_store.list_bun_classes_with_price()
+            )
+        else:
+            expired, buns, mett, bun_classes = True, None, None, await self.mett_store.list_bun_classes_with_price()
+        return await self._run(self._render, environ, render_order_page, not expired, bun_classes, buns, mett, order_exists)
+
+    # -------------- executor jobs --------------
+
+    def _authenticated_user(self, environ):
+        # name of user allowed to see user pages, None leaves the request to the WSGI app (login redirect, forbidden)
+        with self._flask.request_context(environ):
+            if not self._config.getboolean('Runtime', 'testing'):
+                if not current_user.is_authenticated or not (current_user.has_role('user') or current_user.has_role('admin')):
+                    return None
+            return current_user.name
+
+    def _render(self, environ, render, *args):
+        with self._flask.request_context(environ):
+            response = self._flask.process_response(self._flask.make_response(render(*args)))
+            return response.status_code, list(response.headers.items()), response.get_data()
+
+
+def build_environ(scope, body: bytes) -> dict:
+    # WSGI environ for ASGI http scope, see PEP 3333
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope.get('http_version', '1.1')),
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name, value = name.decode('latin-1').upper().replace('-', '_'), value.decode('latin-1')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else 'HTTP_{}'.format(name)
+        environ[key] = '{},{}'.format(environ[key], value) if key in environ else value
+    environ.setdefault('CONTENT_LENGTH', str(len(body)))  # body is read completely, also for chunked requests
+    return environ
+
+
+async def _read_body(receive) -> bytes:
+    chunks, more_body = [], True
+    while more_body:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        more_body = message.get('more_body', False)
+    return b''.join(chunks)
+
+
+def _call_wsgi(wsgi_app, environ):
+    response = {}
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):  # pylint: disable=unused-argument
+        response['status'], response['headers'] = int(status.split(' ', 1)[0]), headers
+        return chunks.append
+
+    result = wsgi_app(environ, start_response)
+    try:
+        chunks.extend(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], b''.join(chunks)
+
+
+def create_asgi_app(app_setup=None):
+    return AsgiApp(app_setup or AppSetup(serving=True))
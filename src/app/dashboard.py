@@ -20,11 +20,15 @@ class DashboardRoutes:
     def _show_home_dashboard(self):
         user = current_user.name
         information = self._mett_store.get_account_information(user)
-        order_exists, order = True, {}
         try:
             order = self._mett_store.get_current_user_buns(user)
         except StorageException:
-            order_exists = False
+            order = None
 
         order_history, mean_buns = self._mett_store.get_order_history(user)
-        return render_template('dashboard.html', order_exists=order_exists, username=user, order=order, balance=information['balance'], history=order_history, mean_buns=mean_buns)
+        return render_dashboard(user, information['balance'], order, order_history, mean_buns)
+
+
+def render_dashboard(user, balance, order, order_history, mean_buns):
+    # order is None if there is no current order
+    return render_template('dashboard.html', order_exists=order is not None, username=user, order=order or {}, balance=balance, history=order_history, mean_buns=mean_buns)
@@ -0,0 +1,151 @@
+'''
+Prometheus metrics for routes, store calls and mongo commands, exposed at /metrics in the text exposition format.
+
+With uwsgi, set PROMETHEUS_MULTIPROC_DIR to a directory writable by all workers (see config/proxy.config). Each worker
+then writes its samples to memory mapped files in that directory, and /metrics sums them up, no matter which worker
+answers the scrape. Without it, /metrics only shows the answering process. The directory is created on import, and
+files of processes no longer running (e.g. of an earlier start) are removed, so samples of old runs are not summed up.
+'''
+import os
+from functools import wraps
+from pathlib import Path
+from time import perf_counter
+
+from flask import Response, g, request
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.multiprocess import MultiProcessCollector
+from pymongo import monitoring
+
+from database.store_calls import current_store_call, enter_store_call, exit_store_call, public_methods
+
+
+def prepare_multiprocess_directory():
+    # create PROMETHEUS_MULTIPROC_DIR and remove sample files of dead processes, must run before any metric is touched
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR', os.environ.get('prometheus_multiproc_dir'))
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    for sample_file in Path(directory).glob('*.db'):
+        pid = sample_file.stem.rsplit('_', 1)[-1]  # e.g. histogram_1234.db, gauge_livesum_1234.db
+        if pid.isdigit() and not _process_running(int(pid)):
+            try:
+                sample_file.unlink()
+            except OSError:  # removed by another process meanwhile
+                pass
+
+
+def _process_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # running as another user
+        pass
+    return True
+
+
+prepare_multiprocess_directory()
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_SECONDS = Histogram('mett_request_seconds', 'Latency of requests by route', ['endpoint', 'method', 'status'], buckets=LATENCY_BUCKETS)
+STORE_CALL_SECONDS = Histogram('mett_store_call_seconds', 'Latency of public store methods', ['store', 'method'], buckets=LATENCY_BUCKETS)
+STORE_CALL_ERRORS = Counter('mett_store_call_errors', 'Store method calls raising an exception', ['store', 'method'])
+MONGO_COMMANDS = Counter('mett_mongo_commands', 'Mongo round trips by store method calling', ['store', 'method', 'command'])
+
+_listener_registered = False
+
+
+class MetricsRoutes:
+    def __init__(self, app, config):
+        self._app = app
+        self._config = config
+
+        self._app.before_request(_start_request_timer)
+        self._app.after_request(_observe_response)
+        self._app.teardown_request(_observe_failed_request)
+
+        self._app.add_url_rule('/metrics', 'metrics', self._show_metrics, methods=['GET'])
+
+    @staticmethod
+    def _show_metrics():
+        return Response(generate_latest(_get_registry()), mimetype=CONTENT_TYPE_LATEST)
+
+
+def _get_registry():
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ and 'prometheus_multiproc_dir' not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry)
+    return registry
+
+
+def _start_request_timer():
+    g.metrics_started = perf_counter()
+
+
+def _observe_response(response):
+    started = g.pop('metrics_started', None)
+    if started is not None:  # not set for responses rendered outside the request cycle, e.g. hot routes in app.asgi
+        observe_request(request.endpoint, request.method, response.status_code, perf_counter() - started)
+    return response
+
+
+def _observe_failed_request(error):
+    started = g.pop('metrics_started', None)  # still set if the view raised, after_request is skipped then
+    if error is not None and started is not None:
+        observe_request(request.endpoint, request.method, 500, perf_counter() - started)
+
+
+def observe_request(endpoint, method, status, seconds):
+    REQUEST_SECONDS.labels('unknown' if endpoint is None else endpoint, method, str(status)).observe(seconds)
+
+
+def instrument_store(store, store_name):
+    # replace public methods of store instance by timed versions, which also track the current store call
+    for name in public_methods(store):
+        setattr(store, name, _timed_method(store_name, name, getattr(store, name)))
+    return store
+
+
+def _timed_method(store_name, name, method):
+    histogram = STORE_CALL_SECONDS.labels(store_name, name)  # labels resolved once, not on every call
+    errors = STORE_CALL_ERRORS.labels(store_name, name)
+    call = (store_name, name)
+
+    @wraps(method)
+    def timed(*args, **kwargs):
+        outer_call = enter_store_call(call)
+        started = perf_counter()
+        try:
+            return method(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            histogram.observe(perf_counter() - started)
+            exit_store_call(outer_call)
+
+    return timed
+
+
+class CommandCounter(monitoring.CommandListener):
+    # counts every command sent to mongo, attributed to the store method running on the calling thread
+
+    def started(self, event):
+        store, method = current_store_call()
+        MONGO_COMMANDS.labels(store, method, event.command_name).inc()
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def register_command_counter():
+    # global pymongo listener, only applies to clients created afterwards
+    global _listener_registered  # pylint: disable=global-statement
+    if not _listener_registered:
+        monitoring.register(CommandCounter())
+        _listener_registered = True
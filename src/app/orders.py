@@ -1,7 +1,9 @@
+from bson.errors import InvalidId
 from flask import flash, render_template, request, url_for, redirect
 from flask_security import current_user
 
 from app.security.decorator import roles_accepted
+from database.mett_store import StorageException
 
 # pylint: disable=redefined-outer-name
 
@@ -22,15 +24,15 @@ class OrderRoutes:
             mett_order = _get_order_from_request(request)
 
             try:
-                for _ in range(int(mett_order['amount'])):
-                    self._mett_store.order_bun(current_user.name, mett_order['bun_class'])
+                self._mett_store.order_buns(current_user.name, mett_order['bun_class'], int(mett_order['amount']))
             except ValueError:
                 flash('Please state amount of buns')
+            except StorageException as error:
+                flash(str(error), 'warning')
 
             return redirect(url_for(''))
 
-        allowed_to_order, bun_classes, buns, mett, order_exists = self._prepare_data_for_order_page()
-        return render_template('order.html', allowed_to_order=allowed_to_order, bun_classes=bun_classes, order_exists=order_exists, buns=buns, mett=mett)
+        return render_order_page(*self._prepare_data_for_order_page())
 
     @roles_accepted('user', 'admin')
     def _state_purpose(self):
@@ -45,13 +47,18 @@ class OrderRoutes:
 
     @roles_accepted('user', 'admin')
     def _show_previous_orders(self):
-        all_information = self._mett_store.get_all_order_information()
-
-        for order in all_information:
+        page_size = self._config.getint('Mett', 'previous_orders_page_size', fallback=20)
+        try:
+            orders, next_page = self._mett_store.get_order_page(before=request.args.get('before'), page_size=page_size)
+        except InvalidId:
+            flash('Invalid page requested', 'warning')
+            orders, next_page = self._mett_store.get_order_page(page_size=page_size)
+
+        for order in orders:
             order['_id'] = str(order['_id'])
             order['orders'] = rearrange_ordered_buns(order['orders'])
 
-        return render_template('order/previous.html', orders=all_information)
+        return render_template('order/previous.html', orders=orders, next_page=next_page)
 
     def _prepare_data_for_order_page(self):
         order_exists = self._mett_store.active_order_exists()
@@ -65,11 +72,15 @@ class OrderRoutes:
         return allowed_to_order, bun_classes, buns, mett, order_exists
 
 
+def render_order_page(allowed_to_order, bun_classes, buns, mett, order_exists):
+    return render_template('order.html', allowed_to_order=allowed_to_order, bun_classes=bun_classes, order_exists=order_exists, buns=buns, mett=mett)
+
+
 def rearrange_ordered_buns(orders):
-    return {
-        user: [bun for name, bun in orders if name == user]
-        for user in {name for name, _ in orders}
-    }
+    ordered_buns = {}
+    for name, bun in orders:
+        ordered_buns.setdefault(name, []).append(bun)
+    return ordered_buns
 
 
 def _get_order_from_request(request):
@@ -2,6 +2,7 @@ from flask import render_template, request, flash
 from flask_security import current_user
 
 from app.security.decorator import roles_accepted
+from database.mett_store import StorageException
 from database.user_store import password_is_legal
 
 
@@ -19,7 +20,10 @@ class ProfileRoutes:
     @roles_accepted('user', 'admin')
     def _show_profile(self):
         if request.method == 'POST':
-            self._change_own_password()
+            try:
+                self._change_own_password()
+            except StorageException as error:
+                flash(str(error), 'warning')
 
         return render_template('profile/profile.html', user=current_user.name, roles=[role.name for role in current_user.roles])
 
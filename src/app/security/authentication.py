@@ -1,19 +1,36 @@
+from flask import copy_current_request_context, current_app
 from flask_security import Security
+from flask_security.forms import LoginForm
 
+from database.hashing import HashingError
 from database.user_store import UserRoleDatabase
 
 
-def add_flask_security_to_app(app, config):
+class PooledLoginForm(LoginForm):
+    # login form validated in the hashing pool of the user database instead of on the request thread
+    # validation itself is flask-security's, including confirmation and active checks and rehashing deprecated hashes
+
+    def validate(self, **kwargs):  # pylint: disable=arguments-differ,unused-argument
+        # kwargs (extra_validators of newer Flask-WTF) are not passed on, LoginForm.validate of flask-security 3.0 takes none
+        user_interface = current_app.extensions['security'].datastore
+        try:
+            return user_interface.hashing_pool.run(copy_current_request_context(super().validate))
+        except HashingError as error:
+            self.password.errors = [str(error)]  # form was not validated, errors are still the empty default tuple
+            return False
+
+
+def add_flask_security_to_app(app, config, initialize=True):
     _add_configuration_to_app(app, config)
 
-    user_interface = create_user_interface(config)
-    _ = Security(app, user_interface)
+    user_interface = create_user_interface(config, initialize=initialize)
+    _ = Security(app, user_interface, login_form=PooledLoginForm)
 
     return user_interface
 
 
-def create_user_interface(config):
-    return UserRoleDatabase(config)
+def create_user_interface(config, initialize=True):
+    return UserRoleDatabase(config, initialize=initialize)
 
 
 def _add_configuration_to_app(app, config):
@@ -0,0 +1,52 @@
+import logging
+import os
+import tempfile
+
+from jinja2 import FileSystemBytecodeCache, TemplateSyntaxError
+
+
+class AtomicBytecodeCache(FileSystemBytecodeCache):
+    # bytecode cache directory shared by all workers, files are written to a temporary file and renamed,
+    # so no worker ever reads a partly written file (jinja 2 writes them in place)
+
+    def dump_bytecode(self, bucket):
+        filename = self._get_cache_filename(bucket)
+        try:
+            file_descriptor, temporary_path = tempfile.mkstemp(prefix='.{}.'.format(os.path.basename(filename)), dir=self.directory)
+        except OSError as error:
+            logging.warning('Could not write template bytecode: %s', error)
+            return
+        try:
+            with os.fdopen(file_descriptor, 'wb') as bytecode_file:
+                bucket.write_bytecode(bytecode_file)
+            os.replace(temporary_path, filename)
+        except OSError as error:
+            logging.warning('Could not write template bytecode: %s', error)
+            if os.path.exists(temporary_path):
+                os.unlink(temporary_path)
+
+
+def add_bytecode_cache(app, config):
+    # compiled templates are stored in [Templates] bytecode_cache and reused by all workers and after respawns
+    directory = config.get('Templates', 'bytecode_cache', fallback='').strip()
+    if not directory:
+        return
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError as error:
+        logging.warning('Template bytecode cache disabled: %s', error)
+        return
+    app.jinja_env.bytecode_cache = AtomicBytecodeCache(directory)
+
+
+def compile_templates(app):
+    # compile all templates of app, which also stores them in the bytecode cache
+    # returns (number of templates, list of (template, TemplateSyntaxError) for templates failing to compile)
+    templates = app.jinja_env.list_templates()
+    errors = []
+    for template in templates:
+        try:
+            app.jinja_env.get_template(template)
+        except TemplateSyntaxError as error:
+            errors.append((template, error))
+    return len(templates), errors
@@ -3,7 +3,6 @@ from contextlib import contextmanager
 
 from flask import render_template, request, flash, redirect, url_for
 from flask_security import current_user
-from sqlalchemy.exc import SQLAlchemyError
 
 from app.security.decorator import roles_accepted
 from database.mett_store import StorageException
@@ -59,11 +58,15 @@ class UserRoutes:
         return redirect(url_for('user'))
 
     def _generate_user_information(self):
-        for user in self._user_interface.list_users():
+        users = self._user_interface.list_users()
+        balances = self._mett_store.get_balances(user['name'] for user in users)
+        for user in users:
+            if user['name'] not in balances:
+                raise StorageException('No existing account {}'.format(user['name']))
             information = {
                 'name': user['name'],
                 'roles': user['roles'],
-                'balance': self._mett_store.get_account_information(user['name'])['balance']
+                'balance': balances[user['name']]
             }
             yield information
 
@@ -107,6 +110,8 @@ class UserRoutes:
 
 @contextmanager
 def user_db_session(database):
+    # sqlalchemy is slow to import and only needed here
+    from sqlalchemy.exc import SQLAlchemyError  # pylint: disable=import-outside-toplevel
     session = database.session
     try:
         yield session
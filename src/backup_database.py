@@ -1,15 +1,20 @@
+import argparse
 import json
 import sys
 from collections import namedtuple
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 from bson import ObjectId
 
 from app.app_setup import AppSetup
-from database.mett_store import MettStore
+from database.backup_stream import COMPRESSIONS, ENCODINGS, BackupWriter, batched_cursor, read_header
+from database.mett_store import MettStore, StorageException
 
 User = namedtuple('User', ['email', 'password', 'roles'])
 
+JOURNAL_OVERLAP = timedelta(seconds=30)
+
 
 def filter_roles(user, roles):
     return [
@@ -62,10 +67,109 @@ def backup(app, user_store, mett_store: MettStore):
     Path('mett.backup.json').write_text(backup_json)
 
 
-def start_backup(app_setup):
-    backup(app_setup.app, app_setup.user_interface, app_setup.mett_store)
+def _stream_sections(user_store, mett_store: MettStore):
+    # pylint: disable=protected-access
+    return [
+        ('auth.role', user_store._role, {'_id': 0, 'name': 1}),
+        ('auth.user', user_store._user, {'_id': 0, 'name': 1, 'password': 1, 'roles': 1}),
+        ('mett.account', mett_store._account, None),
+        ('mett.bun', mett_store._buns, None),  # before orders, so restore can resolve legacy ids in one pass
+        ('mett.order', mett_store._order, None),
+        ('mett.purchases', mett_store._purchase, None),
+        ('mett.deposit', mett_store._deposit, None),
+        ('mett.charge', mett_store._charge, None),
+    ]
+
+
+def _checkpoint():
+    # journal entries are stamped by the clocks of all app servers, so the checkpoint reaches back a little and increments overlap
+    return ObjectId.from_datetime(datetime.now(timezone.utc) - JOURNAL_OVERLAP)
+
+
+def _retention_start(retention_days):
+    # oldest journal id increments can still be based on
+    return ObjectId.from_datetime(datetime.now(timezone.utc) - timedelta(days=retention_days))
+
+
+def stream_backup(user_store, mett_store: MettStore, path, compression='none', batch_size=1000, encoding='ndjson', retention_days=14):
+    header = {'type': 'full', 'id': ObjectId(), 'checkpoint': _checkpoint()}
+    with BackupWriter(path, compression=compression, header=header, encoding=encoding) as writer:
+        for name, collection, projection in _stream_sections(user_store, mett_store):
+            count = writer.write_section(name, batched_cursor(collection, batch_size, projection))
+            print('[Backup] {}: {} documents'.format(name, count))
+    if mett_store.journal_enabled():  # also when only full backups are taken, the journal would grow without bound otherwise
+        mett_store.prune_journal(_retention_start(retention_days))
+
+
+def incremental_backup(user_store, mett_store: MettStore, path, since, compression='none', retention_days=14, encoding='ndjson'):
+    '''
+    Write documents changed since checkpoint of backup since (full or increment) as section changes, each entry being
+    {'section': backup section, 'key': query, 'documents': all documents currently matching query}.
+    Users and roles are small and always written completely.
+    '''
+    if not mett_store.journal_enabled():
+        raise StorageException('Incremental backups need the change journal ([Backup] journal = true)')
+    parent = read_header(since)
+    base = parent.get('checkpoint')
+    if base is None:
+        raise StorageException('{} has no checkpoint. Please create a full streamed backup first'.format(since))
+    retention_start = _retention_start(retention_days)
+    if base < retention_start:
+        raise StorageException('Journal has been pruned since {}. Please create a full streamed backup'.format(since))
+
+    header = {'type': 'increment', 'id': ObjectId(), 'parent': parent['id'], 'base': base, 'checkpoint': _checkpoint()}
+    sections = {name: collection for name, collection, _ in _stream_sections(user_store, mett_store)}
+    with BackupWriter(path, compression=compression, header=header, encoding=encoding) as writer:
+        for name, collection, projection in _stream_sections(user_store, mett_store)[:2]:
+            writer.write_section(name, collection.find({}, projection))
+        count = writer.write_section('changes', (
+            {'section': section, 'key': key, 'documents': list(sections[section].find(key))}
+            for section, key in mett_store.changed_since(base)
+        ))
+    print('[Backup] {} changes since {}'.format(count, base.generation_time))
+    mett_store.prune_journal(retention_start)
+
+
+def default_backup_path(stream, compression, incremental=False, encoding='ndjson'):
+    if not stream:
+        return 'mett.backup.json'
+    suffix = '{}{}'.format(encoding, {'none': '', 'gzip': '.gz', 'zstd': '.zst'}[compression])
+    if incremental:
+        return 'mett.increment.{}.{}'.format(datetime.now().strftime('%Y%m%d%H%M%S'), suffix)
+    return 'mett.backup.{}'.format(suffix)
+
+
+def start_backup(app_setup, stream=False, compression='none', output=None, batch_size=1000, since=None, encoding='ndjson'):
+    retention_days = app_setup.config.getint('Backup', 'journal_retention_days', fallback=14)
+    if since:
+        path = output or default_backup_path(True, compression, incremental=True, encoding=encoding)
+        try:
+            incremental_backup(app_setup.user_interface, app_setup.mett_store, path, since, compression, retention_days, encoding)
+        except StorageException as exception:
+            print('[Error] {}'.format(exception))
+            return 1
+    elif stream:
+        path = output or default_backup_path(stream, compression, encoding=encoding)
+        stream_backup(app_setup.user_interface, app_setup.mett_store, path, compression, batch_size, encoding, retention_days)
+    else:
+        backup(app_setup.app, app_setup.user_interface, app_setup.mett_store)
     return 0
 
 
+def _parse_arguments():
+    parser = argparse.ArgumentParser(description='Backup mett and user database')
+    parser.add_argument('--stream', action='store_true', help='write collections incrementally as extended JSON lines (constant memory)')
+    parser.add_argument('--since', help='write only changes since the given streamed backup (full or increment)')
+    parser.add_argument('--format', choices=ENCODINGS, default='ndjson', help='encoding of streamed backup, bson is faster, ndjson human readable')
+    parser.add_argument('--compression', choices=COMPRESSIONS, default='none', help='compression of streamed backup')
+    parser.add_argument('--output', help='path of streamed backup')
+    parser.add_argument('--batch-size', type=int, default=1000, help='documents fetched per database round trip')
+    return parser.parse_args()
+
+
 if __name__ == '__main__':
-    sys.exit(start_backup(AppSetup()))
+    ARGS = _parse_arguments()
+    sys.exit(start_backup(
+        AppSetup(), stream=ARGS.stream or ARGS.format == 'bson', compression=ARGS.compression, output=ARGS.output,
+        batch_size=ARGS.batch_size, since=ARGS.since, encoding=ARGS.format
+    ))
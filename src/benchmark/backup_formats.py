@@ -0,0 +1,56 @@
+'''
+Compare write and read time and file size of the streamed backup encodings and compressions.
+Run from src folder: python3 -m benchmark.backup_formats [--users N] [--years M] [--mock]
+'''
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+from benchmark.data import benchmark_config, create_benchmark_store, generate_data
+from database.backup_stream import ENCODINGS, BackupWriter, batched_cursor, read_documents, zstandard
+
+
+def _sections(mett_store):
+    # pylint: disable=protected-access
+    return [
+        ('mett.account', mett_store._account), ('mett.bun', mett_store._buns), ('mett.order', mett_store._order),
+        ('mett.purchases', mett_store._purchase), ('mett.deposit', mett_store._deposit),
+    ]
+
+
+def run(mett_store, directory):
+    compressions = ['none', 'gzip'] + (['zstd'] if zstandard else [])
+    results = []
+    for encoding in ENCODINGS:
+        for compression in compressions:
+            path = Path(directory, 'backup.{}.{}'.format(encoding, compression))
+            started = perf_counter()
+            with BackupWriter(path, compression=compression, encoding=encoding) as writer:
+                for name, collection in _sections(mett_store):
+                    writer.write_section(name, batched_cursor(collection))
+            written = perf_counter()
+            documents = sum(1 for _ in read_documents(path))
+            results.append(('{} ({})'.format(encoding, compression), written - started, perf_counter() - written, path.stat().st_size, documents))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark streamed backup formats')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--mock', action='store_true', help='use mongomock instead of configured mongo server')
+    args = parser.parse_args()
+
+    mett_store = create_benchmark_store(benchmark_config(), mock=args.mock)
+    generate_data(mett_store, users=args.users, years=args.years)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, write_seconds, read_seconds, size, documents in run(mett_store, directory):
+            print('{:<20}write {:>8.2f} ms   read {:>8.2f} ms   {:>10} bytes   {} documents'.format(name, write_seconds * 1000, read_seconds * 1000, size, documents))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
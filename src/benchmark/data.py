@@ -0,0 +1,107 @@
+'''
+Deterministic synthetic data for benchmarks: accounts, weekly orders over several years, deposits and purchases.
+'''
+import datetime
+from configparser import ConfigParser
+from pathlib import Path
+from random import Random
+
+from database import client as client_module
+from database.client import reset_clients
+from database.mett_store import MettStore
+
+START_TIME = 1514764800.0  # 2018-01-01
+WEEK = 7 * 24 * 60 * 60
+
+
+def benchmark_config(database='mett_benchmark'):
+    config = ConfigParser()
+    config.read(str(Path(Path(__file__).parent.parent, 'config', 'app.config')))
+    config.set('Database', 'main_database', database)
+    return config
+
+
+def use_mongomock():
+    # all stores share the client created by database.client, a fresh mongomock client starts empty
+    from mongomock import MongoClient  # pylint: disable=import-error
+    client_module.MongoClient = MongoClient
+    reset_clients()
+
+
+def create_benchmark_store(config, mock=False):
+    # create store on empty benchmark database, use mongomock instead of a mongo server if mock is set
+    if mock:
+        use_mongomock()
+    store = MettStore(config=config)
+    store._client.drop_database(config.get('Database', 'main_database'))  # pylint: disable=protected-access
+    return MettStore(config=config)
+
+
+class BenchmarkUser:
+    is_authenticated = True
+    roles = []
+
+    def __init__(self, name):
+        self.name = name
+
+
+def create_benchmark_app(config, mock=False, users=50, years=3, seed=0):
+    # AppSetup on freshly generated benchmark data with authentication disabled and requests made as first user
+    # returns (app_setup, account names)
+    # pylint: disable=import-outside-toplevel
+    from app import admin, asgi, dashboard, orders, profile, user
+    from app.app_setup import AppSetup
+
+    config.set('Runtime', 'testing', 'true')
+    config.set('Runtime', 'behind_proxy', 'false')
+    if mock:
+        use_mongomock()
+    names = generate_data(create_benchmark_store(config), users=users, years=years, seed=seed)
+
+    app_setup = AppSetup(config)
+    app_setup.user_interface.create_role('user')
+    with app_setup.app.app_context():
+        for name in names:
+            app_setup.user_interface.create_user(name, '$2b$12$benchmark', roles=['user'], is_hashed=True)
+    for module in (admin, asgi, dashboard, orders, profile, user):
+        module.current_user = BenchmarkUser(names[0])
+    return app_setup, names
+
+
+def generate_data(mett_store: MettStore, users=50, years=3, seed=0):
+    # pylint: disable=protected-access
+    random = Random(seed)
+    names = ['user_{:04}'.format(index) for index in range(users)]
+    prices = mett_store.list_bun_classes_with_price()
+    bun_classes = sorted(prices)
+    balances = {name: 0.0 for name in names}
+
+    orders, deposits, purchases = [], [], []
+    for week in range(years * 52):
+        timestamp = START_TIME + week * WEEK
+        order = []
+        for name in random.sample(names, random.randint(users // 4, users // 2 + 1)):
+            for _ in range(random.randint(1, 3)):
+                bun_class = random.choice(bun_classes)
+                order.append((name, bun_class))
+                balances[name] -= prices[bun_class]
+        expiry_date = datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d')
+        orders.append({'expiry_date': expiry_date, 'processed': True, 'orders': order})
+
+        if week % 4 == 0:
+            for name in names:
+                amount = float(random.choice([5, 10, 20]))
+                balances[name] += amount
+                deposits.append({'admin': names[0], 'user': name, 'amount': amount, 'timestamp': timestamp})
+
+        name, price = random.choice(names), round(random.uniform(5, 40), 2)
+        authorized = random.random() < 0.9
+        balances[name] += price if authorized else 0.0
+        purchases.append({'account': name, 'price': price, 'purpose': 'mett', 'timestamp': timestamp, 'processed': {'authorized': authorized, 'at': timestamp + 3600, 'by': names[0]}})
+
+    mett_store._account.insert_many([{'name': name, 'balance': balance} for name, balance in balances.items()])
+    mett_store._order.insert_many(orders)
+    mett_store._deposit.insert_many(deposits)
+    mett_store._purchase.insert_many(purchases)
+    mett_store.rebuild_order_history()
+    return names
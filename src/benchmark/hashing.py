@@ -0,0 +1,50 @@
+'''
+Measure login throughput (password verifications per second) for several bcrypt costs,
+verifying on the calling threads versus in the bounded hashing pool.
+Run from src folder: python3 -m benchmark.hashing [--costs 4 8 10 12] [--threads 10] [--logins 40]
+'''
+import argparse
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from passlib.hash import bcrypt
+
+from database.hashing import HashingError, HashingPool
+
+
+def _throughput(verify, stored_password, threads, logins):
+    errors = 0
+    started = perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [executor.submit(verify, 'password', stored_password) for _ in range(logins)]
+        for future in futures:
+            try:
+                future.result()
+            except HashingError:
+                errors += 1
+    return (logins - errors) / (perf_counter() - started), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark login throughput at different bcrypt costs')
+    parser.add_argument('--costs', type=int, nargs='+', default=[4, 8, 10, 12])
+    parser.add_argument('--threads', type=int, default=10, help='concurrent request threads (uwsgi workers x threads)')
+    parser.add_argument('--logins', type=int, default=40)
+    parser.add_argument('--workers', type=int, default=2, help='hashing pool workers')
+    parser.add_argument('--queue', type=int, default=8, help='hashing pool queue size')
+    args = parser.parse_args()
+
+    print('{:>5}{:>20}{:>20}{:>12}'.format('cost', 'inline logins/s', 'pooled logins/s', 'rejected'))
+    for cost in args.costs:
+        stored_password = bcrypt.using(rounds=cost).hash('password')
+        pool = HashingPool(workers=args.workers, queue_size=args.queue, timeout=60.0)
+        inline, _ = _throughput(bcrypt.verify, stored_password, args.threads, args.logins)
+        pooled, rejected = _throughput(lambda *verify_args: pool.run(bcrypt.verify, *verify_args), stored_password, args.threads, args.logins)
+        pool.shutdown()
+        print('{:>5}{:>20.1f}{:>20.1f}{:>12}'.format(cost, inline, pooled, rejected))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+'''
+Compare concurrent request capacity of the WSGI app (requests limited to uwsgi workers * threads) and the ASGI app
+(hot routes awaiting queries concurrently on the executor) for GET / and GET /order.
+Database round trips are simulated by adding --latency milliseconds to every collection call.
+Both apps run in this process on the same machine, user authentication is disabled.
+Run from src folder: python3 -m benchmark.serving [--clients N] [--requests M] [--latency MS] [--mock]
+'''
+import argparse
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from statistics import quantiles
+from time import perf_counter, sleep
+
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+from benchmark.data import benchmark_config, create_benchmark_app
+
+COLLECTIONS = ['_account', '_order', '_buns', '_purchase', '_deposit', '_order_count', '_history', '_version']
+
+
+class _SlowCollection:
+    # adds latency to every method call, like a round trip to a remote mongo server
+    def __init__(self, collection, latency):
+        self._collection = collection
+        self._latency = latency
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if not callable(attribute):
+            return attribute
+
+        @wraps(attribute)
+        def call(*args, **kwargs):
+            sleep(self._latency)
+            return attribute(*args, **kwargs)
+        return call
+
+
+def create_app_setup(mock, latency, cache=False):
+    config = benchmark_config()
+    if not cache:
+        config.set('Cache', 'size', '0')
+    app_setup, names = create_benchmark_app(config, mock=mock, users=50, years=1)
+    app_setup.mett_store.create_order('2099-01-01')
+    app_setup.mett_store.order_buns(names[0], 'Weizen', 2)
+    for collection in COLLECTIONS:
+        setattr(app_setup.mett_store, collection, _SlowCollection(getattr(app_setup.mett_store, collection), latency))
+    return app_setup
+
+
+def _summary(latencies, seconds):
+    return len(latencies) / seconds, quantiles(latencies, n=20)[-1] * 1000
+
+
+def run_wsgi(app_setup, paths, threads):
+    def request(path):
+        started = perf_counter()
+        _, status, _ = run_wsgi_app(app_setup.app.wsgi_app, EnvironBuilder(path=path).get_environ(), buffered=True)
+        assert status.startswith('200'), status
+        return perf_counter() - started
+
+    started = perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies = list(executor.map(request, paths))
+    return _summary(latencies, perf_counter() - started)
+
+
+def run_asgi(asgi_app, paths, clients):
+    async def request(path, limit):
+        async with limit:
+            started = perf_counter()
+            sent = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                sent.append(message)
+
+            await asgi_app({'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'', 'headers': []}, receive, send)
+            assert sent[0]['status'] == 200, sent[0]['status']
+            return perf_counter() - started
+
+    async def run_all():
+        limit = asyncio.Semaphore(clients)
+        return await asyncio.gather(*[request(path, limit) for path in paths])
+
+    started = perf_counter()
+    latencies = asyncio.run(run_all())
+    return _summary(latencies, perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark concurrent request capacity of WSGI and ASGI serving')
+    parser.add_argument('--clients', type=int, default=50, help='concurrent clients')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=2.0, help='simulated database round trip in ms')
+    parser.add_argument('--wsgi-threads', type=int, default=10, help='uwsgi workers * threads')
+    parser.add_argument('--mock', action='store_true', help='use mongomock instead of configured mongo server')
+    args = parser.parse_args()
+
+    from app.asgi import AsgiApp  # pylint: disable=import-outside-toplevel
+    app_setup = create_app_setup(args.mock, args.latency / 1000)
+    paths = ['/', '/order'] * (args.requests // 2)
+
+    results = [
+        ('wsgi ({} threads)'.format(args.wsgi_threads), run_wsgi(app_setup, paths, args.wsgi_threads)),
+        ('asgi ({} clients)'.format(args.clients), run_asgi(AsgiApp(app_setup), paths, args.clients)),
+    ]
+    for name, (requests_per_second, p95) in results:
+        print('{:<25}{:>10.1f} requests/s   p95 {:>8.1f} ms'.format(name, requests_per_second, p95))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+'''
+Profile worker startup: import time breakdown of the app (python -X importtime in a fresh interpreter), followed by
+the time of AppSetup(), of the initialisation done once before workers are forked and of the prewarm of each worker.
+Run from src folder: python3 -m benchmark.startup [--top N] [--mock]
+'''
+import argparse
+import re
+import subprocess
+import sys
+from pathlib import Path
+from time import perf_counter
+
+from benchmark.data import benchmark_config, use_mongomock
+
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def import_profile(module='app.app_setup'):
+    # (module, self microseconds, cumulative microseconds, depth) of all modules imported by module, in import order
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+        cwd=str(Path(__file__).parent.parent), stderr=subprocess.PIPE, universal_newlines=True, check=True
+    )
+    profile = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            profile.append((match.group(4), int(match.group(1)), int(match.group(2)), (len(match.group(3)) - 1) // 2))
+    return profile
+
+
+def top_level_imports(profile, top=15):
+    # modules imported directly by the profiled module, most expensive first
+    return sorted((entry for entry in profile if entry[3] == 1), key=lambda entry: entry[2], reverse=True)[:top]
+
+
+def time_startup(config):
+    # seconds of (AppSetup, initialisation, prewarm)
+    from app.app_setup import AppSetup  # pylint: disable=import-outside-toplevel
+    config.set('Startup', 'defer_initialization', 'true')
+    config.set('Startup', 'prewarm', 'false')
+
+    started = perf_counter()
+    app_setup = AppSetup(config, serving=True)
+    setup_seconds = perf_counter() - started
+
+    started = perf_counter()
+    app_setup.initialize()
+    initialize_seconds = perf_counter() - started
+
+    started = perf_counter()
+    app_setup.prewarm()
+    return setup_seconds, initialize_seconds, perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profile imports and initialisation of a worker')
+    parser.add_argument('--top', type=int, default=15, help='number of imports to show')
+    parser.add_argument('--mock', action='store_true', help='use mongomock instead of configured mongo server')
+    args = parser.parse_args()
+
+    profile = import_profile()
+    print('[Imports] app.app_setup {:.1f} ms'.format(profile[-1][2] / 1000))
+    for name, _, cumulative, _ in top_level_imports(profile, args.top):
+        print('    {:<40}{:>10.1f} ms'.format(name, cumulative / 1000))
+
+    config = benchmark_config()
+    if args.mock:
+        use_mongomock()
+    timings = time_startup(config)
+    print('[Startup] AppSetup {:.1f} ms, initialisation (once) {:.1f} ms, prewarm (per worker) {:.1f} ms'.format(*(seconds * 1000 for seconds in timings)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
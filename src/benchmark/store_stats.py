@@ -0,0 +1,79 @@
+'''
+Compare admin statistics and order history computed in python on all documents with the aggregation pipelines.
+Run from src folder: python3 -m benchmark.store_stats [--users N] [--years M] [--mock]
+'''
+import argparse
+import math
+import sys
+from timeit import repeat
+
+from app.admin import get_store_stats
+from benchmark.data import benchmark_config, create_benchmark_store, generate_data
+
+
+def python_store_stats(mett_store):
+    deposits = sum(deposit['amount'] for deposit in mett_store.get_deposits())
+    purchases = sum(purchase['price'] for purchase in mett_store.list_purchases(processed=True))
+    return {
+        'sum_of_deposits': deposits,
+        'sum_of_purchases': purchases,
+        'balance': deposits - purchases,
+        'sum_of_buns': sum(len(order['orders']) for order in mett_store.get_all_order_information()),
+    }
+
+
+def python_order_history(mett_store, user):
+    orders = list(mett_store._order.find({'processed': True}))  # pylint: disable=protected-access
+    user_has_ordered, flag = 0, False
+    order = {bun_class: 0 for bun_class in mett_store.list_bun_classes()}
+    for former_order in orders:
+        for account, bun_class in former_order['orders']:
+            if account == user:
+                order[bun_class] += 1
+                flag = True
+        if flag:
+            user_has_ordered += 1
+            flag = False
+    if user_has_ordered > 0:
+        for bun_class in order:
+            order[bun_class] = order[bun_class] / user_has_ordered
+    return order, sum(order.values())
+
+
+def _best_of(function, repetitions):
+    return min(repeat(function, number=1, repeat=repetitions))
+
+
+def run(mett_store, user, repetitions=5):
+    return [
+        ('store stats (python)', _best_of(lambda: python_store_stats(mett_store), repetitions)),
+        ('store stats (pipeline)', _best_of(lambda: get_store_stats(mett_store), repetitions)),
+        ('order history (python)', _best_of(lambda: python_order_history(mett_store, user), repetitions)),
+        ('order history (aggregate)', _best_of(lambda: mett_store.get_order_history(user), repetitions)),
+        ('rebuild history (pipeline)', _best_of(mett_store.rebuild_order_history, repetitions)),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark admin statistics and order history')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--mock', action='store_true', help='use mongomock instead of configured mongo server')
+    args = parser.parse_args()
+
+    mett_store = create_benchmark_store(benchmark_config(), mock=args.mock)
+    names = generate_data(mett_store, users=args.users, years=args.years)
+
+    expected, result = python_store_stats(mett_store), get_store_stats(mett_store)
+    if not all(math.isclose(expected[key], result[key]) for key in expected):
+        print('[Error] results of python and pipeline statistics differ')
+        return 1
+
+    for name, seconds in run(mett_store, names[0], args.repeat):
+        print('{:<30}{:>10.2f} ms'.format(name, seconds * 1000))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+'''
+Time MettStore methods and routes (through the Flask test client) on generated data, write the results as JSON and
+compare them with a stored baseline. Exits with 1 if any benchmark got slower than baseline * threshold.
+Run from src folder: python3 -m benchmark.suite [--users N] [--years M] [--mock] [--output results.json] [--update-baseline]
+'''
+import argparse
+import json
+import platform
+import sys
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+
+from app.admin import get_store_stats
+from benchmark.data import benchmark_config, create_benchmark_app
+
+BASELINE = Path(Path(__file__).parent, 'baseline.json')
+FUTURE_DATE = '2099-01-01'
+
+STORE_BENCHMARKS = [
+    ('get_order_history', lambda store, names: store.get_order_history(names[0])),
+    ('get_store_stats', lambda store, names: get_store_stats(store)),
+    ('get_current_user_buns', lambda store, names: store.get_current_user_buns(names[0])),
+    ('get_current_bun_order', lambda store, names: store.get_current_bun_order()),
+    ('get_current_mett_order', lambda store, names: store.get_current_mett_order()),
+    ('get_balances', lambda store, names: store.get_balances(names)),
+    ('get_order_page', lambda store, names: store.get_order_page()),
+    ('get_deposits', lambda store, names: store.get_deposits()),
+    ('list_purchases', lambda store, names: store.list_purchases(processed=True)),
+    ('list_accounts', lambda store, names: store.list_accounts()),
+    ('order_buns', lambda store, names: store.order_buns(names[1], 'Weizen', 1)),
+    ('rebuild_order_history', lambda store, names: store.rebuild_order_history()),
+]
+
+ROUTES = ['/', '/order', '/order/previous', '/admin', '/admin/deposit', '/admin/purchase', '/user']
+
+
+def _measure(function, repeat, setup=None):
+    # median seconds of repeat calls of function, setup is run untimed before each call
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = perf_counter()
+        function()
+        timings.append(perf_counter() - started)
+    return median(timings)
+
+
+def _fill_current_order(store, names):
+    store.create_order(FUTURE_DATE)
+    for name in names:
+        store.order_buns(name, 'Weizen', 2)
+
+
+def run(app_setup, names, repeat=5):
+    store = app_setup.mett_store
+    results = {
+        'store.process_order': _measure(store.process_order, repeat, setup=lambda: _fill_current_order(store, names)),
+    }
+    _fill_current_order(store, names)
+    for name, function in STORE_BENCHMARKS:
+        results['store.{}'.format(name)] = _measure(lambda function=function: function(store, names), repeat)
+
+    client = app_setup.app.test_client()
+    for route in ROUTES:
+        status = client.get(route).status_code
+        if status != 200:
+            raise RuntimeError('GET {} returned {}'.format(route, status))
+        results['route GET {}'.format(route)] = _measure(lambda route=route: client.get(route), repeat)
+    return results
+
+
+def compare(results, baseline, threshold):
+    # get (name, baseline seconds, seconds) of benchmarks slower than baseline * threshold
+    return [
+        (name, baseline['results'][name], seconds)
+        for name, seconds in sorted(results['results'].items())
+        if name in baseline['results'] and seconds > baseline['results'][name] * threshold
+    ]
+
+
+def _comparable(results, baseline):
+    return all(results['meta'].get(key) == baseline['meta'].get(key) for key in ('users', 'years', 'mock', 'cache'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark MettStore methods and routes against a baseline')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--mock', action='store_true', help='use mongomock instead of configured mongo server')
+    parser.add_argument('--cache', action='store_true', help='enable the read cache (disabled to measure database work)')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', default=str(BASELINE))
+    parser.add_argument('--threshold', type=float, default=1.5, help='flag benchmarks slower than baseline times threshold')
+    parser.add_argument('--update-baseline', action='store_true', help='store results as new baseline')
+    args = parser.parse_args()
+
+    config = benchmark_config()
+    if not args.cache:
+        config.set('Cache', 'size', '0')
+    app_setup, names = create_benchmark_app(config, mock=args.mock, users=args.users, years=args.years)
+    results = {
+        'meta': {'users': args.users, 'years': args.years, 'mock': args.mock, 'cache': args.cache, 'repeat': args.repeat, 'python': platform.python_version()},
+        'results': run(app_setup, names, args.repeat),
+    }
+
+    for name, seconds in results['results'].items():
+        print('{:<35}{:>10.2f} ms'.format(name, seconds * 1000))
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2, sort_keys=True))
+    if args.update_baseline:
+        Path(args.baseline).write_text(json.dumps(results, indent=2, sort_keys=True))
+        return 0
+
+    if not Path(args.baseline).exists():
+        print('[Warning] No baseline at {}'.format(args.baseline))
+        return 0
+    baseline = json.loads(Path(args.baseline).read_text())
+    if not _comparable(results, baseline):
+        print('[Warning] Baseline was measured with {}, not comparable'.format(baseline['meta']))
+        return 0
+    regressions = compare(results, baseline, args.threshold)
+    for name, before, after in regressions:
+        print('[Regression] {:<35}{:>10.2f} ms -> {:>10.2f} ms'.format(name, before * 1000, after * 1000))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,35 @@
+import sys
+from configparser import ConfigParser
+from pathlib import Path
+
+from pymongo.errors import OperationFailure
+
+from database.client import get_client
+from database.indexes import METT_INDEXES, USER_INDEXES, missing_indexes, unknown_indexes, unused_indexes
+
+
+def check_indexes(database, registry):
+    missing = missing_indexes(database, registry)
+    for index in missing:
+        print('[missing] {}.{} on {}'.format(index.collection, index.name, index.keys))
+
+    for collection, name in unknown_indexes(database, registry):
+        print('[unknown] {}.{}'.format(collection, name))
+
+    try:
+        for collection, name, since in unused_indexes(database, registry):
+            print('[unused]  {}.{} (no access since {})'.format(collection, name, since))
+    except (OperationFailure, NotImplementedError) as error:
+        print('[error]   could not read index statistics: {}'.format(error))
+
+    return 1 if missing else 0
+
+
+def main():
+    config = ConfigParser()
+    config.read(str(Path(Path(__file__).parent, 'config', 'app.config')))
+    return check_indexes(get_client(config)[config.get('Database', 'main_database')], METT_INDEXES + USER_INDEXES)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,24 @@
+import asyncio
+from concurrent.futures import Executor
+from functools import partial
+
+
+class AsyncStore:
+    '''
+    Awaitable view of a blocking store (MettStore, UserRoleDatabase): each method call runs on executor,
+    so a coroutine can wait for several queries at once while the event loop serves other requests.
+    The executor bounds the number of concurrent database calls of the process.
+    '''
+
+    def __init__(self, store, executor: Executor):
+        self._store = store
+        self._executor = executor
+
+    def __getattr__(self, name):
+        attribute = getattr(self._store, name)
+        if not callable(attribute):
+            return attribute
+
+        async def call(*args, **kwargs):
+            return await asyncio.get_running_loop().run_in_executor(self._executor, partial(attribute, *args, **kwargs))
+        return call
@@ -0,0 +1,200 @@
+'''
+Streaming backup formats, written and read one document at a time.
+
+ndjson: one extended JSON document per line (ObjectIds and dates survive the round trip, readable for humans).
+The first line is a header, each collection starts with a section line followed by its documents:
+
+{"format": "mett-stream", "version": 1, "created": <unix time>, ...}
+{"$section": "mett.account"}
+{"_id": {"$oid": "..."}, "name": "...", "balance": 0.0}
+...
+
+bson: the magic bytes METTBSON followed by the same documents as length-prefixed BSON, which is lossless and skips
+text encoding entirely.
+
+Backups used for incremental backups add "type" ("full" or "increment"), "id" and "checkpoint" (journal id the backup is
+complete up to) to the header, increments also "parent" (id of the backup they apply to) and "base" (its checkpoint).
+'''
+import gzip
+import io
+import os
+import tempfile
+from pathlib import Path
+from time import time
+
+import bson
+from bson import json_util
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+STREAM_FORMAT = 'mett-stream'
+STREAM_VERSION = 1
+COMPRESSIONS = ['none', 'gzip', 'zstd']
+ENCODINGS = ['ndjson', 'bson']
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+BSON_MAGIC = b'METTBSON'
+
+
+class BackupWriter:
+    # writes backup into temporary file next to path, which is fsynced and renamed to path on successful exit
+
+    def __init__(self, path, compression='none', header=None, encoding='ndjson'):
+        if compression not in COMPRESSIONS:
+            raise ValueError('Unknown compression {}'.format(compression))
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError('zstd compression needs the zstandard package')
+        if encoding not in ENCODINGS:
+            raise ValueError('Unknown encoding {}'.format(encoding))
+        self._path = Path(path)
+        self._compression = compression
+        self._encoding = encoding
+        self._header = header or {}
+        self._raw, self._compressed, self._text = None, None, None
+        self._temporary_path = None
+
+    def __enter__(self):
+        file_descriptor, temporary_path = tempfile.mkstemp(prefix='.{}.'.format(self._path.name), dir=str(self._path.parent.absolute()))
+        self._raw = os.fdopen(file_descriptor, 'wb')
+        self._temporary_path = temporary_path
+        self._compressed = self._open_compressor(self._raw)
+        if self._encoding == 'bson':
+            self._compressed.write(BSON_MAGIC)
+        else:
+            self._text = io.TextIOWrapper(self._compressed, encoding='utf-8')
+        header = {'format': STREAM_FORMAT, 'version': STREAM_VERSION, 'created': time()}  # format first, see backup_format
+        header.update(self._header)
+        self._write_document(header)
+        return self
+
+    def _open_compressor(self, raw):
+        if self._compression == 'gzip':
+            return gzip.GzipFile(fileobj=raw, mode='wb')
+        if self._compression == 'zstd':
+            return zstandard.ZstdCompressor().stream_writer(raw, closefd=False)
+        return io.BufferedWriter(_Unclosable(raw))
+
+    def write_section(self, name, documents):
+        # write all documents of iterable, returns number of documents written
+        self._write_document({'$section': name})
+        count = 0
+        for document in documents:
+            self._write_document(document)
+            count += 1
+        return count
+
+    def _write_document(self, document):
+        if self._text is None:
+            self._compressed.write(bson.encode(document))
+        else:
+            self._text.write(json_util.dumps(document))
+            self._text.write('\n')
+
+    def __exit__(self, exception_type, *_):
+        try:
+            (self._text or self._compressed).close()  # flushes and closes compressor, raw file stays open
+            if exception_type is None:
+                self._raw.flush()
+                os.fsync(self._raw.fileno())
+        finally:
+            self._raw.close()
+
+        if exception_type is not None:
+            os.unlink(self._temporary_path)
+            return
+
+        os.replace(self._temporary_path, str(self._path))
+        _fsync_directory(self._path.parent.absolute())
+
+
+class _Unclosable(io.RawIOBase):
+    # passes writes to file object without closing it, so the writer can fsync after closing the upper layers
+
+    def __init__(self, file_object):
+        super().__init__()
+        self._file_object = file_object
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self._file_object.write(data)
+
+
+def _fsync_directory(directory):
+    try:
+        directory_descriptor = os.open(str(directory), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(directory_descriptor)
+    finally:
+        os.close(directory_descriptor)
+
+
+def batched_cursor(collection, batch_size=1000, projection=None):
+    return collection.find({}, projection).batch_size(batch_size)
+
+
+def read_header(path) -> dict:
+    documents = _iterate_documents(path)
+    try:
+        return next(documents)
+    finally:
+        documents.close()
+
+
+def read_documents(path):
+    # yields (section, document) for all documents of a streamed backup, decompressing and parsing one document at a time
+    documents = _iterate_documents(path)
+    next(documents)
+    section = None
+    for document in documents:
+        if '$section' in document:
+            section = document['$section']
+        else:
+            yield section, document
+
+
+def _iterate_documents(path):
+    # yields header, checked for format and version, followed by all documents
+    with _open_binary(path) as binary:
+        if binary.peek(len(BSON_MAGIC)).startswith(BSON_MAGIC):
+            binary.read(len(BSON_MAGIC))
+            documents = bson.decode_file_iter(binary)
+        else:
+            documents = (json_util.loads(line) for line in io.TextIOWrapper(binary, encoding='utf-8'))
+
+        header = next(documents, {})
+        if header.get('format') != STREAM_FORMAT:
+            raise ValueError('{} is not a streamed backup'.format(path))
+        if header.get('version', 0) > STREAM_VERSION:
+            raise ValueError('Backup version {} is not supported'.format(header['version']))
+        yield header
+        yield from documents
+
+
+def backup_format(path):
+    # 'bson' or 'ndjson' for backups written by BackupWriter, 'json' for complete json backups
+    with _open_binary(path) as binary:
+        prefix = binary.peek(64)
+    if prefix.startswith(BSON_MAGIC):
+        return 'bson'
+    return 'ndjson' if prefix.startswith('{{"format": "{}"'.format(STREAM_FORMAT).encode()) else 'json'
+
+
+def _open_binary(path):
+    # buffered binary reader of decompressed backup content, supporting peek
+    with open(str(path), 'rb') as raw:
+        magic = raw.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return io.BufferedReader(gzip.open(str(path), 'rb'))
+    if magic == ZSTD_MAGIC:
+        if zstandard is None:
+            raise ValueError('zstd compressed backups need the zstandard package')
+        return io.BufferedReader(zstandard.open(str(path), 'rb'))
+    return open(str(path), 'rb')
@@ -0,0 +1,65 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+
+class CacheStatistics:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def hit_rate(self) -> float:
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+
+    def as_dict(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'hit_rate': self.hit_rate}
+
+
+class LruCache:
+    # thread safe mapping of bounded size, evicting least recently used entries first and entries older than ttl seconds
+
+    def __init__(self, max_size: int, ttl: float = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.statistics = CacheStatistics()
+
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        # returns (found, value) so None can be cached as well
+        with self._lock:
+            if key not in self._entries or self._is_outdated(key):
+                self._entries.pop(key, None)
+                self.statistics.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.statistics.hits += 1
+            return True, self._entries[key][0]
+
+    def _is_outdated(self, key):
+        return self.ttl is not None and monotonic() - self._entries[key][1] > self.ttl
+
+    def put(self, key, value):
+        if self.max_size < 1:
+            return
+        with self._lock:
+            self._entries[key] = (value, monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.statistics.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
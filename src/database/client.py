@@ -0,0 +1,51 @@
+'''
+One MongoClient per process and server, shared by all stores, so mongo sees at most workers * max_pool_size connections.
+
+Clients are created lazily without connecting. Processes forked after a client was used (e.g. uwsgi workers, the master
+process creates the app and its indexes) must call reset_clients and reconnect their stores, see AppSetup.reconnect.
+'''
+from threading import Lock
+
+from pymongo import MongoClient
+
+from database.slow_queries import command_listeners
+
+_clients = {}
+_lock = Lock()
+
+
+def get_client(config):
+    # shared client for server and options of config, event listeners are taken from the config creating the client
+    options = client_options(config)
+    key = (mongo_uri(config), tuple(sorted(options.items())))
+    with _lock:
+        if key not in _clients:
+            _clients[key] = MongoClient(key[0], connect=False, event_listeners=command_listeners(config), **options)
+        return _clients[key]
+
+
+def mongo_uri(config):
+    return 'mongodb://{}:{}'.format(config.get('Database', 'mongo_server'), config.get('Database', 'mongo_port'))
+
+
+def client_options(config) -> dict:
+    options = {
+        'maxPoolSize': config.getint('Database', 'max_pool_size', fallback=100),
+        'minPoolSize': config.getint('Database', 'min_pool_size', fallback=0),
+        'connectTimeoutMS': config.getint('Database', 'connect_timeout_ms', fallback=20000),
+        'serverSelectionTimeoutMS': config.getint('Database', 'server_selection_timeout_ms', fallback=30000),
+        'socketTimeoutMS': config.getint('Database', 'socket_timeout_ms', fallback=0) or None,  # 0: no timeout
+        'waitQueueTimeoutMS': config.getint('Database', 'wait_queue_timeout_ms', fallback=0) or None,
+    }
+    compressors = config.get('Database', 'compressors', fallback='').strip()
+    if compressors:
+        options['compressors'] = compressors
+    return options
+
+
+def reset_clients():
+    # forget all clients, the next get_client creates new ones
+    # clients are not closed: after fork, their sockets still belong to the parent process
+    with _lock:
+        _clients.clear()
+
@@ -0,0 +1,85 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from threading import BoundedSemaphore, Lock
+from time import perf_counter
+
+from database.mett_store import StorageException
+
+
+class HashingError(StorageException):
+    pass
+
+
+class HashingStatistics:
+    def __init__(self):
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds):
+        self.completed += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def as_dict(self):
+        return {
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out,
+            'mean_seconds': self.total_seconds / self.completed if self.completed else 0.0,
+            'max_seconds': self.max_seconds,
+        }
+
+
+class HashingPool:
+    # runs password hashing and verification on a bounded number of threads (bcrypt releases the GIL)
+    # at most workers + queue_size operations are accepted at a time, further operations are rejected right away
+    # threads are started on first use, so none exist before uwsgi forks its workers
+
+    def __init__(self, workers=2, queue_size=8, timeout=10.0):
+        self._workers = workers
+        self._timeout = timeout
+        self._slots = BoundedSemaphore(workers + queue_size) if workers > 0 else None
+        self._executor = None
+        self._lock = Lock()
+
+        self.statistics = HashingStatistics()
+
+    def run(self, function, *args):
+        started = perf_counter()
+        if self._slots is None:
+            result = function(*args)
+        else:
+            result = self._run_in_pool(function, *args)
+        self.statistics.record(perf_counter() - started)
+        return result
+
+    def _run_in_pool(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            self.statistics.rejected += 1
+            raise HashingError('Too many concurrent password operations. Please try again.')
+        try:
+            future = self._get_executor().submit(function, *args)
+        except RuntimeError:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            return future.result(timeout=self._timeout)
+        except FutureTimeoutError:
+            self.statistics.timed_out += 1
+            raise HashingError('Password operation timed out. Please try again.')
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='hashing')
+            return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
@@ -0,0 +1,72 @@
+import logging
+from collections import namedtuple
+from typing import List
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+Index = namedtuple('Index', ['collection', 'name', 'keys', 'options'])
+
+METT_INDEXES = [
+    Index('account', 'unique_account_name', [('name', ASCENDING)], {'unique': True}),
+    Index('order', 'processed_expiry_date', [('processed', ASCENDING), ('expiry_date', DESCENDING)], {}),
+    Index('order', 'single_active_order', [('processed', ASCENDING)], {'unique': True, 'partialFilterExpression': {'processed': False}}),
+    Index('order_count', 'unique_order_account_bun', [('order', ASCENDING), ('account', ASCENDING), ('bun_class', ASCENDING)], {'unique': True}),
+    Index('history', 'unique_history_account', [('account', ASCENDING)], {'unique': True}),
+    Index('price', 'unique_bun_class', [('bun_class', ASCENDING)], {'unique': True}),
+    Index('purchase', 'purchase_authorized', [('processed.authorized', ASCENDING)], {}),
+    Index('deposit', 'deposit_user_timestamp', [('user', ASCENDING), ('timestamp', ASCENDING)], {}),
+]
+
+USER_INDEXES = [
+    Index('user', 'unique_user_name', [('name', ASCENDING)], {'unique': True}),
+    Index('role', 'unique_role_name', [('name', ASCENDING)], {'unique': True}),
+]
+
+
+def ensure_indexes(database, registry: List[Index]):
+    # create all indexes of registry, existing indexes with the same specification are left untouched
+    # a missing unique index fails, as stores rely on it to reject duplicates (e.g. create_account, create_order)
+    existing = {}
+    for index in registry:
+        if index.collection not in existing:
+            existing[index.collection] = database[index.collection].index_information()
+        if index.name in existing[index.collection] and list(existing[index.collection][index.name]['key']) == list(index.keys):
+            continue
+        try:
+            database[index.collection].create_index(index.keys, name=index.name, **index.options)
+        except OperationFailure as error:
+            if index.options.get('unique'):
+                logging.error('Could not create unique index %s on %s, remove duplicates first: %s', index.name, index.collection, error)
+                raise
+            logging.warning('Could not create index %s on %s: %s', index.name, index.collection, error)
+
+
+def missing_indexes(database, registry: List[Index]) -> List[Index]:
+    missing = []
+    for index in registry:
+        existing = database[index.collection].index_information()
+        if index.name not in existing or list(existing[index.name]['key']) != list(index.keys):
+            missing.append(index)
+    return missing
+
+
+def unknown_indexes(database, registry: List[Index]) -> List[tuple]:
+    # get (collection, index name) of indexes that exist but are not part of registry
+    known = {(index.collection, index.name) for index in registry}
+    return [
+        (collection, name)
+        for collection in {index.collection for index in registry}
+        for name in database[collection].index_information()
+        if name != '_id_' and (collection, name) not in known
+    ]
+
+
+def unused_indexes(database, registry: List[Index]) -> List[tuple]:
+    # get (collection, index name, accesses since) of registered indexes never used since server start
+    unused = []
+    for collection in sorted({index.collection for index in registry}):
+        for stats in database[collection].aggregate([{'$indexStats': {}}]):
+            if stats['name'] != '_id_' and stats['accesses']['ops'] == 0:
+                unused.append((collection, stats['name'], stats['accesses']['since']))
+    return unused
@@ -1,28 +1,97 @@
 '''
 account: id, name, balance (name primary key)
-order: id, processed, expiry_date, orders (orders list of (account, bun), with account foreign_key on account.id and bun foreign_key on price.id)
+order: id, processed, expiry_date, orders, bun_count (orders list of (account, bun), with account foreign_key on account.id and bun foreign_key on price.id, bun_count maps bun to number of ordered buns)
+order_count: id, order, account, bun_class, count (order foreign_key on order.id, account foreign_key on account.name, bun_class foreign_key on price.bun_class)
+history: id, account, orders, buns (account foreign_key on account.name, orders is number of processed orders containing account, buns maps bun to number of buns ordered)
 buns: id, bun_class, price, mett
 purchase: id, account, price, purpose, processed (account foreign_key on accound.name)
 deposits: id, admin, user, amount (admin fk account.name, user fk account.name)
+charge: id, account, amount, reason, order, timestamp (money taken from account for buns, order fk order.id, None for spares)
+version: id, epoch, <collection> (single document counting writes per collection, used to invalidate cached reads)
+journal: id, section, key (written documents per backup section, key is a query matching them, used for incremental backups)
+reconciliation: id ('checkpoint'), until, until_time, expected (expected balances of database.reconciliation up to journal id until and time until_time)
 '''
 
+import copy
 import datetime
+from contextlib import contextmanager
+from functools import wraps
 from time import time
 
 from bson.objectid import ObjectId
-from pymongo import MongoClient
+from flask import g, has_request_context
+from pymongo import DESCENDING, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from database.cache import LruCache
+from database.client import get_client
+from database.indexes import METT_INDEXES, ensure_indexes
+
+REROUTE_ATTEMPTS = 20
+PROCESS_ATTEMPTS = 20
 
 
 class StorageException(Exception):
     pass
 
 
+def _cached(*collections):
+    # cache result of store method until one of the given collections is written by any process
+    def decorator(function):
+        @wraps(function)
+        def wrapper(store, *args):
+            # pylint: disable=protected-access
+            if store._cache.max_size < 1:
+                return function(store, *args)
+            versions = store._get_versions()
+            key = (function.__name__, args, versions.get('epoch'), tuple(versions.get(collection, 0) for collection in collections))
+            found, result = store._cache.get(key)
+            if found:
+                return copy.deepcopy(result)
+            result = function(store, *args)
+            store._cache.put(key, copy.deepcopy(result))
+            return result
+        return wrapper
+    return decorator
+
+
+_UNWIND_PROCESSED_ORDERS = [
+    {'$match': {'processed': True}},
+    {'$unwind': '$orders'},
+    {'$project': {'account': {'$arrayElemAt': ['$orders', 0]}, 'bun_class': {'$arrayElemAt': ['$orders', 1]}}},
+]
+_ORDERS_PER_ACCOUNT_PIPELINE = _UNWIND_PROCESSED_ORDERS + [
+    {'$group': {'_id': {'order': '$_id', 'account': '$account'}}},
+    {'$group': {'_id': '$_id.account', 'orders': {'$sum': 1}}},
+]
+_BUNS_PER_ACCOUNT_PIPELINE = _UNWIND_PROCESSED_ORDERS + [
+    {'$group': {'_id': {'account': '$account', 'bun_class': '$bun_class'}, 'count': {'$sum': 1}}},
+]
+
+
 class MettStore:
 
-    def __init__(self, config, ):
+    def __init__(self, config, initialize=True):
         self._config = config
 
-        self._client = MongoClient('mongodb://{}:{}'.format(self._config.get('Database', 'mongo_server'), self._config.get('Database', 'mongo_port')), connect=False)
+        self.reconnect()
+        self._journal_enabled = self._config.getboolean('Backup', 'journal', fallback=False)
+
+        self._cache = LruCache(self._config.getint('Cache', 'size', fallback=0))
+        self._version_interval = self._config.getfloat('Cache', 'version_interval', fallback=0.0)
+        self._versions = (0.0, {})
+
+        if initialize:
+            self.initialize()
+
+    def initialize(self):
+        # create indexes and default buns, deferred by AppSetup to worker start if configured
+        ensure_indexes(self._mett_base, METT_INDEXES)
+        self._init_tables()
+
+    def reconnect(self):
+        # (re)bind collections to the shared client, e.g. after fork
+        self._client = get_client(self._config)
         self._mett_base = self._client[self._config.get('Database', 'main_database')]
 
         self._account = self._mett_base.account
@@ -30,33 +99,161 @@ class MettStore:
         self._buns = self._mett_base.price
         self._purchase = self._mett_base.purchase
         self._deposit = self._mett_base.deposit
-
-        self._init_tables()
+        self._charge = self._mett_base.charge
+        self._order_count = self._mett_base.order_count
+        self._history = self._mett_base.history
+        self._version = self._mett_base.version
+        self._journal = self._mett_base.journal
+        self._reconciliation = self._mett_base.reconciliation
 
     def _init_tables(self):
         if self._buns.count_documents({}) == 0:
             for bun in self._config.get('Mett', 'default_buns').split(','):
-                self._buns.insert_one({'bun_class': bun.strip(), 'price': self._config.getfloat('Mett', 'default_price'), 'mett': self._config.getfloat('Mett', 'default_grams')})
+                self._insert_default_bun(bun.strip())
+            self._bump_version('price')
+        if self._history.count_documents({}, limit=1) == 0 and self._order.count_documents({'processed': True}, limit=1) > 0:
+            self.rebuild_order_history()  # databases of versions before the history collection
+
+    def _insert_default_bun(self, bun_class):
+        # upsert, as another process may be initializing the same empty database
+        defaults = {'price': self._config.getfloat('Mett', 'default_price'), 'mett': self._config.getfloat('Mett', 'default_grams')}
+        try:
+            result = self._buns.update_one({'bun_class': bun_class}, {'$setOnInsert': defaults}, upsert=True)
+        except DuplicateKeyError:  # concurrent upsert of the same class won
+            return
+        if result.upserted_id is not None:
+            self._record_changes('mett.bun', {'bun_class': bun_class})
+
+    # -------------- cache functions --------------
+
+    def cache_statistics(self):
+        return self._cache.statistics.as_dict()
+
+    def _get_versions(self):
+        # get write counters of all collections, read once per request, so a request sees writes of requests finished
+        # before it started on any worker; outside of requests re-read at most every version_interval seconds
+        snapshots = self._request_versions()
+        if snapshots is not None:
+            if self._version.full_name not in snapshots:
+                snapshots[self._version.full_name] = self._version.find_one({'_id': 'collections'}) or {}
+            return snapshots[self._version.full_name]
+        checked_at, versions = self._versions
+        if time() - checked_at >= self._version_interval:
+            versions = self._version.find_one({'_id': 'collections'}) or {}
+            self._versions = (time(), versions)
+        return versions
+
+    @staticmethod
+    def _request_versions():
+        # version snapshots of the current request by version collection, None outside of requests
+        if not has_request_context():
+            return None
+        if 'mett_versions' not in g:
+            g.mett_versions = {}
+        return g.mett_versions
+
+    def _expire_versions(self):
+        # force re-reading versions on next cached read, e.g. before charging money based on cached prices
+        self._versions = (0.0, {})
+        snapshots = self._request_versions()
+        if snapshots is not None:
+            snapshots.pop(self._version.full_name, None)
+
+    def _bump_version(self, *collections):
+        versions = self._version.find_one_and_update(
+            {'_id': 'collections'},
+            {'$inc': {collection: 1 for collection in collections}, '$setOnInsert': {'epoch': str(ObjectId())}},
+            upsert=True, return_document=ReturnDocument.AFTER
+        )
+        self._versions = (time(), versions)
+        snapshots = self._request_versions()
+        if snapshots is not None:  # later reads of this request see its own write
+            snapshots[self._version.full_name] = versions
+
+    # -------------- journal functions --------------
+
+    def _record_changes(self, section, *keys, session=None):
+        # note written documents for incremental backups, keys are queries matching the documents in their backup section
+        if self._journal_enabled and keys:
+            self._journal.insert_many([{'section': section, 'key': key} for key in keys], ordered=False, session=session)
+
+    def journal_enabled(self):
+        return self._journal_enabled
+
+    def changed_since(self, since: ObjectId):
+        # get distinct (section, key) written since journal id since, oldest first
+        changes = {}
+        for entry in self._journal.find({'_id': {'$gte': since}}, {'section': 1, 'key': 1}).sort('_id', 1):
+            changes.setdefault((entry['section'], tuple(sorted(entry['key'].items()))), entry['key'])
+        return [(section, key) for (section, _), key in changes.items()]
+
+    def prune_journal(self, before: ObjectId):
+        return self._journal.delete_many({'_id': {'$lt': before}}).deleted_count
+
+    # -------------- reconciliation functions --------------
+
+    def deposits_per_account(self, since=None, until=None):
+        # get (account, amount) of deposits with id in [since, until)
+        return self._sum_per_account(self._deposit, _id_filter(since, until), '$user', '$amount')
+
+    def charges_per_account(self, since=None, until=None):
+        # get (account, amount) of charges with id in [since, until)
+        return self._sum_per_account(self._charge, _id_filter(since, until), '$account', '$amount')
+
+    def authorized_purchases_per_account(self, since_time=None, until_time=None):
+        # get (account, price) of purchases authorized in [since_time, until_time)
+        # restored purchases may carry no time of authorization, they count as authorized before any time
+        query = {'processed.authorized': True}
+        if since_time is not None:
+            query['processed.at'] = _range(since_time, until_time)
+        elif until_time is not None:
+            query['processed.at'] = {'$not': {'$gte': until_time}}
+        return self._sum_per_account(self._purchase, query, '$account', '$price')
+
+    @staticmethod
+    def _sum_per_account(collection, query, account, amount):
+        return [(entry['_id'], entry['amount']) for entry in collection.aggregate([{'$match': query}, {'$group': {'_id': account, 'amount': {'$sum': amount}}}])]
+
+    def list_balances(self):
+        # get (account, balance) of all accounts
+        return [(account['name'], account['balance']) for account in self._account.find({}, {'name': 1, 'balance': 1})]
+
+    def get_reconciliation_checkpoint(self):
+        return self._reconciliation.find_one({'_id': 'checkpoint'})
+
+    def set_reconciliation_checkpoint(self, until: ObjectId, until_time: float, expected: dict):
+        self._reconciliation.replace_one({'_id': 'checkpoint'}, {
+            'until': until,
+            'until_time': until_time,
+            'expected': [{'account': account, 'balance': balance} for account, balance in expected.items()],
+        }, upsert=True)
 
     # -------------- admin functions --------------
 
     def create_account(self, name):
-        if self.account_exists(name):
+        try:
+            account_id = self._account.insert_one({'name': name, 'balance': 0.0}).inserted_id
+        except DuplicateKeyError:
             raise StorageException('Account {} exists'.format(name))
-        return self._account.insert_one({'name': name, 'balance': 0.0}).inserted_id
+        self._record_changes('mett.account', {'name': name})
+        return account_id
 
     def delete_account(self, name):
-        if not self.account_exists(name):
+        deleted_count = self._account.delete_one({'name': name}).deleted_count
+        if not deleted_count:
             raise StorageException('Account {} does not exist'.format(name))
-        return self._account.delete_one({'name': name}).deleted_count
+        self._record_changes('mett.account', {'name': name})
+        return deleted_count
 
     def change_balance(self, account, amount, admin):
         self._book_money(account, amount)
-        self._deposit.insert_one({'admin': admin, 'user': account, 'amount': amount, 'timestamp': time()})
+        deposit_id = self._deposit.insert_one({'admin': admin, 'user': account, 'amount': amount, 'timestamp': time()}).inserted_id
+        self._record_changes('mett.deposit', {'_id': deposit_id})
 
     def _book_money(self, account, amount):
         # Increase balance of account by amount and register deposit by admin
         self._account.update_one({'name': account}, {'$inc': {'balance': amount}})
+        self._record_changes('mett.account', {'name': account})
 
     def get_deposits(self):
         deposits = self._deposit.find()
@@ -69,20 +266,80 @@ class MettStore:
             } for deposit in deposits
         ]
 
+    def sum_of_deposits(self):
+        return self._sum(self._deposit, '$amount')
+
+    def sum_of_purchases(self):
+        return self._sum(self._purchase, '$price')
+
+    def count_ordered_buns(self):
+        return self._sum(self._order, {'$size': '$orders'})
+
+    @staticmethod
+    def _sum(collection, expression):
+        # sum expression over all documents of collection on database side
+        result = list(collection.aggregate([{'$group': {'_id': None, 'total': {'$sum': expression}}}]))
+        return result[0]['total'] if result else 0
+
     def list_accounts(self):
         # return list of (accound.id, account.name) tuples
         return [(entry['_id'], entry['name']) for entry in self._account.find()]
 
     def process_order(self):
-        # set expire of current order to true and decrease balances according to order
-        current_order = self._get_current_order()
-        for account, bun in current_order['orders']:
-            self._charge_bun(account, bun)
-        self._order.update_one({'processed': False}, {'$set': {'processed': True}})
+        # set expire of current order to true and decrease balances according to order, returns charge per account
+        # charges are computed before the order is closed, which only happens if its order list is unchanged since it was read
+        self._expire_versions()
+        bun_prices = self.list_bun_classes_with_price()
+        with self._transaction() as session:
+            for _ in range(PROCESS_ATTEMPTS):
+                current_order = self._order.find_one({'processed': False}, {'orders': 1}, session=session)
+                if not current_order:
+                    raise StorageException('No current order')
+                account_buns = _count_buns_per_account(current_order['orders'])
+                charges = _charges(account_buns, bun_prices)
+                if self._order.find_one_and_update(
+                        {'_id': current_order['_id'], 'processed': False, 'orders': current_order['orders']}, {'$set': {'processed': True}}, projection={'_id': 1}, session=session
+                ):
+                    break
+            else:
+                raise StorageException('Order changed too often while closing. Please try again.')
+
+            if charges:
+                self._account.bulk_write([UpdateOne({'name': account}, {'$inc': {'balance': 0 - charge}}) for account, charge in charges.items()], ordered=False, session=session)
+                self._charge.insert_many([
+                    {'account': account, 'amount': charge, 'reason': 'order', 'order': current_order['_id'], 'timestamp': time()} for account, charge in charges.items()
+                ], session=session)
+                self._record_changes('mett.charge', {'order': current_order['_id']}, session=session)
+                self._history.bulk_write([self._history_update(account, buns) for account, buns in account_buns.items()], ordered=False, session=session)
+                self._record_changes('mett.account', *[{'name': account} for account in charges], session=session)
+            self._record_changes('mett.order', {'_id': current_order['_id']}, session=session)
+        self._bump_version('order')
+        return charges
+
+    @staticmethod
+    def _history_update(account, buns):
+        increments = {'buns.{}'.format(bun_class): count for bun_class, count in buns.items()}
+        increments['orders'] = 1
+        return UpdateOne({'account': account}, {'$inc': increments}, upsert=True)
+
+    def rebuild_order_history(self):
+        # recompute order history of all accounts from processed orders, may run in several workers at once
+        history = {}
+        for entry in self._order.aggregate(_ORDERS_PER_ACCOUNT_PIPELINE):
+            history[entry['_id']] = {'account': entry['_id'], 'orders': entry['orders'], 'buns': {}}
+        for entry in self._order.aggregate(_BUNS_PER_ACCOUNT_PIPELINE):
+            history[entry['_id']['account']]['buns'][entry['_id']['bun_class']] = entry['count']
+        self._history.delete_many({'account': {'$nin': list(history)}})
+        if history:
+            self._history.bulk_write([ReplaceOne({'account': account}, entry, upsert=True) for account, entry in history.items()], ordered=False)
 
     def drop_current_order(self):
         # drop current order
-        self._order.delete_one({'processed': False})
+        current_order = self._order.find_one_and_delete({'processed': False}, {'_id': 1})
+        if current_order:
+            self._order_count.delete_many({'order': current_order['_id']})
+            self._record_changes('mett.order', {'_id': current_order['_id']})
+            self._bump_version('order')
 
     def list_purchases(self, processed=False):
         # list purchases, if processed is false only those that have not been authorized or declined
@@ -94,176 +351,310 @@ class MettStore:
 
     def authorize_purchase(self, purchase_id, admin):
         # add purchase.amount to purchase.account.balance
-        purchase = self._purchase.find_one({'_id': ObjectId(purchase_id)})
-        if purchase['processed']['by']:
-            raise StorageException('Purchase was already processed')
+        purchase = self._process_purchase(purchase_id, admin, authorized=True)
         self._book_money(purchase['account'], float(purchase['price']))
-        self._purchase.update_one({'_id': ObjectId(purchase_id)}, {'$set': {'processed': {'authorized': True, 'at': time(), 'by': admin}}})
 
     def decline_purchase(self, purchase_id, admin):
         # drop purchase
-        purchase = self._purchase.find_one({'_id': ObjectId(purchase_id)})
-        if purchase['processed']['by']:
+        self._process_purchase(purchase_id, admin, authorized=False)
+
+    def _process_purchase(self, purchase_id, admin, authorized):
+        # mark purchase as processed if it hasn't been yet, so concurrent requests can't book it twice
+        purchase = self._purchase.find_one_and_update(
+            {'_id': ObjectId(purchase_id), 'processed.by': None},
+            {'$set': {'processed': {'authorized': authorized, 'at': time(), 'by': admin}}},
+            projection={'account': 1, 'price': 1}
+        )
+        if not purchase:
             raise StorageException('Purchase was already processed')
-        self._purchase.update_one({'_id': ObjectId(purchase_id)}, {'$set': {'processed': {'authorized': False, 'at': time(), 'by': admin}}})
+        self._record_changes('mett.purchases', {'_id': purchase['_id']})
+        return purchase
 
     def change_mett_formula(self, bun, amount):
         # set mett_formula.amount for referenced bun
-        if self._buns.count_documents({'bun_class': bun}) < 1:
+        if not self._buns.update_one({'bun_class': bun}, {'$set': {'mett': float(amount)}}).matched_count:
             raise StorageException('Bun does not exist')
-        self._buns.update_one({'bun_class': bun}, {'$set': {'mett': float(amount)}})
+        self._record_changes('mett.bun', {'bun_class': bun})
+        self._bump_version('price')
 
     def change_bun_price(self, bun, price):
         # set mett_formula.amount for referenced bun
-        if self._buns.count_documents({'bun_class': bun}) < 1:
+        if not self._buns.update_one({'bun_class': bun}, {'$set': {'price': float(price)}}).matched_count:
             raise StorageException('Bun does not exist')
-        self._buns.update_one({'bun_class': bun}, {'$set': {'price': float(price)}})
+        self._record_changes('mett.bun', {'bun_class': bun})
+        self._bump_version('price')
 
     def assign_spare(self, bun_class, user):
+        self._expire_versions()
         self._charge_bun(user, bun_class)
 
     # -------------- user functions --------------
 
+    @_cached('order')
     def active_order_exists(self):
         return self._order.count_documents({'processed': False}) > 0
 
     def account_exists(self, name):
         return self._account.count_documents({'name': name}) > 0
 
+    def get_balances(self, names):
+        # get {name: balance} for all existing accounts in names
+        return {account['name']: account['balance'] for account in self._account.find({'name': {'$in': list(names)}}, {'name': 1, 'balance': 1})}
+
     def get_account_information(self, account):
         # get (id, name, balance) for account
-        if not self.account_exists(account):
-            raise StorageException('No existing account {}'.format(account))
         account_information = self._account.find_one({'name': account})
+        if not account_information:
+            raise StorageException('No existing account {}'.format(account))
         account_information['_id'] = str(account_information['_id'])
         return account_information
 
     def order_bun(self, account, bun_class):  # throws Exception if no current order
         # add (account, bun_class) to current order
-        current_order = self._get_current_order()
-        if self.current_order_is_expired():
-            raise StorageException('Order has expired. You are not allowed to order anymore.')
-        orders = current_order['orders']
-        orders.append((account, bun_class))
-        self._order.update_one({'_id': current_order['_id']}, {'$set': {'orders': orders}})
+        self.order_buns(account, bun_class, 1)
+
+    def order_buns(self, account, bun_class, amount):  # throws Exception if no current order
+        # add amount times (account, bun_class) to current order in one atomic update, guarded by expiry date
+        if amount < 1:
+            return
+        if bun_class not in self.list_bun_classes_with_price():  # also keeps form input out of the bun_count field path
+            raise StorageException('Unknown bun class {}'.format(bun_class))
+        current_order = self._push_buns(account, bun_class, amount)
+        if not current_order:
+            order = self._get_current_order()
+            if self._is_expired(order['expiry_date']):
+                raise StorageException('Order has expired. You are not allowed to order anymore.')
+            self._init_counters(order)
+            current_order = self._push_buns(account, bun_class, amount)
+            if not current_order:
+                raise StorageException('Order has expired. You are not allowed to order anymore.')
+        self._count_buns(current_order['_id'], account, bun_class, amount)
+        self._record_changes('mett.order', {'_id': current_order['_id']})
+        self._bump_version('order')
+
+    def _push_buns(self, account, bun_class, amount):
+        return self._order.find_one_and_update(
+            {'processed': False, 'bun_count': {'$exists': True}, 'expiry_date': self._unexpired_date_filter()},
+            {'$push': {'orders': {'$each': [(account, bun_class)] * amount}}, '$inc': {'bun_count.{}'.format(bun_class): amount}},
+            projection={'_id': 1}
+        )
 
     def reroute_bun(self, bun_class, user, target):
-        user_buns = self.get_current_user_buns(user)
-        if user_buns[bun_class] == 0:
-            raise ValueError('No {} bun order by {}'.format(bun_class, user))
-        current_order = self._get_current_order()
-        new_orders = self._reroute_from_user_to_target(bun_class, current_order, target, user)
-        self._order.update_one({'_id': current_order['_id']}, {'$set': {'orders': new_orders}})
+        # replace one (user, bun_class) line by (target, bun_class), only written if the order list is unchanged since it was read,
+        # so buns ordered concurrently (pushed by order_buns) are never overwritten
+        for _ in range(REROUTE_ATTEMPTS):
+            current_order = self._get_current_order({'orders': 1})
+            new_orders = self._reroute_from_user_to_target(bun_class, current_order, target, user)
+            result = self._order.update_one({'_id': current_order['_id'], 'processed': False, 'orders': current_order['orders']}, {'$set': {'orders': new_orders}})
+            if result.modified_count:
+                self._count_buns(current_order['_id'], user, bun_class, -1)
+                self._count_buns(current_order['_id'], target, bun_class, 1)
+                self._record_changes('mett.order', {'_id': current_order['_id']})
+                self._bump_version('order')
+                return
+        raise StorageException('Order changed too often while rerouting. Please try again.')
 
     @staticmethod
     def _reroute_from_user_to_target(bun_class, current_order, target, user):
         new_orders, rerouted = [], False
         for account, ordered_bun in current_order['orders']:
             if account == user and ordered_bun == bun_class and not rerouted:
-                new_orders.append((target, ordered_bun))
+                new_orders.append([target, ordered_bun])
                 rerouted = True
             else:
-                new_orders.append((account, ordered_bun))
+                new_orders.append([account, ordered_bun])
         if not rerouted:
-            raise ValueError('Unknown problem in rerouting order')
+            raise ValueError('No {} bun order by {}'.format(bun_class, user))
         return new_orders
 
     def state_purchase(self, account, amount, purpose):
         # add account, amount, purpose as non processed purchase
         result = self._purchase.insert_one({'account': account, 'price': amount, 'purpose': purpose, 'timestamp': time(), 'processed': {'authorized': False, 'at': None, 'by': None}})
+        self._record_changes('mett.purchases', {'_id': result.inserted_id})
         return result.inserted_id
 
     def get_order_history(self, user):
-        # TODO Please refactor
-        # get list of (order_id, orders) where orders is slice of orders ordered by account
-        orders = list(self._order.find({'processed': True}))
-        user_has_ordered, flag = 0, False
-        order = {bun_class: 0 for bun_class in self.list_bun_classes()}
-        for former_order in orders:
-            for account, bun_class in former_order['orders']:
-                if account == user:
-                    order[bun_class] += 1
-                    flag = True
-            if flag:
-                user_has_ordered += 1
-                flag = False
+        # get mean number of buns per bun class over all processed orders of user and mean of total buns
+        history = self._history.find_one({'account': user}, {'orders': 1, 'buns': 1}) or {'orders': 0, 'buns': {}}
+        user_has_ordered = history['orders']
+        order = {bun_class: history['buns'].get(bun_class, 0) for bun_class in self.list_bun_classes()}
         if user_has_ordered > 0:
             for bun_class in order:
                 order[bun_class] = order[bun_class] / user_has_ordered
         mean_over_all = sum(order[bun] for bun in order)
         return order, mean_over_all
 
+    @_cached('order', 'price')
     def get_current_user_buns(self, user):
         # get list of buns ordered by user
-        return self._get_order(lambda x: x == user)
+        current_order = self._get_counted_current_order()
+        order = {bun_class: 0 for bun_class in self.list_bun_classes()}
+        for count in self._order_count.find({'order': current_order['_id'], 'account': user}, {'bun_class': 1, 'count': 1}):
+            order[count['bun_class']] += count['count']
+        return order
 
+    @_cached('order', 'price')
     def get_current_bun_order(self):
         # get aggregated current bun order
-        bun_order = self._get_order(lambda _: True)
-        for spare in self._calculate_spares():
+        bun_count = self._get_counted_current_order()['bun_count']
+        bun_order = {bun_class: bun_count.get(bun_class, 0) for bun_class in self.list_bun_classes()}
+        for spare in self._calculate_spares(bun_order):
             bun_order[spare] += 1
         return bun_order
 
-    def _get_order(self, filter_function):
-        # get list of buns ordered by user
-        current_order = self._get_current_order()
-        order = {bun_class: 0 for bun_class in self.list_bun_classes()}
-
-        for account, bun_class in current_order['orders']:
-            if filter_function(account):
-                order[bun_class] += 1
-
-        return order
-
+    @_cached('order', 'price')
     def get_current_mett_order(self):
         # generate mett order from bun order
         bun_order = self.get_current_bun_order()
         return sum(self._get_mett(bun_class) * bun_order[bun_class] for bun_class in bun_order)
 
+    @_cached('price')
     def list_bun_classes(self) -> list:
         return [bun['bun_class'] for bun in self._buns.find({}, {'bun_class': 1})]
 
+    @_cached('price')
     def list_bun_classes_with_price(self) -> dict:
         return {bun['bun_class']: bun['price'] for bun in self._buns.find({}, {'bun_class': 1, 'price': 1})}
 
     def get_all_order_information(self):
         return list(self._order.find())
 
+    def get_order_page(self, before=None, page_size=20):
+        # get orders newest first, starting after order with id before, and id to request next page with (None if last page)
+        query = {'_id': {'$lt': ObjectId(before)}} if before else {}
+        orders = list(self._order.find(query, {'expiry_date': 1, 'processed': 1, 'orders': 1}).sort('_id', DESCENDING).limit(page_size + 1))
+        next_page = str(orders[page_size - 1]['_id']) if len(orders) > page_size else None
+        return orders[:page_size], next_page
+
     # -------------- internal functions --------------
 
-    def _calculate_spares(self):
-        current_bun_order = self._get_order(lambda _: True)
+    @staticmethod
+    def _calculate_spares(current_bun_order):
         if 'Roeggelchen' in current_bun_order and (current_bun_order['Roeggelchen'] % 2) == 1:
             return ['Roeggelchen', 'Weizen']
         return ['Weizen', 'Roggen']
 
+    @_cached('price')
     def _get_mett(self, bun):
         return float(self._buns.find_one({'bun_class': bun}, {'mett': 1})['mett'])
 
-    def _get_current_order(self):
-        current_order = self._order.find_one({'processed': False})
+    def _get_current_order(self, projection=None):
+        current_order = self._order.find_one({'processed': False}, projection)
         if not current_order:
             raise StorageException('No current order')
         return current_order
 
+    def _get_counted_current_order(self):
+        # get current order without its order list, initializing counters of orders created before they existed
+        current_order = self._get_current_order({'orders': 0})
+        if 'bun_count' not in current_order:
+            current_order['bun_count'] = self._init_counters(self._get_current_order())
+        return current_order
+
+    def _init_counters(self, order):
+        if 'bun_count' in order:
+            return order['bun_count']
+        bun_count, account_count = {}, {}
+        for account, bun_class in order['orders']:
+            bun_count[bun_class] = bun_count.get(bun_class, 0) + 1
+            account_count[(account, bun_class)] = account_count.get((account, bun_class), 0) + 1
+        if self._order.update_one({'_id': order['_id'], 'bun_count': {'$exists': False}}, {'$set': {'bun_count': bun_count}}).modified_count:
+            for (account, bun_class), count in account_count.items():
+                self._count_buns(order['_id'], account, bun_class, count)
+        order['bun_count'] = bun_count
+        return bun_count
+
+    def _count_buns(self, order_id, account, bun_class, amount):
+        self._order_count.update_one({'order': order_id, 'account': account, 'bun_class': bun_class}, {'$inc': {'count': amount}}, upsert=True)
+
+    @contextmanager
+    def _transaction(self):
+        # yield session running a transaction if enabled (requires mongo replica set), None otherwise
+        if not self._config.getboolean('Database', 'transactions', fallback=False):
+            yield None
+            return
+        with self._client.start_session() as session:
+            with session.start_transaction():
+                yield session
+
     def _charge_bun(self, account, bun):
-        bun_price = self._buns.find_one({'bun_class': bun})['price']
-        self._account.update_one({'name': account}, {'$inc': {'balance': 0 - float(bun_price)}})
+        price = float(self._get_bun_price(bun))
+        self._account.update_one({'name': account}, {'$inc': {'balance': 0 - price}})
+        charge_id = self._charge.insert_one({'account': account, 'amount': price, 'reason': 'spare', 'order': None, 'timestamp': time()}).inserted_id
+        self._record_changes('mett.account', {'name': account})
+        self._record_changes('mett.charge', {'_id': charge_id})
+
+    @_cached('price')
+    def _get_bun_price(self, bun):
+        return self._buns.find_one({'bun_class': bun}, {'price': 1})['price']
 
     # -------------- internal functions --------------
 
     def create_order(self, expiry_date):
+        # normalize date so that expiry dates can be compared as strings
+        expiry_date = datetime.datetime.strptime(expiry_date, '%Y-%m-%d').strftime('%Y-%m-%d')
         if self._is_expired(expiry_date):
             raise StorageException('Please enter date that hasn\'t expired yet')
-        if self.active_order_exists():
+        try:
+            order_id = self._order.insert_one({'expiry_date': expiry_date, 'processed': False, 'orders': [], 'bun_count': {}}).inserted_id
+        except DuplicateKeyError:
             raise StorageException('No new order can be initialized while another one is active')
-        return self._order.insert_one({'expiry_date': expiry_date, 'processed': False, 'orders': []}).inserted_id
+        self._record_changes('mett.order', {'_id': order_id})
+        self._bump_version('order')
+        return order_id
 
     def current_order_is_expired(self):
-        if not self.active_order_exists():
+        expiry_date = self._get_current_expiry_date()
+        if expiry_date is None:
             raise StorageException('There is no active order')
-        return self._is_expired(self._get_current_order()['expiry_date'])
+        return self._is_expired(expiry_date)
+
+    @_cached('order')
+    def _get_current_expiry_date(self):
+        current_order = self._order.find_one({'processed': False}, {'expiry_date': 1})
+        return current_order['expiry_date'] if current_order else None
 
     def _is_expired(self, expiry_date):
         expiry_time = self._config.get('DEFAULT', 'expiry_time').strip()
         return datetime.datetime.strptime('{} {}'.format(expiry_date, expiry_time), '%Y-%m-%d %H:%M:%S') < datetime.datetime.now()
+
+    def _unexpired_date_filter(self):
+        # query on expiry_date matching all orders that have not expired yet
+        now = datetime.datetime.now()
+        expiry_time = datetime.datetime.strptime(self._config.get('DEFAULT', 'expiry_time').strip(), '%H:%M:%S').time()
+        today = now.strftime('%Y-%m-%d')
+        return {'$gte': today} if now.time() <= expiry_time else {'$gt': today}
+
+
+def _range(lower, upper):
+    bounds = {}
+    if lower is not None:
+        bounds['$gte'] = lower
+    if upper is not None:
+        bounds['$lt'] = upper
+    return bounds
+
+
+def _id_filter(since, until):
+    id_range = _range(since, until)
+    return {'_id': id_range} if id_range else {}
+
+
+def _count_buns_per_account(orders):
+    # get {account: {bun_class: count}} for list of (account, bun_class) pairs
+    account_buns = {}
+    for account, bun_class in orders:
+        buns = account_buns.setdefault(account, {})
+        buns[bun_class] = buns.get(bun_class, 0) + 1
+    return account_buns
+
+
+def _charges(account_buns, bun_prices):
+    # get {account: charge} for {account: {bun_class: count}}, raises StorageException for bun classes without price
+    unknown = {bun_class for buns in account_buns.values() for bun_class in buns if bun_class not in bun_prices}
+    if unknown:
+        raise StorageException('Unknown bun class {} in order'.format(', '.join(sorted(unknown))))
+    return {
+        account: sum(float(bun_prices[bun_class]) * count for bun_class, count in buns.items())
+        for account, buns in account_buns.items()
+    }
@@ -0,0 +1,61 @@
+'''
+Expected account balances derived from deposits, authorized purchases and charges, updated incrementally.
+
+The checkpoint (reconciliation collection of MettStore) holds the expected balances summing all records written before
+journal id until, purchases by time of authorization before until_time. The first run takes the current balances as
+checkpoint, as orders processed before charges were recorded have no records to derive their cost from.
+'''
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+from database.mett_store import MettStore
+
+# records are only reconciled once they are older than this, so writes of all app servers with ids before the checkpoint have arrived
+SETTLE_TIME = timedelta(seconds=30)
+
+Drift = namedtuple('Drift', ['account', 'balance', 'expected', 'drift'])
+
+
+class BalanceReconciliation:  # pylint: disable=too-few-public-methods
+
+    def __init__(self, mett_store: MettStore):
+        self._mett_store = mett_store
+
+    def run(self, now=None, full=False):
+        # get Drift for every account, processing only records written since the last run
+        # full: recompute from all records instead, which reports orders processed before charges were recorded as drift
+        cutoff_time = (now or datetime.now(timezone.utc)) - SETTLE_TIME
+        cutoff, cutoff_timestamp = ObjectId.from_datetime(cutoff_time), cutoff_time.timestamp()
+
+        checkpoint = None if full else self._mett_store.get_reconciliation_checkpoint()
+        if checkpoint:
+            expected = {entry['account']: entry['balance'] for entry in checkpoint['expected']}
+            self._add(expected, self._changes(checkpoint['until'], cutoff, checkpoint['until_time'], cutoff_timestamp))
+        elif full:
+            expected = {}
+            self._add(expected, self._changes(None, cutoff, None, cutoff_timestamp))
+        else:  # first run, balances less the records not yet settled
+            expected = dict(self._mett_store.list_balances())
+            self._add(expected, ((account, 0 - amount) for account, amount in self._changes(cutoff, None, cutoff_timestamp, None)))
+
+        self._mett_store.set_reconciliation_checkpoint(cutoff, cutoff_timestamp, expected)
+
+        self._add(expected, self._changes(cutoff, None, cutoff_timestamp, None))  # not yet settled, but already booked
+        return [
+            Drift(account, balance, expected.get(account, 0.0), balance - expected.get(account, 0.0))
+            for account, balance in self._mett_store.list_balances()
+        ]
+
+    @staticmethod
+    def _add(expected, changes):
+        for account, amount in changes:
+            expected[account] = expected.get(account, 0.0) + amount
+
+    def _changes(self, since, until, since_time, until_time):
+        # (account, amount) of deposits and charges with id in [since, until) and purchases authorized in [since_time, until_time)
+        yield from self._mett_store.deposits_per_account(since, until)
+        for account, amount in self._mett_store.charges_per_account(since, until):
+            yield account, 0 - amount
+        yield from self._mett_store.authorized_purchases_per_account(since_time, until_time)
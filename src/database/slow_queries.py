@@ -0,0 +1,118 @@
+'''
+Slow query log: mongo commands taking at least threshold_ms are written as JSON lines to a rotating log file, e.g.
+
+{"time": 1700000000.0, "command": "find", "collection": "order_count", "shape": "{\"account\": \"?\"}", "milliseconds": 153.2,
+ "documents": 12, "endpoint": "user", "store_call": "mett_store.get_current_user_buns"}
+
+The shape is the filter (or pipeline, update query, ...) with all values replaced by "?", so it never contains user data.
+Enable in the SlowQueries section of app.config, summarize with: python3 slow_queries.py
+'''
+import json
+import logging
+from logging.handlers import RotatingFileHandler
+from time import time
+
+from flask import has_request_context, request
+from pymongo import monitoring
+
+from database.store_calls import current_store_call
+
+LOGGER_NAME = 'mett.slow_queries'
+COLLECTION_KEYS = ['find', 'aggregate', 'count', 'distinct', 'update', 'delete', 'insert', 'findAndModify', 'getMore']
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    # pymongo publishes started and succeeded on the thread issuing the command, so request and store call are known
+
+    def __init__(self, threshold_ms, logger):
+        self._threshold_micros = threshold_ms * 1000
+        self._logger = logger
+        self._running = {}  # (connection, request id): (command, endpoint, store call)
+
+    def started(self, event):
+        endpoint = request.endpoint if has_request_context() else None
+        self._running[(event.connection_id, event.request_id)] = (event.command, endpoint, current_store_call())
+
+    def succeeded(self, event):
+        self._finish(event, _returned_documents(event.reply))
+
+    def failed(self, event):
+        self._finish(event, 0)
+
+    def _finish(self, event, documents):
+        started = self._running.pop((event.connection_id, event.request_id), None)
+        if started is None or event.duration_micros < self._threshold_micros:
+            return
+        command, endpoint, (store, method) = started
+        self._logger.warning(json.dumps({
+            'time': time(),
+            'command': event.command_name,
+            'collection': _collection(command, event.command_name),
+            'shape': json.dumps(query_shape(_query(command, event.command_name)), sort_keys=True),
+            'milliseconds': round(event.duration_micros / 1000, 3),
+            'documents': documents,
+            'endpoint': endpoint,
+            'store_call': '{}.{}'.format(store, method) if store != 'none' else None,
+        }))
+
+
+def command_listeners(config) -> list:
+    # event listeners for MongoClient, empty if slow query log is disabled
+    if not config.getboolean('SlowQueries', 'enabled', fallback=False):
+        return []
+    return [SlowQueryListener(config.getfloat('SlowQueries', 'threshold_ms'), get_slow_query_logger(config))]
+
+
+def get_slow_query_logger(config):
+    # one rotating file handler per process, shared by the listeners of all clients
+    logger = logging.getLogger(LOGGER_NAME)
+    if not logger.handlers:
+        handler = RotatingFileHandler(
+            config.get('SlowQueries', 'log_file'), maxBytes=config.getint('SlowQueries', 'max_bytes'),
+            backupCount=config.getint('SlowQueries', 'backup_count'), delay=True
+        )
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.propagate = False
+    return logger
+
+
+def query_shape(query):
+    # query with values replaced by '?', keeping field names and operators
+    if query is None:
+        return None
+    if isinstance(query, dict):
+        return {key: query_shape(value) for key, value in query.items()}
+    if isinstance(query, (list, tuple)) and any(isinstance(element, (dict, list, tuple)) for element in query):
+        return [query_shape(element) for element in query]
+    return '?'
+
+
+def _collection(command, command_name):
+    if command_name in COLLECTION_KEYS:
+        return command.get('collection') if command_name == 'getMore' else command.get(command_name)
+    return None
+
+
+def _query(command, command_name):
+    if command_name == 'find':
+        return command.get('filter', {})
+    if command_name in ('count', 'distinct', 'findAndModify'):
+        return command.get('query', {})
+    if command_name == 'aggregate':
+        return command.get('pipeline', [])
+    if command_name == 'update':
+        return [update.get('q', {}) for update in command.get('updates', [])]
+    if command_name == 'delete':
+        return [delete.get('q', {}) for delete in command.get('deletes', [])]
+    return None
+
+
+def _returned_documents(reply):
+    if 'cursor' in reply:
+        return len(reply['cursor'].get('firstBatch', reply['cursor'].get('nextBatch', [])))
+    if 'value' in reply:
+        return 0 if reply['value'] is None else 1
+    if 'values' in reply:
+        return len(reply['values'])
+    return reply.get('n', 0)
@@ -0,0 +1,49 @@
+'''
+Tracks the public store method running on each thread, so mongo command listeners can attribute commands to it.
+'''
+import inspect
+import threading
+from functools import wraps
+
+NO_CALL = ('none', 'none')
+
+_current_call = threading.local()
+
+
+def current_store_call():
+    # (store, method) of innermost store call of this thread
+    return getattr(_current_call, 'value', NO_CALL)
+
+
+def enter_store_call(call):
+    # returns the outer call, to be passed to exit_store_call
+    outer_call = getattr(_current_call, 'value', NO_CALL)
+    _current_call.value = call
+    return outer_call
+
+
+def exit_store_call(outer_call):
+    _current_call.value = outer_call
+
+
+def public_methods(store):
+    return [name for name, _ in inspect.getmembers(type(store), inspect.isfunction) if not name.startswith('_')]
+
+
+def track_store_calls(store, store_name):
+    # replace public methods of store instance by versions setting the current store call, all references to store see them
+    for name in public_methods(store):
+        setattr(store, name, _tracked_method((store_name, name), getattr(store, name)))
+    return store
+
+
+def _tracked_method(call, method):
+    @wraps(method)
+    def tracked(*args, **kwargs):
+        outer_call = enter_store_call(call)
+        try:
+            return method(*args, **kwargs)
+        finally:
+            exit_store_call(outer_call)
+
+    return tracked
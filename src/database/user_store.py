@@ -1,10 +1,15 @@
 from typing import List, Union
 
+from flask import current_app, g, has_request_context
 from flask_login import UserMixin
 from flask_security.utils import verify_password, hash_password
 from passlib.context import CryptContext
-from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
 
+from database.cache import LruCache
+from database.client import get_client
+from database.hashing import HashingPool
+from database.indexes import USER_INDEXES, ensure_indexes
 from database.mett_store import StorageException
 from collections import namedtuple
 
@@ -23,13 +28,30 @@ class SecurityUser(UserMixin):
 class UserRoleDatabase:
     # FIXME UseEverywhere
 
-    def __init__(self, config):
+    def __init__(self, config, initialize=True):
         self._config = config
 
-        self._client = MongoClient(
-            'mongodb://{}:{}'.format(self._config.get('Database', 'mongo_server'), self._config.get('Database', 'mongo_port')),
-            connect=False
+        self.reconnect()
+
+        loader_cache_ttl = self._config.getfloat('User', 'loader_cache_ttl', fallback=0.0)
+        self._user_cache = LruCache(self._config.getint('User', 'loader_cache_size', fallback=128) if loader_cache_ttl > 0 else 0, ttl=loader_cache_ttl)
+        self._request_hits = 0
+
+        self.hashing_pool = HashingPool(
+            workers=self._config.getint('User', 'hashing_workers', fallback=2),
+            queue_size=self._config.getint('User', 'hashing_queue', fallback=8),
+            timeout=self._config.getfloat('User', 'hashing_timeout', fallback=10.0)
         )
+
+        if initialize:
+            self.initialize()
+
+    def initialize(self):
+        ensure_indexes(self._mett_base, USER_INDEXES)
+
+    def reconnect(self):
+        # (re)bind collections to the shared client, e.g. after fork
+        self._client = get_client(self._config)
         self._mett_base = self._client[self._config.get('Database', 'main_database')]
 
         self._user = self._mett_base.user
@@ -43,14 +65,20 @@ class UserRoleDatabase:
 
     def password_is_correct(self, user_name, password):
         stored_password = self.get_user(user_name, throw=True).password
-        return verify_password(password, stored_password)
+        return self.verify_password(password, stored_password)
+
+    def verify_password(self, password, stored_password):
+        return self.hashing_pool.run(_in_app_context(verify_password), password, stored_password)
+
+    def _hash_password(self, password):
+        return self.hashing_pool.run(_in_app_context(hash_password), password)
 
     def change_password(self, user_name, password):
-        if not self.user_exists(user_name):
-            raise StorageException('User does not exist')
         if not password_is_legal(password):
             raise StorageException('Illegal password. Ask admin for password rules.')
-        self._user.update_one({'name': user_name}, {'$set': {'password': hash_password(password)}})
+        if not self._user.update_one({'name': user_name}, {'$set': {'password': self._hash_password(password)}}).matched_count:
+            raise StorageException('User does not exist')
+        self._invalidate_user(user_name)
 
     def user_exists(self, user_name):
         return self._user.count_documents({'name': user_name}) == 1
@@ -59,38 +87,62 @@ class UserRoleDatabase:
         return self._role.count_documents({'name': role}) == 1
 
     def get_user(self, identifier: str, throw: bool = False) -> Union[SecurityUser, None]:
-        if not self.user_exists(identifier):
+        user = self._user.find_one({'name': identifier}, {'name': 1, 'password': 1, 'roles': 1})
+        if not user:
             if throw:
                 raise StorageException('User does not exist')
-            else:
-                return None
+            return None
 
-        user = self._user.find_one({'name': identifier})
         return SecurityUser(name=user['name'], password=user['password'], roles=user['roles'])
 
-    def find_user(self, id):
-        return self.get_user(id)
+    def find_user(self, id):  # pylint: disable=redefined-builtin
+        # user loader of flask-login: memoized per request and for loader_cache_ttl seconds across requests
+        # unknown users are not cached across requests, the user may be created by another worker meanwhile
+        request_memo = _get_request_memo()
+        if request_memo is not None and id in request_memo:
+            self._request_hits += 1
+            return request_memo[id]
+
+        found, user = self._user_cache.get(id)
+        if not found:
+            user = self.get_user(id)
+            if user is not None:
+                self._user_cache.put(id, user)
+        if request_memo is not None:
+            request_memo[id] = user
+        return user
+
+    def loader_cache_statistics(self):
+        statistics = self._user_cache.statistics.as_dict()
+        statistics['request_hits'] = self._request_hits
+        return statistics
+
+    def _invalidate_user(self, name):
+        self._user_cache.invalidate(name)
+        request_memo = _get_request_memo()
+        if request_memo is not None:
+            request_memo.pop(name, None)
 
     def find_role(self, role):
         raise NotImplementedError()
 
     def add_role_to_user(self, user, role):
-        if not self.user_exists(user) or not self.role_exists(role):
+        if not self.role_exists(role):
             raise StorageException('User or role does not exist')
-        roles = [role.name for role in self.get_user(user).roles]
-        if role in roles:
+        if not self._user.update_one({'name': user, 'roles': {'$ne': role}}, {'$addToSet': {'roles': role}}).matched_count:
+            if not self.user_exists(user):
+                raise StorageException('User or role does not exist')
             raise StorageException('User already has role')
-        roles.append(role)
-        self._user.update_one({'name': user}, {'$set': {'roles': roles}})
+        self._invalidate_user(user)
 
     def remove_role_from_user(self, user, role):
-        if not self.user_exists(user) or not self.role_exists(role):
+        if not self.role_exists(role):
             raise StorageException('User or role does not exist')
-        roles = [role.name for role in self.get_user(user).roles]
-        if role not in roles:
+        if not self._user.update_one({'name': user, 'roles': role}, {'$pull': {'roles': role}}).matched_count:
+            if not self.user_exists(user):
+                raise StorageException('User or role does not exist')
             raise StorageException('User doesn\'t have role')
-        roles.remove(role)
-        self._user.update_one({'name': user}, {'$set': {'roles': roles}})
+        self._invalidate_user(user)
 
     def toggle_active(self, user):
         raise NotImplementedError()
@@ -104,34 +156,63 @@ class UserRoleDatabase:
     def create_role(self, name, **kwargs):
         if kwargs:
             raise NotImplementedError('Other parameters than name, including {} not supported'.format(kwargs))
-        if self.role_exists(name):
+        try:
+            self._role.insert_one({'name': name})
+        except DuplicateKeyError:
             raise StorageException('Role already exists')
-        self._role.insert_one({'name': name})
 
     def find_or_create_role(self, name, **kwargs):
         raise NotImplementedError()
 
     def create_user(self, name: str, password: str, roles: List[str] = None, is_hashed: bool = False):
-        if self.user_exists(name):
-            raise StorageException('User already exists')
         if not is_hashed and not password_is_legal(password):
             raise StorageException('Illegal password. Ask admin for password rules.')
-        if roles and not all(self.role_exists(role) for role in roles):
+        if roles and self._role.count_documents({'name': {'$in': roles}}) < len(set(roles)):
             raise StorageException('Not all roles in {} exist'.format(roles))
-        self._user.insert_one({'name': name, 'password': password if is_hashed else hash_password(password), 'roles': roles if roles else []})
+        try:
+            self._user.insert_one({'name': name, 'password': password if is_hashed else self._hash_password(password), 'roles': roles if roles else []})
+        except DuplicateKeyError:
+            raise StorageException('User already exists')
+        self._invalidate_user(name)
+
+    def put(self, user: SecurityUser):
+        # store password of user, flask-security calls this when rehashing a deprecated hash on login
+        self._user.update_one({'name': user.name}, {'$set': {'password': user.password}})
+        self._invalidate_user(user.name)
+        return user
 
     def delete_user(self, user: str):
-        if not self.user_exists(user):
+        if not self._user.delete_one({'name': user}).deleted_count:
             raise StorageException('User does not exist')
-        self._user.delete_one({'name': user})
+        self._invalidate_user(user)
 
     def commit(self):
         pass
 
 
+def _get_request_memo():
+    # dictionary living as long as the current request, None outside of requests
+    if not has_request_context():
+        return None
+    if '_user_loader_memo' not in g:
+        g._user_loader_memo = {}  # pylint: disable=protected-access,assigning-non-slot
+    return g._user_loader_memo  # pylint: disable=protected-access
+
+
+def _in_app_context(function):
+    # flask-security reads its hashing configuration from the app, so hand it to the hashing thread
+    app = current_app._get_current_object()  # pylint: disable=protected-access
+
+    def run_in_app_context(*args):
+        with app.app_context():
+            return function(*args)
+    return run_in_app_context
+
+
+_PASSWORD_SCHEMES = CryptContext(schemes=['bcrypt', 'des_crypt', 'pbkdf2_sha256', 'pbkdf2_sha512', 'sha256_crypt', 'sha512_crypt', 'plaintext'])
+
+
 def password_is_legal(password: str) -> bool:
     if not password:
         return False
-    schemes = ['bcrypt', 'des_crypt', 'pbkdf2_sha256', 'pbkdf2_sha512', 'sha256_crypt', 'sha512_crypt', 'plaintext']
-    ctx = CryptContext(schemes=schemes)
-    return ctx.identify(password) == 'plaintext'
+    return _PASSWORD_SCHEMES.identify(password) == 'plaintext'
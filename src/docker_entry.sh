@@ -4,6 +4,8 @@ mkdir -p /data/mett/mett_store || true
 
 mongod --fork --syslog --config config/mongo.config
 python3 create_initial_user.py
+python3 precompile_templates.py || exit 1
+rm -rf /tmp/mett_metrics && mkdir -p /tmp/mett_metrics
 uwsgi --ini config/proxy.config
 
 exit 0
@@ -0,0 +1,35 @@
+import argparse
+import sys
+from configparser import ConfigParser
+from pathlib import Path
+
+from app.app_setup import create_template_app
+from app.template_cache import compile_templates
+
+
+def precompile_templates(app):
+    # compile every template into the bytecode cache, returns 1 if any template has a syntax error
+    # app only needs templates and filters (see create_template_app), so this runs without database, e.g. in docker build
+    count, errors = compile_templates(app)
+    for template, error in errors:
+        print('[Error] {} line {}: {}'.format(template, error.lineno, error.message))
+    cache = app.jinja_env.bytecode_cache
+    print('[Templates] {} of {} templates compiled{}'.format(
+        count - len(errors), count, ' into {}'.format(cache.directory) if cache is not None else ' (no bytecode cache configured)'
+    ))
+    return 1 if errors else 0
+
+
+def _parse_arguments():
+    parser = argparse.ArgumentParser(description='Compile all templates into the bytecode cache, fails on syntax errors')
+    parser.add_argument('--cache-dir', help='bytecode cache directory, defaults to bytecode_cache of Templates section in app.config')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    ARGS = _parse_arguments()
+    CONFIG = ConfigParser()
+    CONFIG.read(str(Path(Path(__file__).parent, 'config', 'app.config')))
+    if ARGS.cache_dir:
+        CONFIG.set('Templates', 'bytecode_cache', ARGS.cache_dir)
+    sys.exit(precompile_templates(create_template_app(CONFIG)))
@@ -0,0 +1,12 @@
+import sys
+
+from app.app_setup import AppSetup
+
+
+def rebuild_history(app_setup):
+    app_setup.mett_store.rebuild_order_history()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(rebuild_history(AppSetup()))
@@ -0,0 +1,28 @@
+import argparse
+import sys
+from time import perf_counter
+
+from app.app_setup import AppSetup
+from database.reconciliation import BalanceReconciliation
+
+
+def reconcile_balances(app_setup, full=False, tolerance=0.005):
+    started = perf_counter()
+    drifts = [drift for drift in BalanceReconciliation(app_setup.mett_store).run(full=full) if abs(drift.drift) > tolerance]
+
+    for drift in sorted(drifts, key=lambda entry: abs(entry.drift), reverse=True):
+        print('[Drift] {:<30} balance {:>10.2f}   expected {:>10.2f}   drift {:>+10.2f}'.format(drift.account, drift.balance, drift.expected, drift.drift))
+    print('[Reconcile] {} accounts with drift ({:.2f} s)'.format(len(drifts), perf_counter() - started))
+    return 1 if drifts else 0
+
+
+def _parse_arguments():
+    parser = argparse.ArgumentParser(description='Compare account balances with deposits, authorized purchases and charges')
+    parser.add_argument('--full', action='store_true', help='recompute from all records instead of the checkpoint, orders processed before charges were recorded show as drift')
+    parser.add_argument('--tolerance', type=float, default=0.005, help='drift below this amount is ignored')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    ARGS = _parse_arguments()
+    sys.exit(reconcile_balances(AppSetup(), full=ARGS.full, tolerance=ARGS.tolerance))
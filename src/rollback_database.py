@@ -1,11 +1,18 @@
+import argparse
 import json
 import sys
+from itertools import groupby, islice
+from operator import itemgetter
 from pathlib import Path
+from time import perf_counter
 
 from bson import ObjectId
 from flask import Flask
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
 from app.app_setup import AppSetup
+from database.backup_stream import backup_format, read_documents, read_header
 from database.mett_store import MettStore, StorageException
 from database.user_store import UserRoleDatabase
 
@@ -37,8 +44,9 @@ def restore_accounts(user_interface: UserRoleDatabase, mett_store: MettStore, ap
             user_interface.create_user(name=name, password=password, roles=roles, is_hashed=True)
 
     for account in accounts:
+        # balance is set directly, like in StreamRestore: deposits of the backup are restored as well, a deposit here would count them twice
         mett_store.create_account(account['name'])
-        mett_store.change_balance(account['name'], account['balance'], 'rollback')
+        mett_store._account.update_one({'name': account['name']}, {'$set': {'balance': account['balance']}})  # pylint: disable=protected-access
 
 
 def restore_buns(mett_store: MettStore, buns: list):
@@ -48,40 +56,48 @@ def restore_buns(mett_store: MettStore, buns: list):
 
 
 def restore_orders(mett_store: MettStore, orders: list, accounts: list, buns: list):
+    account_names = {account['_id']: account['name'] for account in accounts}
+    bun_classes = {bun['_id']: bun['bun_class'] for bun in buns}
     for order in orders:
         if _is_old_database_order(order):
-            _restore_old_order(mett_store, order, accounts, buns)
+            _restore_old_order(mett_store, order, account_names, bun_classes)
         else:
             _restore_new_order(mett_store, order)
 
 
 def _restore_new_order(mett_store, order):
     order.pop('_id')
+    order.pop('bun_count', None)  # counters are rebuilt from orders on first access
     mett_store._order.insert_one(order)  # pylint: disable=protected-access
 
 
-def _restore_old_order(mett_store, order, accounts, buns):
+def _restore_old_order(mett_store, order, account_names, bun_classes):
     order.pop('_id')
+    _resolve_old_order(order, account_names, bun_classes)
+    mett_store._order.insert_one(order)  # pylint: disable=protected-access
+
+
+def _resolve_old_order(order, account_names, bun_classes):
     order['orders'] = [
         [
-            _replace_id_by_value(user_id, accounts, 'name'),
-            _replace_id_by_value(bun_id, buns, 'bun_class')
+            _replace_id_by_value(user_id, account_names, 'name'),
+            _replace_id_by_value(bun_id, bun_classes, 'bun_class')
         ] for user_id, bun_id in order['orders']
     ]
-    mett_store._order.insert_one(order)  # pylint: disable=protected-access
 
 
-def _replace_id_by_value(original, reference_list, key):
-    for reference in reference_list:
-        if reference['_id'] == original:
-            return reference[key]
-    raise ValueError('Could not match all {}s'.format(key))
+def _replace_id_by_value(original, lookup: dict, key):
+    try:
+        return lookup[original]
+    except KeyError:
+        raise ValueError('Could not match all {}s'.format(key))
 
 
 def _is_old_database_order(order):
     if not order['orders']:
         return False
-    return order['orders'][0][0].startswith('ObjectId')
+    user_id = order['orders'][0][0]
+    return isinstance(user_id, ObjectId) or user_id.startswith('ObjectId')
 
 
 def restore_purchases_and_deposits(mett_store: MettStore, deposits: list, purchases: list):
@@ -95,6 +111,10 @@ def restore_purchases_and_deposits(mett_store: MettStore, deposits: list, purcha
 
 def format_purchase(purchase):
     purchase.pop('_id')
+    return _convert_processed(purchase)
+
+
+def _convert_processed(purchase):
     if isinstance(purchase['processed'], bool):
         purchase['processed'] = {
             'authorized': purchase['processed'],
@@ -104,7 +124,136 @@ def format_purchase(purchase):
     return purchase
 
 
-def rollback(mett_store, user_store, app):
+def _batches(iterable, size):
+    # lists of up to size consecutive elements of iterable
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+class StreamRestore:
+    '''
+    Restores a streamed backup (see backup_database.py --stream) into an empty database, followed by any number of increments.
+    Documents are parsed one line at a time and written with insert_many in batches of batch_size, keeping their _id.
+    '''
+
+    def __init__(self, mett_store: MettStore, user_store: UserRoleDatabase, app: Flask, batch_size=1000, report=print):
+        self._mett_store = mett_store
+        self._user_store = user_store
+        self._app = app
+        self._batch_size = batch_size
+        self._report = report
+
+        self._account_names, self._bun_classes = {}, {}
+        self.rows, self._started = 0, None
+        self._handlers = {
+            'auth.role': self._restore_roles,
+            'auth.user': self._restore_users,
+            'mett.account': self._restore_accounts,
+            'mett.bun': self._restore_buns,
+            'mett.order': self._restore_orders,
+            'mett.purchases': self._restore_purchases,
+            'mett.deposit': self._restore_deposits,
+            'mett.charge': self._restore_charges,
+            'changes': self._apply_changes,
+        }
+
+    def restore(self, path) -> int:
+        if self._started is None:
+            self._started = perf_counter()
+        for section, entries in groupby(read_documents(path), key=itemgetter(0)):
+            if section not in self._handlers:
+                self._report('[Warning] Skipping unknown section {}'.format(section))
+                continue
+            for batch in _batches((document for _, document in entries), self._batch_size):
+                self._write(self._handlers[section], batch)
+                self.rows += len(batch)
+                self._report('[Restore] {}: {} rows ({:.0f} rows/s)'.format(section, self.rows, self.rows_per_second))
+        return self.rows
+
+    def restore_increment(self, path) -> int:
+        # increments contain all users and roles, so they replace the restored ones
+        self._user_store._user.delete_many({})  # pylint: disable=protected-access
+        self._user_store._role.delete_many({})  # pylint: disable=protected-access
+        return self.restore(path)
+
+    def finish(self):
+        self._mett_store.rebuild_order_history()
+        self._mett_store._bump_version('order', 'price')  # pylint: disable=protected-access
+
+    @property
+    def rows_per_second(self) -> float:
+        elapsed = perf_counter() - self._started
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    @staticmethod
+    def _write(handler, batch):
+        try:
+            handler(batch)
+        except BulkWriteError as exc:
+            raise StorageException('Could not restore batch: {}'.format(exc.details['writeErrors'][0]['errmsg']))
+
+    def _restore_roles(self, roles):
+        for role in roles:
+            self._user_store.create_role(name=role['name'])
+
+    def _restore_users(self, users):
+        with self._app.app_context():
+            for user in users:
+                self._user_store.create_user(name=user['name'], password=user['password'], roles=user['roles'], is_hashed=True)
+
+    def _restore_accounts(self, accounts):
+        self._account_names.update((account['_id'], account['name']) for account in accounts)
+        self._mett_store._account.insert_many(accounts)  # pylint: disable=protected-access
+
+    def _restore_buns(self, buns):
+        # default bun classes exist from store initialization, so buns are upserted by class
+        self._bun_classes.update((bun['_id'], bun['bun_class']) for bun in buns)
+        self._mett_store._buns.bulk_write([  # pylint: disable=protected-access
+            UpdateOne({'bun_class': bun['bun_class']}, {'$set': {'price': bun['price'], 'mett': bun['mett']}, '$setOnInsert': {'_id': bun['_id']}}, upsert=True)
+            for bun in buns
+        ])
+
+    def _restore_orders(self, orders):
+        for order in orders:
+            order.pop('bun_count', None)  # counters are rebuilt from orders on first access
+            if _is_old_database_order(order):
+                _resolve_old_order(order, self._account_names, self._bun_classes)
+        self._mett_store._order.insert_many(orders)  # pylint: disable=protected-access
+
+    def _restore_purchases(self, purchases):
+        self._mett_store._purchase.insert_many([_convert_processed(purchase) for purchase in purchases])  # pylint: disable=protected-access
+
+    def _restore_deposits(self, deposits):
+        self._mett_store._deposit.insert_many(deposits)  # pylint: disable=protected-access
+
+    def _restore_charges(self, charges):
+        self._mett_store._charge.insert_many(charges)  # pylint: disable=protected-access
+
+    def _apply_changes(self, changes):
+        # replace all documents matching the key of each change by the documents it holds (none if they were deleted)
+        # pylint: disable=protected-access
+        collections = {
+            'mett.account': self._mett_store._account,
+            'mett.bun': self._mett_store._buns,
+            'mett.order': self._mett_store._order,
+            'mett.purchases': self._mett_store._purchase,
+            'mett.deposit': self._mett_store._deposit,
+            'mett.charge': self._mett_store._charge,
+        }
+        for change in changes:
+            collections[change['section']].delete_many(change['key'])
+            if change['section'] == 'mett.order':
+                self._mett_store._order_count.delete_many({'order': change['key']['_id']})
+                for order in change['documents']:
+                    order.pop('bun_count', None)
+            if change['documents']:
+                collections[change['section']].insert_many(change['documents'])
+
+
+def rollback(mett_store, user_store, app, path='mett.backup.json'):
     '''
     Structure
     {
@@ -122,7 +271,7 @@ def rollback(mett_store, user_store, app):
     }
     '''
 
-    backup_json = Path('mett.backup.json').read_bytes()
+    backup_json = Path(path).read_bytes()
     backup_data = json.loads(backup_json)
 
     try:
@@ -131,6 +280,7 @@ def rollback(mett_store, user_store, app):
         restore_buns(mett_store, backup_data['mett']['bun'])
         restore_orders(mett_store, backup_data['mett']['order'], backup_data['mett']['account'], backup_data['mett']['bun'])
         restore_purchases_and_deposits(mett_store, backup_data['mett']['deposit'], backup_data['mett']['purchases'])
+        mett_store.rebuild_order_history()
     except StorageException as exception:
         print(
             '[Error] {}. It seems you are trying to rollback into a none empty database. '
@@ -138,10 +288,55 @@ def rollback(mett_store, user_store, app):
         )
 
 
-def setup_rollback(app):
-    rollback(app.mett_store, app.user_interface, app.app)
+def stream_rollback(mett_store, user_store, app, path, increments=(), batch_size=1000):
+    restore = StreamRestore(mett_store, user_store, app, batch_size=batch_size)
+    try:
+        check_backup_chain(path, increments)
+        rows = restore.restore(path)
+        for increment in increments:
+            rows = restore.restore_increment(increment)
+        restore.finish()
+    except ValueError as exception:
+        error(exception)
+        return
+    except StorageException as exception:
+        print(
+            '[Error] {}. It seems you are trying to rollback into a none empty database. '
+            'That\'s foolish, so we don\'t support it.'.format(exception)
+        )
+        return
+    print('[Restore] Restored {} rows ({:.0f} rows/s)'.format(rows, restore.rows_per_second))
+
+
+def check_backup_chain(path, increments):
+    # each increment has to be written relative to the backup before it
+    previous = read_header(path).get('id')
+    for increment in increments:
+        header = read_header(increment)
+        if header.get('type') != 'increment' or previous is None or header['parent'] != previous:
+            raise ValueError('{} does not continue the previous backup'.format(increment))
+        previous = header['id']
+
+
+def setup_rollback(app, path='mett.backup.json', increments=(), batch_size=1000):
+    if backup_format(path) != 'json':
+        stream_rollback(app.mett_store, app.user_interface, app.app, path, increments, batch_size)
+    elif increments:
+        error('Increments can only be applied to streamed backups')
+        return 1
+    else:
+        rollback(app.mett_store, app.user_interface, app.app, path)
     return 0
 
 
+def _parse_arguments():
+    parser = argparse.ArgumentParser(description='Restore mett and user database from backup')
+    parser.add_argument('input', nargs='?', default='mett.backup.json', help='backup file, json, ndjson or bson (format and compression are detected)')
+    parser.add_argument('increments', nargs='*', help='incremental backups to apply afterwards, oldest first')
+    parser.add_argument('--batch-size', type=int, default=1000, help='documents written per database round trip (streamed backups)')
+    return parser.parse_args()
+
+
 if __name__ == '__main__':
-    sys.exit(setup_rollback(AppSetup()))
+    ARGS = _parse_arguments()
+    sys.exit(setup_rollback(AppSetup(), path=ARGS.input, increments=ARGS.increments, batch_size=ARGS.batch_size))
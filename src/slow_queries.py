@@ -0,0 +1,77 @@
+import argparse
+import json
+import sys
+from collections import Counter, namedtuple
+from configparser import ConfigParser
+from pathlib import Path
+
+QueryShape = namedtuple('QueryShape', ['command', 'collection', 'shape', 'count', 'total_ms', 'max_ms', 'documents', 'endpoints', 'store_calls'])
+
+
+def read_entries(log_file):
+    # entries of log file and its rotated backups (log_file.1, log_file.2, ...), unparsable lines are skipped
+    log_file = Path(log_file)
+    backups = [path for path in log_file.parent.glob('{}.*'.format(log_file.name)) if path.suffix[1:].isdigit()]
+    for path in sorted(backups, key=lambda path: int(path.suffix[1:]), reverse=True) + [log_file]:  # oldest first
+        if not path.is_file():
+            continue
+        with path.open() as log:
+            for line in log:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def summarize(entries):
+    # one QueryShape per (command, collection, shape), worst total time first
+    groups = {}
+    for entry in entries:
+        groups.setdefault((entry['command'], entry['collection'], entry['shape']), []).append(entry)
+    summary = [
+        QueryShape(
+            command, collection, shape, len(group), sum(entry['milliseconds'] for entry in group), max(entry['milliseconds'] for entry in group),
+            sum(entry['documents'] for entry in group), Counter(entry['endpoint'] for entry in group), Counter(entry['store_call'] for entry in group)
+        )
+        for (command, collection, shape), group in groups.items()
+    ]
+    return sorted(summary, key=lambda query: query.total_ms, reverse=True)
+
+
+def print_summary(summary, top):
+    for query in summary[:top]:
+        print('[{:.1f} ms] {} x {} {} {}'.format(query.total_ms, query.count, query.command, query.collection, query.shape))
+        print('    mean {:.1f} ms, max {:.1f} ms, {:.1f} documents returned'.format(query.total_ms / query.count, query.max_ms, query.documents / query.count))
+        print('    endpoints:   {}'.format(_most_common(query.endpoints)))
+        print('    store calls: {}'.format(_most_common(query.store_calls)))
+
+
+def _most_common(counter, number=3):
+    return ', '.join('{} ({})'.format(name, count) for name, count in counter.most_common(number))
+
+
+def _parse_arguments():
+    parser = argparse.ArgumentParser(description='Rank query shapes of the slow query log by total time')
+    parser.add_argument('log_file', nargs='?', help='slow query log, defaults to log_file of SlowQueries section in app.config')
+    parser.add_argument('--top', type=int, default=10, help='number of query shapes to show')
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_arguments()
+    log_file = args.log_file
+    if not log_file:
+        config = ConfigParser()
+        config.read(str(Path(Path(__file__).parent, 'config', 'app.config')))
+        log_file = config.get('SlowQueries', 'log_file')
+
+    summary = summarize(read_entries(log_file))
+    if not summary:
+        print('[Warning] No slow queries in {}'.format(log_file))
+        return 0
+    print_summary(summary, args.top)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
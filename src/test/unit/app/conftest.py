@@ -1,14 +1,11 @@
 import pytest
-from mongomock import MongoClient  # pylint: disable=import-error
 
 from app.app_setup import AppSetup
 from test.unit.common import config_for_tests, MockUser  # pylint: disable=wrong-import-order
 
 
 @pytest.fixture(scope='function')
-def app_fixture(tmpdir, monkeypatch):
-    monkeypatch.setattr('database.mett_store.MongoClient', MongoClient)
-    monkeypatch.setattr('database.user_store.MongoClient', MongoClient)
+def app_fixture(tmpdir):
     return AppSetup(config=config_for_tests(tmpdir))
 
 
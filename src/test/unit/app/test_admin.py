@@ -61,6 +61,7 @@ def test_close_order(mock_app, app_fixture):
     assert app_fixture.mett_store.active_order_exists()
     response = mock_app.get('/admin/close_order')
     assert response.status_code == 200
+    assert b'Charged 0.00 $ from 0 accounts' in response.data
     assert not app_fixture.mett_store.active_order_exists()
 
 
@@ -134,3 +135,13 @@ def test_authorize_purchase(mock_app, app_fixture):
     assert app_fixture.mett_store.get_account_information(MockUser.name)['balance'] == 1.23
     assert b'table-success' in mock_app.get('/admin/purchase').data
     assert b'table-danger' not in mock_app.get('/admin/purchase').data
+
+
+def test_store_stats(mock_app, app_fixture):
+    app_fixture.mett_store.create_account(MockUser.name)
+    app_fixture.mett_store.change_balance(MockUser.name, 4.5, 'admin')
+    app_fixture.mett_store.state_purchase(MockUser.name, 1.5, 'testing purposes')
+
+    response = mock_app.get('/admin')
+    assert b'<td>4.5 $</td>' in response.data
+    assert b'<td>3.0 $</td>' in response.data
@@ -0,0 +1,51 @@
+import pytest
+
+from app.app_setup import AppSetup
+from database.mett_store import StorageException
+from test.unit.common import config_for_tests
+
+
+def _deferred_setup(tmpdir, prewarm):
+    config = config_for_tests(tmpdir)
+    config.set('Startup', 'defer_initialization', 'true')
+    config.set('Startup', 'prewarm', 'true' if prewarm else 'false')
+    config.set('Cache', 'size', '16')
+    return AppSetup(config, serving=True)
+
+
+def test_deferred_initialization(tmpdir):
+    app_setup = _deferred_setup(tmpdir, prewarm=False)
+    assert app_setup.mett_store._buns.count_documents({}) == 0
+    assert app_setup.user_interface._user.index_information().keys() == set()
+
+    app_setup.prepare_worker()  # on every fork, no database setup
+    assert app_setup.mett_store._buns.count_documents({}) == 0
+
+    app_setup.initialize()
+    assert app_setup.mett_store.list_bun_classes() == ['Weizen', 'Roggen', 'Roeggelchen']
+    assert 'unique_user_name' in app_setup.user_interface._user.index_information()
+    assert app_setup.mett_store.cache_statistics()['hits'] == 0
+
+
+def test_prewarm(tmpdir):
+    app_setup = _deferred_setup(tmpdir, prewarm=True)
+    app_setup.initialize()
+    app_setup.prepare_worker()
+
+    app_setup.mett_store.list_bun_classes_with_price()
+    assert app_setup.mett_store.cache_statistics()['hits'] == 1
+    assert 'macros/cards.html' in [name for _, name in app_setup.app.jinja_env.cache.keys()]
+
+
+def test_tools_initialize_with_shipped_config(tmpdir):
+    config = config_for_tests(tmpdir)
+    assert config.getboolean('Startup', 'defer_initialization')  # as shipped in app.config
+
+    app_setup = AppSetup(config)
+    assert app_setup.mett_store.list_bun_classes() == ['Weizen', 'Roggen', 'Roeggelchen']
+    assert 'unique_account_name' in app_setup.mett_store._account.index_information()
+    assert 'unique_user_name' in app_setup.user_interface._user.index_information()
+
+    app_setup.mett_store.create_account('dup')
+    with pytest.raises(StorageException):
+        app_setup.mett_store.create_account('dup')
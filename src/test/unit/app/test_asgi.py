@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app.asgi import AsgiApp, build_environ
+from test.unit.common import HAS_NOT_EXPIRED, MockUser
+
+
+@pytest.fixture(scope='function', autouse=True)
+def patch_current_user(monkeypatch):
+    monkeypatch.setattr('app.asgi.current_user', MockUser())
+    monkeypatch.setattr('app.orders.current_user', MockUser())
+    monkeypatch.setattr('app.dashboard.current_user', MockUser())
+
+
+@pytest.fixture(scope='function')
+def asgi_app(mock_app, app_fixture):  # pylint: disable=unused-argument
+    app_fixture.mett_store.create_account(MockUser.name)
+    return AsgiApp(app_fixture)
+
+
+def _request(asgi_app, method, path, body=b'', headers=()):
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'headers': list(headers), 'server': ('localhost', 5000)}
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi_app(scope, receive, send))
+    return sent[0]['status'], dict(sent[0]['headers']), sent[1]['body']
+
+
+def test_dashboard(asgi_app, mock_app):
+    status, headers, body = _request(asgi_app, 'GET', '/')
+    assert status == 200
+    assert headers[b'content-type'].startswith(b'text/html')
+    assert body == mock_app.get('/').data
+
+
+def test_hot_routes_are_measured(asgi_app):
+    labels = {'endpoint': '', 'method': 'GET', 'status': '200'}
+    before = REGISTRY.get_sample_value('mett_request_seconds_count', labels) or 0.0
+    _request(asgi_app, 'GET', '/')
+    assert REGISTRY.get_sample_value('mett_request_seconds_count', labels) == before + 1
+
+
+def test_order_page(asgi_app, app_fixture, mock_app):
+    status, _, body = _request(asgi_app, 'GET', '/order')
+    assert status == 200
+    assert b'There is no current order!' in body
+
+    app_fixture.mett_store.create_order(HAS_NOT_EXPIRED)
+    _, _, body = _request(asgi_app, 'GET', '/order')
+    assert b'132.0 g of mett' in body
+    assert body == mock_app.get('/order').data
+
+
+def test_other_requests_use_wsgi_app(asgi_app, app_fixture):
+    app_fixture.mett_store.create_order(HAS_NOT_EXPIRED)
+    status, headers, _ = _request(
+        asgi_app, 'POST', '/order', body=b'orderAmount=2&orderClass=Weizen', headers=[(b'content-type', b'application/x-www-form-urlencoded')]
+    )
+    assert status == 302
+    assert headers[b'location'].endswith(b'/')
+    assert app_fixture.mett_store.get_current_user_buns(MockUser.name)['Weizen'] == 2
+
+    status, _, _ = _request(asgi_app, 'GET', '/unknown')
+    assert status == 404
+
+
+def test_lifespan(asgi_app):
+    messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message['type'])
+
+    asyncio.run(asgi_app({'type': 'lifespan'}, receive, send))
+    assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+
+
+def test_build_environ():
+    scope = {'method': 'GET', 'path': '/order', 'query_string': b'a=1', 'headers': [(b'cookie', b'a=1'), (b'cookie', b'b=2'), (b'content-type', b'text/plain')]}
+    environ = build_environ(scope, b'')
+    assert environ['QUERY_STRING'] == 'a=1'
+    assert environ['HTTP_COOKIE'] == 'a=1,b=2'
+    assert environ['CONTENT_TYPE'] == 'text/plain'
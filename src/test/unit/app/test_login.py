@@ -0,0 +1,54 @@
+import pytest
+from flask_security.utils import get_hmac
+
+from database.hashing import HashingError
+from database.user_store import SecurityUser
+from test.unit.common import MockUser
+
+
+@pytest.fixture(scope='function')
+def login_client(mock_app, app_fixture):
+    app_fixture.app.config['WTF_CSRF_ENABLED'] = False
+    return mock_app
+
+
+def test_login(login_client):
+    response = login_client.post('/login', data={'email': MockUser.name, 'password': MockUser.password})
+    assert response.status_code == 302
+
+
+def test_login_wrong_password(login_client):
+    response = login_client.post('/login', data={'email': MockUser.name, 'password': 'wrong_password'})
+    assert b'Invalid password' in response.data
+
+
+def test_login_hashing_overloaded(login_client, app_fixture, monkeypatch):
+    def overloaded(*_):
+        raise HashingError('Too many concurrent password operations. Please try again.')
+    monkeypatch.setattr(app_fixture.user_interface.hashing_pool, 'run', overloaded)
+
+    response = login_client.post('/login', data={'email': MockUser.name, 'password': MockUser.password})
+    assert b'Too many concurrent password operations' in response.data
+
+
+def test_login_disabled_account(login_client, monkeypatch):
+    monkeypatch.setattr(SecurityUser, 'is_active', property(lambda self: False))
+    response = login_client.post('/login', data={'email': MockUser.name, 'password': MockUser.password})
+    assert b'Account is disabled' in response.data
+
+
+def test_login_requires_confirmation(login_client, monkeypatch):
+    monkeypatch.setattr('flask_security.forms.requires_confirmation', lambda user: True)
+    response = login_client.post('/login', data={'email': MockUser.name, 'password': MockUser.password})
+    assert b'Email requires confirmation' in response.data
+
+
+def test_login_upgrades_deprecated_hash(login_client, app_fixture):
+    with app_fixture.app.app_context():
+        security = app_fixture.app.extensions['security']
+        legacy_hash = security.pwd_context.handler('pbkdf2_sha256').hash(get_hmac('legacy_password'))
+    app_fixture.user_interface.create_user('legacy', legacy_hash, is_hashed=True)
+
+    response = login_client.post('/login', data={'email': 'legacy', 'password': 'legacy_password'})
+    assert response.status_code == 302
+    assert app_fixture.user_interface.get_user('legacy').password.startswith('$2b$')  # rehashed with bcrypt
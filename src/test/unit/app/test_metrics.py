@@ -0,0 +1,97 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app.metrics import CommandCounter, instrument_store
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class _Store:
+    def __init__(self, listener):
+        self._listener = listener
+
+    def find(self, value):
+        self._listener.started(SimpleNamespace(command_name='find'))
+        return value
+
+    def nested(self):
+        self._listener.started(SimpleNamespace(command_name='update'))
+        return self.find('inner')
+
+    def fail(self):
+        raise ValueError('failed')
+
+    def _private(self):
+        return 'private'
+
+
+def test_metrics_endpoint(mock_app):
+    before = _sample('mett_request_seconds_count', endpoint='user', method='GET', status='200')
+    assert mock_app.get('/user').status_code == 200
+
+    response = mock_app.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain')
+    assert b'mett_request_seconds_bucket{' in response.data
+    assert b'mett_store_call_seconds_count{method="list_accounts",store="mett_store"}' in response.data
+    assert _sample('mett_request_seconds_count', endpoint='user', method='GET', status='200') == before + 1
+
+
+def test_store_methods_are_instrumented(app_fixture):
+    before = _sample('mett_store_call_seconds_count', store='mett_store', method='list_bun_classes')
+    app_fixture.mett_store.list_bun_classes()
+    assert _sample('mett_store_call_seconds_count', store='mett_store', method='list_bun_classes') == before + 1
+
+
+def test_instrument_store():
+    store = _Store(CommandCounter())
+    instrument_store(store, 'test_store')
+
+    assert store.find('value') == 'value'
+    assert store.nested() == 'inner'
+    with pytest.raises(ValueError):
+        store.fail()
+
+    assert _sample('mett_store_call_seconds_count', store='test_store', method='find') == 2
+    assert _sample('mett_store_call_errors_total', store='test_store', method='fail') == 1
+    assert _sample('mett_mongo_commands_total', store='test_store', method='find', command='find') == 2
+    assert _sample('mett_mongo_commands_total', store='test_store', method='nested', command='update') == 1
+    assert '_private' not in vars(store)
+
+
+def test_commands_outside_store_calls():
+    before = _sample('mett_mongo_commands_total', store='none', method='none', command='ping')
+    CommandCounter().started(SimpleNamespace(command_name='ping'))
+    assert _sample('mett_mongo_commands_total', store='none', method='none', command='ping') == before + 1
+
+
+SCRIPT = '''
+from flask import Flask
+from app.metrics import REQUEST_SECONDS, MetricsRoutes
+REQUEST_SECONDS.labels('user', 'GET', '200').observe(0.1)
+app = Flask(__name__)
+MetricsRoutes(app, None)
+assert b'mett_request_seconds_count{endpoint="user",method="GET",status="200"} 1.0' in app.test_client().get('/metrics').data
+'''
+
+
+@pytest.mark.parametrize('existing', [False, True])
+def test_multiprocess_directory_is_prepared(tmp_path, existing):
+    directory = tmp_path / 'metrics'
+    if existing:
+        directory.mkdir()
+        (directory / 'histogram_999999999.db').write_bytes(b'stale')  # no such pid, left by an earlier run
+
+    environment = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(directory))
+    subprocess.run([sys.executable, '-c', SCRIPT], cwd=str(Path(__file__).parent.parent.parent.parent), env=environment, check=True)
+
+    assert not (directory / 'histogram_999999999.db').exists()
+    assert list(directory.glob('histogram_*.db'))
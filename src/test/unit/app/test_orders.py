@@ -1,4 +1,5 @@
 import pytest
+from app.orders import rearrange_ordered_buns
 from test.unit.common import MockUser
 
 
@@ -63,3 +64,23 @@ def test_previous_orders(mock_app, app_fixture):
     mock_app.post('/order', data={'orderAmount': 1, 'orderClass': 'Weizen'})
 
     assert '<li>{}: '.format(MockUser.name) in mock_app.get('/order/previous').data.decode()
+
+
+def test_previous_orders_paginated(mock_app, app_fixture):
+    app_fixture.config.set('Mett', 'previous_orders_page_size', '1')
+    for expiry_date in ['2000-01-01', '2000-01-02']:
+        app_fixture.mett_store._order.insert_one({'orders': [], 'processed': True, 'expiry_date': expiry_date})
+
+    first_page = mock_app.get('/order/previous').data.decode()
+    assert '2000-01-02' in first_page and '2000-01-01' not in first_page
+    assert 'Older orders' in first_page
+
+    next_page = first_page.split('before=')[1].split('"')[0]
+    second_page = mock_app.get('/order/previous?before={}'.format(next_page)).data.decode()
+    assert '2000-01-01' in second_page and 'Older orders' not in second_page
+
+    assert 'Invalid page requested' in mock_app.get('/order/previous?before=invalid').data.decode()
+
+
+def test_rearrange_ordered_buns():
+    assert rearrange_ordered_buns([('a', 'Weizen'), ('b', 'Roggen'), ('a', 'Roggen')]) == {'a': ['Weizen', 'Roggen'], 'b': ['Roggen']}
@@ -1,5 +1,4 @@
 import pytest
-from mongomock import MongoClient  # pylint: disable=import-error
 
 from app.app_setup import AppSetup
 from test.unit.common import config_for_tests, MockUser  # pylint: disable=wrong-import-order
@@ -11,9 +10,7 @@ def patch_current_user(monkeypatch):
 
 
 @pytest.fixture(scope='function')
-def app_fixture(tmpdir, monkeypatch):
-    monkeypatch.setattr('database.mett_store.MongoClient', MongoClient)
-    monkeypatch.setattr('database.user_store.MongoClient', MongoClient)
+def app_fixture(tmpdir):
     config = config_for_tests(tmpdir)
     config.set('Runtime', 'behind_proxy', 'true')
     return AppSetup(config=config)
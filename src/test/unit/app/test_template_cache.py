@@ -0,0 +1,51 @@
+import os
+
+from flask import Flask
+from jinja2 import DictLoader
+
+from app.template_cache import AtomicBytecodeCache, add_bytecode_cache, compile_templates
+from test.unit.common import config_for_tests
+
+
+class _RecordingCache(AtomicBytecodeCache):
+    def __init__(self, directory):
+        super().__init__(directory)
+        self.loaded = []
+
+    def load_bytecode(self, bucket):
+        super().load_bytecode(bucket)
+        self.loaded.append(bucket.code is not None)
+
+
+def _app(templates, cache_dir=None):
+    app = Flask(__name__)
+    app.jinja_loader = DictLoader(templates)
+    if cache_dir:
+        config = config_for_tests()
+        config.set('Templates', 'bytecode_cache', str(cache_dir))
+        add_bytecode_cache(app, config)
+    return app
+
+
+def test_bytecode_cache_is_shared(tmpdir):
+    cache_dir = tmpdir.join('cache')
+    templates = {'page.html': '{% for x in items %}{{ x }}{% endfor %}'}
+    assert compile_templates(_app(templates, cache_dir)) == (1, [])
+    assert len(os.listdir(str(cache_dir))) == 1
+
+    app = _app(templates)
+    app.jinja_env.bytecode_cache = _RecordingCache(str(cache_dir))
+    assert app.jinja_env.get_template('page.html').render(items=[1, 2]) == '12'
+    assert app.jinja_env.bytecode_cache.loaded == [True]
+
+
+def test_no_bytecode_cache_configured():
+    app = Flask(__name__)
+    add_bytecode_cache(app, config_for_tests())
+    assert app.jinja_env.bytecode_cache is None
+
+
+def test_compile_templates_reports_syntax_errors():
+    count, errors = compile_templates(_app({'good.html': '{{ value }}', 'bad.html': '{% if value %}'}))
+    assert count == 2
+    assert [template for template, _ in errors] == ['bad.html']
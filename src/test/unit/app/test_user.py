@@ -92,3 +92,9 @@ def test_change_user_password(mock_app, app_fixture):
     response = mock_app.post('/user', data={'name': MockUser.name, 'new_password': 'same_password', 'new_password_confirm': 'same_password'})
     assert b'password did not match' not in response.data
     assert b'change successful' in response.data
+
+
+def test_user_home_without_account(mock_app):
+    response = mock_app.get('/user')
+    assert response.status_code == 200
+    assert 'No existing account {}'.format(MockUser.name).encode() in response.data
@@ -0,0 +1,12 @@
+from benchmark.startup import import_profile, top_level_imports
+
+
+def test_import_profile():
+    profile = import_profile('database.cache')
+    assert profile[-1][0] == 'database.cache'
+    assert profile[-1][3] == 0
+    assert all(cumulative >= own for _, own, cumulative, _ in profile)
+
+    top = top_level_imports(profile, top=2)
+    assert len(top) <= 2
+    assert all(depth == 1 for *_, depth in top)
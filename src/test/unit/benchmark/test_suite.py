@@ -0,0 +1,26 @@
+import pytest
+
+from benchmark.data import benchmark_config, create_benchmark_app
+from benchmark.suite import ROUTES, STORE_BENCHMARKS, compare, run
+
+
+@pytest.fixture(scope='function')
+def benchmark_app(monkeypatch):
+    # create_benchmark_app replaces these globally, monkeypatch restores them afterwards
+    for module in ['admin', 'asgi', 'dashboard', 'orders', 'profile', 'user']:
+        monkeypatch.setattr('app.{}.current_user'.format(module), None)
+    config = benchmark_config()
+    config.set('Cache', 'size', '0')
+    return create_benchmark_app(config, mock=True, users=4, years=1)
+
+
+def test_run(benchmark_app):
+    results = run(*benchmark_app, repeat=1)
+    assert len(results) == 1 + len(STORE_BENCHMARKS) + len(ROUTES)
+    assert all(seconds > 0 for seconds in results.values())
+
+
+def test_compare():
+    baseline = {'results': {'fast': 1.0, 'slow': 1.0, 'removed': 1.0}}
+    results = {'results': {'fast': 1.2, 'slow': 2.0, 'new': 5.0}}
+    assert compare(results, baseline, threshold=1.5) == [('slow', 1.0, 2.0)]
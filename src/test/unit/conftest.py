@@ -0,0 +1,13 @@
+import pytest
+from mongomock import MongoClient  # pylint: disable=import-error
+
+from database.client import reset_clients
+
+
+@pytest.fixture(scope='function', autouse=True)
+def mock_mongo_client(monkeypatch):
+    # stores of a test share one mongomock client per server, like they share one MongoClient in production
+    monkeypatch.setattr('database.client.MongoClient', MongoClient)
+    reset_clients()
+    yield
+    reset_clients()
@@ -0,0 +1,64 @@
+import gzip
+
+import pytest
+from bson import ObjectId, json_util
+
+from database.backup_stream import BackupWriter, read_documents, read_header
+
+
+def _read_lines(path, opener=open):
+    with opener(str(path), 'rt', encoding='utf-8') as backup_file:
+        return [json_util.loads(line) for line in backup_file]
+
+
+@pytest.mark.parametrize('compression, opener', [('none', open), ('gzip', gzip.open)])
+def test_write_sections(tmpdir, compression, opener):
+    path = tmpdir / 'backup.ndjson'
+    object_id = ObjectId()
+    with BackupWriter(path, compression=compression) as writer:
+        assert writer.write_section('mett.account', ({'_id': object_id, 'name': name} for name in ['a', 'b'])) == 2
+        assert writer.write_section('mett.order', []) == 0
+
+    header, *lines = _read_lines(path, opener)
+    assert header['format'] == 'mett-stream'
+    assert lines == [{'$section': 'mett.account'}, {'_id': object_id, 'name': 'a'}, {'_id': object_id, 'name': 'b'}, {'$section': 'mett.order'}]
+
+
+@pytest.mark.parametrize('encoding', ['ndjson', 'bson'])
+@pytest.mark.parametrize('compression', ['none', 'gzip'])
+def test_read_documents(tmpdir, encoding, compression):
+    path = tmpdir / 'backup'
+    documents = [{'_id': ObjectId(), 'orders': [['test', 'Weizen']], 'timestamp': 1581523412.123456}]
+    with BackupWriter(path, compression=compression, header={'type': 'full'}, encoding=encoding) as writer:
+        writer.write_section('mett.order', documents)
+        writer.write_section('mett.deposit', [])
+
+    assert read_header(path)['type'] == 'full'
+    assert list(read_documents(path)) == [('mett.order', document) for document in documents]
+
+
+def test_read_unknown_file(tmpdir):
+    path = tmpdir / 'mett.backup.json'
+    path.write_text('{"auth": {}, "mett": {}}', encoding='utf-8')
+    with pytest.raises(ValueError):
+        read_header(path)
+
+
+def test_failed_backup_keeps_old_file(tmpdir):
+    path = tmpdir / 'backup.ndjson'
+    path.write_text('old backup', encoding='utf-8')
+
+    with pytest.raises(RuntimeError):
+        with BackupWriter(path) as writer:
+            writer.write_section('mett.account', [{'name': 'a'}])
+            raise RuntimeError('connection lost')
+
+    assert path.read_text(encoding='utf-8') == 'old backup'
+    assert tmpdir.listdir() == [path]
+
+
+def test_unknown_compression(tmpdir):
+    with pytest.raises(ValueError):
+        BackupWriter(tmpdir / 'backup', compression='lzma')
+    with pytest.raises(ValueError):
+        BackupWriter(tmpdir / 'backup', encoding='xml')
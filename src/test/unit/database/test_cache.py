@@ -0,0 +1,50 @@
+from database.cache import LruCache
+
+
+def test_get_and_put():
+    cache = LruCache(max_size=2)
+    assert cache.get('key') == (False, None)
+
+    cache.put('key', None)
+    assert cache.get('key') == (True, None)
+    assert cache.statistics.as_dict() == {'hits': 1, 'misses': 1, 'evictions': 0, 'hit_rate': 0.5}
+
+
+def test_evict_least_recently_used():
+    cache = LruCache(max_size=2)
+    cache.put('first', 1)
+    cache.put('second', 2)
+    cache.get('first')
+    cache.put('third', 3)
+
+    assert len(cache) == 2
+    assert cache.get('second') == (False, None)
+    assert cache.get('first') == (True, 1)
+    assert cache.statistics.evictions == 1
+
+
+def test_disabled_cache():
+    cache = LruCache(max_size=0)
+    cache.put('key', 'value')
+    assert cache.get('key') == (False, None)
+
+
+def test_entries_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('database.cache.monotonic', lambda: now[0])
+    cache = LruCache(max_size=2, ttl=3.0)
+    cache.put('key', 'value')
+
+    now[0] = 102.0
+    assert cache.get('key') == (True, 'value')
+    now[0] = 104.0
+    assert cache.get('key') == (False, None)
+    assert len(cache) == 0
+
+
+def test_invalidate():
+    cache = LruCache(max_size=2)
+    cache.put('key', 'value')
+    cache.invalidate('key')
+    cache.invalidate('unknown')
+    assert cache.get('key') == (False, None)
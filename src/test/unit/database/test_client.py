@@ -0,0 +1,56 @@
+from app.app_setup import AppSetup
+from database.client import client_options, get_client, reset_clients
+from test.unit.common import config_for_tests
+
+
+class _RecordingClient:
+    def __init__(self, uri, **options):
+        self.uri = uri
+        self.options = options
+
+
+def test_stores_share_one_client(tmpdir):
+    app_setup = AppSetup(config_for_tests(tmpdir))
+    other_setup = AppSetup(config_for_tests(tmpdir))
+
+    assert app_setup.mett_store._client is app_setup.user_interface._client
+    assert other_setup.mett_store._client is app_setup.mett_store._client
+
+
+def test_client_per_server_and_options(monkeypatch):
+    monkeypatch.setattr('database.client.MongoClient', _RecordingClient)
+    config = config_for_tests()
+    client = get_client(config)
+    assert get_client(config_for_tests()) is client
+    assert client.uri == 'mongodb://127.0.0.1:27017'
+    assert client.options['maxPoolSize'] == config.getint('Database', 'max_pool_size')
+    assert client.options['connect'] is False
+
+    config.set('Database', 'max_pool_size', '2')
+    assert get_client(config) is not client
+    assert get_client(config).options['maxPoolSize'] == 2
+
+
+def test_client_options():
+    config = config_for_tests()
+    config.set('Database', 'socket_timeout_ms', '0')
+    config.set('Database', 'compressors', '')
+    options = client_options(config)
+    assert options['socketTimeoutMS'] is None
+    assert 'compressors' not in options
+
+    config.set('Database', 'compressors', 'zstd,zlib')
+    assert client_options(config)['compressors'] == 'zstd,zlib'
+
+
+def test_reconnect_after_fork(tmpdir):
+    app_setup = AppSetup(config_for_tests(tmpdir))
+    client = app_setup.mett_store._client
+
+    app_setup.reconnect()
+    assert app_setup.mett_store._client is not client
+    assert app_setup.user_interface._client is app_setup.mett_store._client
+    assert app_setup.mett_store._account.database.client is app_setup.mett_store._client
+
+    reset_clients()
+    assert get_client(app_setup.config) is not app_setup.mett_store._client
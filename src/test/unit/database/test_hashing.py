@@ -0,0 +1,32 @@
+from threading import Event
+
+import pytest
+
+from database.hashing import HashingError, HashingPool
+
+
+def test_run():
+    pool = HashingPool(workers=2, queue_size=0)
+    assert pool.run(lambda value: value * 2, 21) == 42
+    assert pool.statistics.as_dict()['completed'] == 1
+    pool.shutdown()
+
+
+def test_run_inline():
+    pool = HashingPool(workers=0)
+    assert pool.run(sum, [1, 2]) == 3
+    assert pool._executor is None
+
+
+def test_reject_when_full():
+    pool, release = HashingPool(workers=1, queue_size=0, timeout=0.05), Event()
+
+    with pytest.raises(HashingError, match='timed out'):
+        pool.run(release.wait)
+    with pytest.raises(HashingError, match='Too many'):
+        pool.run(sum, [1, 2])
+
+    release.set()
+    pool.shutdown()
+    assert pool.statistics.as_dict()['rejected'] == 1
+    assert pool.statistics.as_dict()['timed_out'] == 1
@@ -0,0 +1,61 @@
+import pytest
+from mongomock import MongoClient
+from pymongo.errors import DuplicateKeyError
+
+from check_indexes import check_indexes
+from database.indexes import METT_INDEXES, USER_INDEXES, ensure_indexes, missing_indexes, unknown_indexes
+
+
+@pytest.fixture(scope='function')
+def database():
+    return MongoClient()['mett_test']
+
+
+def test_ensure_indexes(database):
+    assert len(missing_indexes(database, METT_INDEXES)) == len(METT_INDEXES)
+
+    ensure_indexes(database, METT_INDEXES)
+    assert missing_indexes(database, METT_INDEXES) == []
+
+    ensure_indexes(database, METT_INDEXES)
+    assert missing_indexes(database, METT_INDEXES) == []
+
+
+def test_ensure_unique_index_on_duplicates_fails(database):
+    database.account.insert_many([{'name': 'twice', 'balance': 0.0}, {'name': 'twice', 'balance': 0.0}])
+    with pytest.raises(DuplicateKeyError):
+        ensure_indexes(database, METT_INDEXES)
+    assert 'unique_account_name' not in database.account.index_information()
+
+
+def test_single_active_order(database):
+    ensure_indexes(database, METT_INDEXES)
+    database.order.insert_one({'processed': True, 'orders': []})
+    database.order.insert_one({'processed': True, 'orders': []})
+    database.order.insert_one({'processed': False, 'orders': []})
+
+    with pytest.raises(DuplicateKeyError):
+        database.order.insert_one({'processed': False, 'orders': []})
+
+
+def test_unique_user_name(database):
+    ensure_indexes(database, USER_INDEXES)
+    database.user.insert_one({'name': 'test'})
+
+    with pytest.raises(DuplicateKeyError):
+        database.user.insert_one({'name': 'test'})
+
+
+def test_unknown_indexes(database):
+    ensure_indexes(database, USER_INDEXES)
+    database.user.create_index('password')
+
+    assert unknown_indexes(database, USER_INDEXES) == [('user', 'password_1')]
+
+
+def test_check_indexes(database, capsys):
+    assert check_indexes(database, USER_INDEXES) == 1
+    assert '[missing] user.unique_user_name' in capsys.readouterr().out
+
+    ensure_indexes(database, USER_INDEXES)
+    assert check_indexes(database, USER_INDEXES) == 0
@@ -4,16 +4,19 @@ order: id, processed, orders, expiry_date (orders list of (account, bun), with a
 buns: id, bun_class, price, mett
 purchase: id, account, price, purpose, processed (account foreign_key on accound.name)
 '''
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
 import pytest
+from bson import ObjectId
+from flask import Flask
 
 from test.unit.common import config_for_tests, HAS_NOT_EXPIRED, HAS_EXPIRED
 from database.mett_store import MettStore, StorageException
-from mongomock import MongoClient
 
 
 @pytest.fixture(scope='function')
-def mock_store(monkeypatch):
-    monkeypatch.setattr('database.mett_store.MongoClient', MongoClient)
+def mock_store():
     return MettStore(config=config_for_tests())
 
 
@@ -192,8 +195,24 @@ def test_order_history(mock_store):
     mock_store._account.insert_one({'name': 'order_test', 'balance': 0.0})
     mock_store._order.insert_one({'orders': [('order_test', 'Weizen'), ('order_test', 'Weizen'), ('order_test', 'Roggen')], 'processed': True, 'expiry_date': '2000-01-01'})
     mock_store._order.insert_one({'orders': [('order_test', 'Weizen'), ('order_test', 'Roggen'), ('order_test', 'Roggen')], 'processed': True, 'expiry_date': '2000-01-01'})
+    mock_store.rebuild_order_history()
 
     assert mock_store.get_order_history('order_test') == ({'Weizen': 1.5, 'Roggen': 1.5, 'Roeggelchen': 0}, 3)
+    assert mock_store.get_order_history('unknown') == ({'Weizen': 0, 'Roggen': 0, 'Roeggelchen': 0}, 0)
+
+    mock_store._history.insert_one({'account': 'deleted', 'orders': 1, 'buns': {'Weizen': 1}})
+    mock_store.rebuild_order_history()
+    assert [entry['account'] for entry in mock_store._history.find()] == ['order_test']
+
+
+def test_order_history_rebuilt_on_upgrade(mock_store):
+    mock_store._order.insert_one({'orders': [('order_test', 'Weizen'), ('order_test', 'Roggen')], 'processed': True, 'expiry_date': '2000-01-01'})
+    mock_store.initialize()
+    assert mock_store.get_order_history('order_test') == ({'Weizen': 1.0, 'Roggen': 1.0, 'Roeggelchen': 0}, 2)
+
+    mock_store._history.update_one({'account': 'order_test'}, {'$set': {'orders': 2}})
+    mock_store.initialize()  # history exists, not rebuilt again
+    assert mock_store.get_order_history('order_test')[1] == 1
 
 
 def test_is_expired(mock_store):
@@ -218,3 +237,329 @@ def test_order_bun_expired_fails(mock_store):
     mock_store._order.insert_one({'orders': [], 'processed': False, 'expiry_date': HAS_EXPIRED})
     with pytest.raises(StorageException):
         mock_store.order_bun('order_test', 'Weizen')
+
+
+def test_order_counters(mock_store):
+    order_id = mock_store.create_order(HAS_NOT_EXPIRED)
+    mock_store.order_bun('order_test', 'Weizen')
+    mock_store.order_bun('order_test', 'Weizen')
+    mock_store.order_bun('another', 'Roggen')
+
+    assert mock_store._order.find_one({'_id': order_id})['bun_count'] == {'Weizen': 2, 'Roggen': 1}
+    assert mock_store._order_count.find_one({'order': order_id, 'account': 'order_test', 'bun_class': 'Weizen'})['count'] == 2
+    assert mock_store.get_current_user_buns('another') == {'Weizen': 0, 'Roggen': 1, 'Roeggelchen': 0}
+
+
+def test_reroute_updates_counters(mock_store):
+    mock_store.create_order(HAS_NOT_EXPIRED)
+    mock_store.order_bun('order_test', 'Weizen')
+    mock_store.reroute_bun('Weizen', 'order_test', 'target')
+
+    assert mock_store.get_current_user_buns('order_test') == {'Weizen': 0, 'Roggen': 0, 'Roeggelchen': 0}
+    assert mock_store.get_current_user_buns('target') == {'Weizen': 1, 'Roggen': 0, 'Roeggelchen': 0}
+    assert mock_store.get_current_bun_order() == {'Weizen': 2, 'Roggen': 1, 'Roeggelchen': 0}
+
+
+def test_counters_initialized_for_existing_order(mock_store):
+    order_id = mock_store._order.insert_one({'orders': [('order_test', 'Weizen'), ('order_test', 'Roggen')], 'processed': False, 'expiry_date': HAS_NOT_EXPIRED}).inserted_id
+
+    assert mock_store.get_current_user_buns('order_test') == {'Weizen': 1, 'Roggen': 1, 'Roeggelchen': 0}
+    assert mock_store._order.find_one({'_id': order_id})['bun_count'] == {'Weizen': 1, 'Roggen': 1}
+
+    mock_store.order_bun('order_test', 'Weizen')
+    assert mock_store.get_current_user_buns('order_test') == {'Weizen': 2, 'Roggen': 1, 'Roeggelchen': 0}
+
+
+def test_drop_order_removes_counters(mock_store):
+    mock_store.create_order(HAS_NOT_EXPIRED)
+    mock_store.order_bun('order_test', 'Weizen')
+    mock_store.drop_current_order()
+
+    assert mock_store._order_count.count_documents({}) == 0
+
+
+def test_order_buns(mock_store):
+    order_id = mock_store.create_order(HAS_NOT_EXPIRED)
+    mock_store.order_buns('order_test', 'Weizen', 3)
+    mock_store.order_buns('order_test', 'Roggen', 0)
+
+    assert mock_store._order.find_one({'_id': order_id})['orders'] == [['order_test', 'Weizen']] * 3
+    assert mock_store.get_current_user_buns('order_test') == {'Weizen': 3, 'Roggen': 0, 'Roeggelchen': 0}
+
+
+def test_order_buns_expired_fails(mock_store):
+    with pytest.raises(StorageException):
+        mock_store.order_buns('order_test', 'Weizen', 2)
+
+    mock_store._order.insert_one({'orders': [], 'processed': False, 'expiry_date': HAS_EXPIRED, 'bun_count': {}})
+    with pytest.raises(StorageException):
+        mock_store.order_buns('order_test', 'Weizen', 2)
+    assert mock_store._order.find_one({'processed': False})['orders'] == []
+
+
+def test_order_buns_unknown_class_fails(mock_store):
+    order_id = mock_store.create_order(HAS_NOT_EXPIRED)
+    with pytest.raises(StorageException):
+        mock_store.order_buns('order_test', 'Dinkel', 2)
+    assert mock_store._order.find_one({'_id': order_id})['orders'] == []
+    assert 'Dinkel' not in mock_store._order.find_one({'_id': order_id})['bun_count']
+
+
+class _AtomicCollection:
+    # mongomock does not apply a single update atomically across threads, mongod does: serialize each call like the server
+    def __init__(self, collection):
+        self._collection = collection
+        self._lock = Lock()
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            with self._lock:
+                return attribute(*args, **kwargs)
+        return call
+
+
+def test_order_buns_concurrently(mock_store):
+    mock_store._order = _AtomicCollection(mock_store._order)
+    mock_store.create_order(HAS_NOT_EXPIRED)
+    accounts = ['account_{}'.format(index) for index in range(10)]
+    mock_store.order_buns('source', 'Weizen', 20)
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        for round_number in range(20):
+            executor.submit(mock_store.reroute_bun, 'Weizen', 'source', accounts[round_number % 10])
+            for account in accounts:
+                executor.submit(mock_store.order_buns, account, 'Weizen', 2)
+
+    current_order = mock_store._order.find_one({'processed': False})
+    assert len(current_order['orders']) == 420
+    assert current_order['bun_count'] == {'Weizen': 420}
+    assert all(mock_store.get_current_user_buns(account)['Weizen'] == 42 for account in accounts)
+    assert mock_store.get_current_user_buns('source')['Weizen'] == 0
+    for account in accounts + ['source']:
+        ordered = sum(1 for name, _ in current_order['orders'] if name == account)
+        assert ordered == mock_store.get_current_user_buns(account)['Weizen']
+
+
+def test_process_order_charges(mock_store):
+    mock_store.create_account('first')
+    mock_store.create_account('second')
+    mock_store.change_bun_price('Roggen', 1.5)
+    mock_store.create_order(HAS_NOT_EXPIRED)
+    mock_store.order_buns('first', 'Weizen', 2)
+    mock_store.order_buns('first', 'Roggen', 1)
+    mock_store.order_buns('second', 'Roggen', 2)
+
+    assert mock_store.process_order() == {'first': 3.5, 'second': 3.0}
+    assert mock_store.get_account_information('first')['balance'] == -3.5
+    assert mock_store.get_account_information('second')['balance'] == -3.0
+    assert not mock_store.active_order_exists()
+
+    with pytest.raises(StorageException):
+        mock_store.process_order()
+
+
+def test_process_order_unknown_bun_class_keeps_order_open(mock_store):
+    mock_store.create_account('first')
+    order_id = mock_store.create_order(HAS_NOT_EXPIRED)
+    mock_store.order_buns('first', 'Weizen', 2)
+    mock_store._order.update_one({'_id': order_id}, {'$push': {'orders': ['first', 'Dinkel']}})
+
+    with pytest.raises(StorageException):
+        mock_store.process_order()
+    assert mock_store.active_order_exists()
+    assert mock_store.get_account_information('first')['balance'] == 0
+
+    mock_store._order.update_one({'_id': order_id}, {'$pull': {'orders': ['first', 'Dinkel']}})
+    assert mock_store.process_order() == {'first': 2.0}
+
+
+def test_order_history_updated_on_process(mock_store):
+    mock_store.create_order(HAS_NOT_EXPIRED)
+    mock_store.order_buns('order_test', 'Weizen', 2)
+    mock_store.order_buns('another', 'Roggen', 1)
+    mock_store.process_order()
+
+    mock_store.create_order(HAS_NOT_EXPIRED)
+    mock_store.order_buns('order_test', 'Roggen', 1)
+    mock_store.process_order()
+
+    assert mock_store.get_order_history('order_test') == ({'Weizen': 1.0, 'Roggen': 0.5, 'Roeggelchen': 0}, 1.5)
+    assert mock_store.get_order_history('another') == ({'Weizen': 0, 'Roggen': 1.0, 'Roeggelchen': 0}, 1.0)
+
+    mock_store.rebuild_order_history()
+    assert mock_store.get_order_history('order_test') == ({'Weizen': 1.0, 'Roggen': 0.5, 'Roeggelchen': 0}, 1.5)
+
+
+class _AlwaysEmptyCount:
+    # another process has not yet inserted its default buns when this one checks
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    def count_documents(self, *_):
+        return 0
+
+
+def test_init_tables_concurrently(mock_store):
+    mock_store._buns.delete_many({'bun_class': {'$ne': 'Weizen'}})
+    mock_store._buns = _AlwaysEmptyCount(mock_store._buns)
+    mock_store._init_tables()
+    assert sorted(bun['bun_class'] for bun in mock_store._buns.find()) == ['Roeggelchen', 'Roggen', 'Weizen']
+
+
+@pytest.fixture(scope='function')
+def cached_stores():
+    config = config_for_tests()
+    config.set('Cache', 'size', '16')
+    config.set('Cache', 'version_interval', '0')
+    return MettStore(config=config), MettStore(config=config)
+
+
+def test_cached_reads(cached_stores):
+    store, _ = cached_stores
+    assert store.list_bun_classes() == ['Weizen', 'Roggen', 'Roeggelchen']
+    store.list_bun_classes().append('NoBun')
+    assert store.list_bun_classes() == ['Weizen', 'Roggen', 'Roeggelchen']
+    assert store.cache_statistics()['hits'] == 2
+
+
+def test_cache_invalidated_by_write(cached_stores):
+    store, _ = cached_stores
+    store.create_order(HAS_NOT_EXPIRED)
+    assert store.get_current_bun_order() == {'Weizen': 1, 'Roggen': 1, 'Roeggelchen': 0}
+
+    store.order_bun('test', 'Roggen')
+    assert store.get_current_bun_order() == {'Weizen': 1, 'Roggen': 2, 'Roeggelchen': 0}
+
+    store.change_bun_price('Weizen', 2.5)
+    assert store.list_bun_classes_with_price()['Weizen'] == 2.5
+
+
+def test_cache_invalidated_across_stores(cached_stores):
+    store, other_store = cached_stores
+    assert not store.active_order_exists()
+    assert not other_store.active_order_exists()
+
+    store.create_order(HAS_NOT_EXPIRED)
+    assert other_store.active_order_exists()
+    assert not other_store.current_order_is_expired()
+
+    other_store.change_mett_formula('Weizen', 80.0)
+    assert store.get_current_mett_order() == 80.0 + 66.0
+
+
+def test_versions_read_once_per_request(cached_stores):
+    store, other_store = cached_stores
+    store._version_interval = 3600.0
+    app = Flask(__name__)
+    assert not store.active_order_exists()
+    other_store.create_order(HAS_NOT_EXPIRED)  # written by another worker before the request
+
+    with app.test_request_context():
+        assert store.active_order_exists()
+        store.change_bun_price('Weizen', 2.5)
+        assert store.list_bun_classes_with_price()['Weizen'] == 2.5  # own write seen
+        with ThreadPoolExecutor(max_workers=1) as other_worker:  # no request context there, like another worker process
+            other_worker.submit(other_store.change_bun_price, 'Weizen', 3.0).result()
+        assert store.list_bun_classes_with_price()['Weizen'] == 2.5  # one snapshot per request
+
+    with app.test_request_context():
+        assert store.list_bun_classes_with_price()['Weizen'] == 3.0
+
+
+def test_store_sums(mock_store):
+    assert (mock_store.sum_of_deposits(), mock_store.sum_of_purchases(), mock_store.count_ordered_buns()) == (0, 0, 0)
+
+    mock_store.create_account('test')
+    mock_store.change_balance('test', 5.0, 'admin')
+    mock_store.change_balance('test', -1.5, 'admin')
+    mock_store.state_purchase('test', 2.25, 'any')
+    mock_store._order.insert_one({'orders': [('test', 'Weizen'), ('test', 'Roggen')], 'processed': True, 'expiry_date': '2000-01-01'})
+    mock_store.create_order(HAS_NOT_EXPIRED)
+    mock_store.order_buns('test', 'Weizen', 3)
+
+    assert mock_store.sum_of_deposits() == 3.5
+    assert mock_store.sum_of_purchases() == 2.25
+    assert mock_store.count_ordered_buns() == 5
+
+
+def test_get_order_page(mock_store):
+    order_ids = [mock_store._order.insert_one({'orders': [], 'processed': True, 'expiry_date': '2000-01-0{}'.format(index)}).inserted_id for index in range(1, 6)]
+
+    orders, next_page = mock_store.get_order_page(page_size=2)
+    assert [order['_id'] for order in orders] == order_ids[:2:-1]
+    assert next_page == str(order_ids[3])
+
+    orders, next_page = mock_store.get_order_page(before=next_page, page_size=2)
+    assert [order['_id'] for order in orders] == order_ids[2:0:-1]
+
+    orders, next_page = mock_store.get_order_page(before=next_page, page_size=2)
+    assert [order['_id'] for order in orders] == [order_ids[0]]
+    assert next_page is None
+
+
+def test_get_balances(mock_store):
+    assert mock_store.get_balances([]) == {}
+
+    mock_store._account.insert_one({'name': 'first', 'balance': 1.5})
+    mock_store._account.insert_one({'name': 'second', 'balance': -2.0})
+    mock_store._account.insert_one({'name': 'third', 'balance': 0.0})
+
+    assert mock_store.get_balances(['first', 'second', 'unknown']) == {'first': 1.5, 'second': -2.0}
+
+
+def test_purchase_processed_only_once(mock_store):
+    mock_store.create_account('test')
+    purchase_id = mock_store.state_purchase('test', 1.23, 'any')
+    mock_store.authorize_purchase(purchase_id, 'foo')
+
+    with pytest.raises(StorageException):
+        mock_store.authorize_purchase(purchase_id, 'foo')
+    with pytest.raises(StorageException):
+        mock_store.decline_purchase(purchase_id, 'foo')
+    assert mock_store._account.find_one({'name': 'test'})['balance'] == 1.23
+
+
+@pytest.fixture(scope='function')
+def journal_store():
+    config = config_for_tests()
+    config.set('Backup', 'journal', 'true')
+    return MettStore(config=config)
+
+
+def test_journal_records_changes(journal_store):
+    since = ObjectId()
+    journal_store.create_account('test')
+    order_id = journal_store.create_order(HAS_NOT_EXPIRED)
+    journal_store.order_buns('test', 'Weizen', 2)
+    journal_store.order_bun('test', 'Roggen')
+    journal_store.change_bun_price('Weizen', 0.5)
+
+    assert journal_store.changed_since(since) == [
+        ('mett.account', {'name': 'test'}),
+        ('mett.order', {'_id': order_id}),
+        ('mett.bun', {'bun_class': 'Weizen'}),
+    ]
+
+
+def test_prune_journal(journal_store):
+    journal_store.create_account('test')
+    entries = journal_store._journal.count_documents({})
+    assert entries > 0
+
+    assert journal_store.prune_journal(ObjectId()) == entries
+    assert journal_store._journal.count_documents({}) == 0
+
+
+def test_journal_disabled():
+    config = config_for_tests()
+    config.set('Backup', 'journal', 'false')
+    store = MettStore(config=config)
+    store.create_account('test')
+    assert store._journal.count_documents({}) == 0
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+
+from database.mett_store import MettStore
+from database.reconciliation import BalanceReconciliation
+from test.unit.common import HAS_NOT_EXPIRED, config_for_tests
+
+
+@pytest.fixture(scope='function')
+def later():
+    # settle time of all records of the test has passed, taken per test as a session may run longer than SETTLE_TIME
+    return datetime.now(timezone.utc) + timedelta(minutes=1)
+
+
+@pytest.fixture(scope='function')
+def mock_store():
+    store = MettStore(config=config_for_tests())
+    store.create_account('test')
+    store.create_account('other')
+    store.change_balance('test', 10.0, 'admin')
+    return store
+
+
+def _drifts(drifts):
+    return {drift.account: round(drift.drift, 2) for drift in drifts}
+
+
+def test_no_drift(mock_store, later):
+    mock_store.authorize_purchase(mock_store.state_purchase('other', 4.5, 'Zwiebeln'), 'admin')
+    mock_store.create_order(HAS_NOT_EXPIRED)
+    mock_store.order_buns('test', 'Weizen', 2)
+    mock_store.order_bun('other', 'Roggen')
+    mock_store.process_order()
+    mock_store.assign_spare('Weizen', 'other')
+
+    assert _drifts(BalanceReconciliation(mock_store).run(later)) == {'test': 0.0, 'other': 0.0}
+
+
+def test_unsettled_records_count(mock_store):
+    assert _drifts(BalanceReconciliation(mock_store).run()) == {'test': 0.0, 'other': 0.0}
+
+
+def test_drift(mock_store, later):
+    reconciliation = BalanceReconciliation(mock_store)
+    reconciliation.run(later)
+    mock_store._account.update_one({'name': 'test'}, {'$inc': {'balance': 1.5}})
+    drifts = reconciliation.run(later)
+    assert _drifts(drifts) == {'test': 1.5, 'other': 0.0}
+    assert drifts[0].expected == 10.0
+
+
+def test_incremental_run(mock_store, later):
+    reconciliation = BalanceReconciliation(mock_store)
+    reconciliation.run(later)
+
+    mock_store._deposit.update_many({}, {'$set': {'amount': 100.0}})  # records before checkpoint are not read again
+    mock_store._deposit.insert_one({'_id': ObjectId.from_datetime(later), 'admin': 'admin', 'user': 'other', 'amount': 2.0, 'timestamp': 0.0})
+    mock_store._book_money('other', 2.0)
+    next_run = later + timedelta(minutes=1)
+    assert _drifts(reconciliation.run(next_run)) == {'test': 0.0, 'other': 0.0}
+
+    assert _drifts(reconciliation.run(next_run, full=True)) == {'test': -90.0, 'other': 0.0}
+
+
+def test_first_run_trusts_balances(mock_store, later):
+    # upgraded database: order processed before charges were recorded
+    mock_store._order.insert_one({'orders': [('test', 'Weizen'), ('test', 'Roggen')], 'processed': True, 'expiry_date': '2000-01-01'})
+    mock_store._account.update_one({'name': 'test'}, {'$inc': {'balance': -2.0}})
+    reconciliation = BalanceReconciliation(mock_store)
+    assert _drifts(reconciliation.run(later)) == {'test': 0.0, 'other': 0.0}
+    assert mock_store.get_reconciliation_checkpoint()['expected'] == [{'account': 'test', 'balance': 8.0}, {'account': 'other', 'balance': 0.0}]
+
+    mock_store._account.update_one({'name': 'test'}, {'$inc': {'balance': 0.5}})
+    assert _drifts(reconciliation.run(later + timedelta(minutes=1))) == {'test': 0.5, 'other': 0.0}
+    assert _drifts(reconciliation.run(later + timedelta(minutes=1), full=True)) == {'test': -1.5, 'other': 0.0}  # legacy order and tampering
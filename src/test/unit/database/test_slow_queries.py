@@ -0,0 +1,92 @@
+import json
+import logging
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+from database.slow_queries import LOGGER_NAME, SlowQueryListener, command_listeners, query_shape
+from database.store_calls import track_store_calls
+from test.unit.common import config_for_tests
+
+
+class _Handler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.entries = []
+
+    def emit(self, record):
+        self.entries.append(json.loads(record.getMessage()))
+
+
+@pytest.fixture(scope='function')
+def listener():
+    logger = logging.getLogger('test.slow_queries')
+    logger.propagate = False
+    handler = _Handler()
+    logger.addHandler(handler)
+    yield SlowQueryListener(10, logger), handler.entries
+    logger.removeHandler(handler)
+
+
+def _run_command(listener, command_name, command, reply, duration_micros, request_id=1):
+    listener.started(SimpleNamespace(command_name=command_name, command=command, connection_id=('localhost', 27017), request_id=request_id))
+    listener.succeeded(SimpleNamespace(command_name=command_name, reply=reply, duration_micros=duration_micros, connection_id=('localhost', 27017), request_id=request_id))
+
+
+class _Store:
+    def __init__(self, listener):
+        self._listener = listener
+
+    def find_orders(self):
+        _run_command(self._listener, 'find', {'find': 'order', 'filter': {'processed': False, 'expiry_date': {'$gt': 5}}}, {'cursor': {'firstBatch': [{}, {}]}}, 25000)
+
+
+def test_query_shape():
+    assert query_shape({'name': 'secret', 'balance': {'$gt': 5}}) == {'name': '?', 'balance': {'$gt': '?'}}
+    assert query_shape({'$or': [{'a': 1}, {'b': [1, 2]}]}) == {'$or': [{'a': '?'}, {'b': '?'}]}
+    assert query_shape([{'$match': {'account': 'x'}}, {'$group': {'_id': '$bun', 'count': {'$sum': 1}}}]) == [{'$match': {'account': '?'}}, {'$group': {'_id': '?', 'count': {'$sum': '?'}}}]
+    assert query_shape(None) is None
+
+
+def test_slow_command_is_logged(listener):
+    listener, entries = listener
+    store = track_store_calls(_Store(listener), 'test_store')
+    app = Flask(__name__)
+    app.add_url_rule('/order', 'order', store.find_orders)
+    with app.test_request_context('/order'):
+        store.find_orders()
+
+    assert len(entries) == 1
+    assert entries[0]['command'] == 'find'
+    assert entries[0]['collection'] == 'order'
+    assert json.loads(entries[0]['shape']) == {'processed': '?', 'expiry_date': {'$gt': '?'}}
+    assert entries[0]['milliseconds'] == 25.0
+    assert entries[0]['documents'] == 2
+    assert entries[0]['endpoint'] == 'order'
+    assert entries[0]['store_call'] == 'test_store.find_orders'
+
+
+def test_fast_command_is_not_logged(listener):
+    listener, entries = listener
+    _run_command(listener, 'update', {'update': 'account', 'updates': [{'q': {'name': 'a'}, 'u': {}}]}, {'n': 1}, 500)
+    assert entries == []
+
+    _run_command(listener, 'update', {'update': 'account', 'updates': [{'q': {'name': 'a'}, 'u': {}}]}, {'n': 1}, 50000, request_id=2)
+    assert entries[0]['shape'] == '[{"name": "?"}]'
+    assert entries[0]['documents'] == 1
+    assert entries[0]['endpoint'] is None
+    assert entries[0]['store_call'] is None
+
+
+def test_command_listeners(tmpdir):
+    config = config_for_tests()
+    assert command_listeners(config) == []
+
+    config.set('SlowQueries', 'enabled', 'true')
+    config.set('SlowQueries', 'log_file', str(tmpdir.join('slow.log')))
+    assert isinstance(command_listeners(config)[0], SlowQueryListener)
+    logger = logging.getLogger(LOGGER_NAME)
+    assert len(logger.handlers) == 1
+    assert len(command_listeners(config)) == 1 and len(logger.handlers) == 1
+    logger.removeHandler(logger.handlers[0])
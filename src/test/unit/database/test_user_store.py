@@ -0,0 +1,93 @@
+import pytest
+from flask import Flask
+
+from database.mett_store import StorageException
+from database.user_store import UserRoleDatabase
+from test.unit.common import config_for_tests
+
+
+@pytest.fixture(scope='function')
+def user_store():
+    store = UserRoleDatabase(config_for_tests())
+    store.create_role('user')
+    store.create_role('admin')
+    store.create_user('test', 'hashed_password', roles=['user'], is_hashed=True)
+    return store
+
+
+def test_get_user(user_store):
+    user = user_store.get_user('test')
+    assert user.name == 'test'
+    assert [role.name for role in user.roles] == ['user']
+
+    assert user_store.get_user('unknown') is None
+    with pytest.raises(StorageException):
+        user_store.get_user('unknown', throw=True)
+
+
+def test_add_role_to_user(user_store):
+    user_store.add_role_to_user('test', 'admin')
+    assert [role.name for role in user_store.get_user('test').roles] == ['user', 'admin']
+
+    with pytest.raises(StorageException, match='already has role'):
+        user_store.add_role_to_user('test', 'admin')
+    with pytest.raises(StorageException, match='does not exist'):
+        user_store.add_role_to_user('unknown', 'admin')
+    with pytest.raises(StorageException, match='does not exist'):
+        user_store.add_role_to_user('test', 'unknown')
+
+
+def test_remove_role_from_user(user_store):
+    user_store.remove_role_from_user('test', 'user')
+    assert user_store.get_user('test').roles == []
+
+    with pytest.raises(StorageException, match='doesn\'t have role'):
+        user_store.remove_role_from_user('test', 'user')
+    with pytest.raises(StorageException, match='does not exist'):
+        user_store.remove_role_from_user('unknown', 'user')
+
+
+def test_create_and_delete_user(user_store):
+    with pytest.raises(StorageException, match='User already exists'):
+        user_store.create_user('test', 'hashed_password', is_hashed=True)
+    with pytest.raises(StorageException, match='Not all roles'):
+        user_store.create_user('other', 'hashed_password', roles=['user', 'unknown'], is_hashed=True)
+
+    user_store.delete_user('test')
+    assert not user_store.user_exists('test')
+    with pytest.raises(StorageException):
+        user_store.delete_user('test')
+
+
+def test_create_role_exists(user_store):
+    with pytest.raises(StorageException):
+        user_store.create_role('user')
+
+
+def test_find_user_cached(user_store):
+    assert user_store.find_user('test').name == 'test'
+    user_store._user.update_one({'name': 'test'}, {'$set': {'roles': []}})
+    assert [role.name for role in user_store.find_user('test').roles] == ['user']
+
+    user_store.add_role_to_user('test', 'admin')
+    assert [role.name for role in user_store.find_user('test').roles] == ['admin']
+    assert user_store.loader_cache_statistics()['hits'] == 1
+
+    user_store.delete_user('test')
+    assert user_store.find_user('test') is None
+
+
+def test_find_user_does_not_cache_unknown(user_store):
+    assert user_store.find_user('new') is None
+    user_store._user.insert_one({'name': 'new', 'password': 'hash', 'roles': []})  # created by another worker
+    assert user_store.find_user('new').name == 'new'
+
+
+def test_find_user_memoized_per_request(user_store):
+    user_store._user_cache.max_size = 0
+    with Flask(__name__).test_request_context():
+        user = user_store.find_user('test')
+        assert user_store.find_user('test') is user
+        assert user_store.loader_cache_statistics()['request_hits'] == 1
+
+    assert user_store.find_user('test') is not user
@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId, json_util
+
+from app.app_setup import AppSetup
+from backup_database import default_backup_path, stream_backup
+from test.unit.common import config_for_tests
+
+
+@pytest.fixture(scope='function')
+def app_fixture(tmpdir):
+    return AppSetup(config_for_tests(tmpdir))
+
+
+def test_stream_backup(app_fixture, tmpdir):
+    app_fixture.mett_store.create_account('test')
+    path = tmpdir / 'mett.backup.ndjson'
+
+    stream_backup(app_fixture.user_interface, app_fixture.mett_store, path, batch_size=2)
+
+    lines = [json_util.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    sections = [line['$section'] for line in lines if '$section' in line]
+    assert sections == ['auth.role', 'auth.user', 'mett.account', 'mett.bun', 'mett.order', 'mett.purchases', 'mett.deposit', 'mett.charge']
+    account_index = lines.index({'$section': 'mett.account'})
+    assert lines[account_index + 1]['name'] == 'test'
+
+
+def test_stream_backup_prunes_journal(app_fixture, tmpdir):
+    mett_store = app_fixture.mett_store
+    mett_store._journal_enabled = True
+    mett_store._journal.insert_one({'_id': ObjectId.from_datetime(datetime.now(timezone.utc) - timedelta(days=30)), 'section': 'mett.account', 'key': {'name': 'old'}})
+    mett_store.create_account('test')
+
+    stream_backup(app_fixture.user_interface, mett_store, tmpdir / 'mett.backup.ndjson', retention_days=14)
+    assert [entry['key'] for entry in mett_store._journal.find()] == [{'name': 'test'}]
+
+
+def test_default_backup_path():
+    assert default_backup_path(False, 'none') == 'mett.backup.json'
+    assert default_backup_path(True, 'gzip') == 'mett.backup.ndjson.gz'
+    assert default_backup_path(True, 'none', encoding='bson') == 'mett.backup.bson'
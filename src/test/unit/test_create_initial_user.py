@@ -1,5 +1,4 @@
 import pytest
-from mongomock import MongoClient
 
 from app.app_setup import AppSetup
 from create_initial_user import create_init_user
@@ -7,9 +6,7 @@ from test.unit.common import config_for_tests
 
 
 @pytest.fixture(scope='function')
-def app_fixture(monkeypatch, tmpdir):
-    monkeypatch.setattr('database.mett_store.MongoClient', MongoClient)
-    monkeypatch.setattr('database.user_store.MongoClient', MongoClient)
+def app_fixture(tmpdir):
     return AppSetup(config_for_tests(tmpdir))
 
 
@@ -1,7 +1,6 @@
 import io
 
 import pytest
-from mongomock import MongoClient
 
 from app.app_setup import AppSetup
 from database.mett_store import StorageException
@@ -15,9 +14,7 @@ def mock_config(tmpdir):
 
 
 @pytest.fixture(scope='function')
-def app_fixture(mock_config, monkeypatch):
-    monkeypatch.setattr('database.mett_store.MongoClient', MongoClient)
-    monkeypatch.setattr('database.user_store.MongoClient', MongoClient)
+def app_fixture(mock_config):
     setup = AppSetup(mock_config)
     return setup
 
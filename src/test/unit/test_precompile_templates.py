@@ -0,0 +1,45 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import database.client
+from app.app_setup import create_template_app
+from precompile_templates import precompile_templates
+from test.unit.common import config_for_tests
+
+
+def _no_mongo(*_, **__):
+    raise AssertionError('templates must compile without database')
+
+
+@pytest.fixture(scope='function')
+def template_app(tmpdir, monkeypatch):
+    monkeypatch.setattr(database.client, 'MongoClient', _no_mongo)
+    config = config_for_tests(tmpdir)
+    config.set('Templates', 'bytecode_cache', str(tmpdir.join('template_cache')))
+    return create_template_app(config)
+
+
+def test_precompile_templates(template_app, tmpdir, capsys):
+    assert precompile_templates(template_app) == 0
+    assert 'into {}'.format(tmpdir.join('template_cache')) in capsys.readouterr().out
+    assert len(tmpdir.join('template_cache').listdir()) == len(template_app.jinja_env.list_templates())
+
+
+def test_precompile_templates_syntax_error(template_app, tmpdir, capsys):
+    tmpdir.join('broken.html').write('{% for x in items %}')
+    template_app.jinja_loader.searchpath.append(str(tmpdir))
+    assert precompile_templates(template_app) == 1
+    assert '[Error] broken.html' in capsys.readouterr().out
+
+
+def test_precompile_templates_script_without_mongo(tmpdir):
+    # as in docker build, the mongo server of app.config is not running
+    result = subprocess.run(
+        [sys.executable, 'precompile_templates.py', '--cache-dir', str(tmpdir)],
+        cwd=str(Path(__file__).parent.parent.parent), stdout=subprocess.PIPE, timeout=30, check=False
+    )
+    assert result.returncode == 0
+    assert b'templates compiled into' in result.stdout
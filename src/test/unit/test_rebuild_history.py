@@ -0,0 +1,19 @@
+import pytest
+
+from app.app_setup import AppSetup
+from rebuild_history import rebuild_history
+from test.unit.common import config_for_tests
+
+
+@pytest.fixture(scope='function')
+def app_fixture(tmpdir):
+    return AppSetup(config_for_tests(tmpdir))
+
+
+def test_rebuild_history(app_fixture):
+    mett_store = app_fixture.mett_store
+    mett_store._order.insert_one({'orders': [('test', 'Weizen'), ('test', 'Weizen')], 'processed': True, 'expiry_date': '2000-01-01'})
+    assert mett_store.get_order_history('test')[1] == 0
+
+    assert rebuild_history(app_fixture) == 0
+    assert mett_store.get_order_history('test')[1] == 2.0
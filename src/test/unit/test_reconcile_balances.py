@@ -0,0 +1,20 @@
+import pytest
+
+from app.app_setup import AppSetup
+from reconcile_balances import reconcile_balances
+from test.unit.common import config_for_tests
+
+
+@pytest.fixture(scope='function')
+def app_fixture(tmpdir):
+    return AppSetup(config_for_tests(tmpdir))
+
+
+def test_reconcile_balances(app_fixture, capsys):
+    app_fixture.mett_store.create_account('test')
+    app_fixture.mett_store.change_balance('test', 3.0, 'admin')
+    assert reconcile_balances(app_fixture) == 0
+
+    app_fixture.mett_store._account.update_one({'name': 'test'}, {'$inc': {'balance': -1.0}})
+    assert reconcile_balances(app_fixture) == 1
+    assert 'test' in capsys.readouterr().out
@@ -0,0 +1,186 @@
+import gzip
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId, json_util
+
+from app.app_setup import AppSetup
+from backup_database import backup, incremental_backup, stream_backup
+from database.backup_stream import BackupWriter, backup_format
+from database.mett_store import StorageException
+from database.reconciliation import BalanceReconciliation
+from rollback_database import StreamRestore, _batches, _replace_id_by_value, check_backup_chain, rollback
+from test.unit.common import HAS_NOT_EXPIRED, config_for_tests
+
+
+def _app_setup(tmpdir, database):
+    config = config_for_tests(tmpdir.mkdir(database))
+    config.set('Database', 'main_database', database)
+    config.set('Backup', 'journal', 'true')
+    return AppSetup(config)
+
+
+def _restore(app_setup, path, batch_size=2):
+    restore = StreamRestore(app_setup.mett_store, app_setup.user_interface, app_setup.app, batch_size=batch_size, report=lambda _: None)
+    rows = restore.restore(path)
+    restore.finish()
+    return rows
+
+
+def test_stream_round_trip(tmpdir):
+    source = _app_setup(tmpdir, 'mett_source')
+    source.user_interface.create_role('admin')
+    source.user_interface.create_user('test', '$2b$12$hashed', roles=['admin'], is_hashed=True)
+    for name in ['test', 'other', 'third']:
+        source.mett_store.create_account(name)
+    source.mett_store.change_balance('test', 5.0, 'admin')
+    source.mett_store.change_bun_price('Weizen', 0.5)
+    source.mett_store.create_order(HAS_NOT_EXPIRED)
+    source.mett_store.order_buns('test', 'Weizen', 3)
+    source.mett_store.state_purchase('test', 2.0, 'Zwiebeln')
+    path = tmpdir / 'mett.backup.ndjson.gz'
+    stream_backup(source.user_interface, source.mett_store, path, compression='gzip')
+
+    target = _app_setup(tmpdir, 'mett_target')
+    assert _restore(target, path) > 0
+
+    assert target.mett_store._account.find_one({'name': 'test'}) == source.mett_store._account.find_one({'name': 'test'})
+    assert target.mett_store._deposit.count_documents({}) == source.mett_store._deposit.count_documents({})
+    assert target.mett_store.get_current_user_buns('test')['Weizen'] == 3
+    assert target.mett_store._get_bun_price('Weizen') == 0.5
+    assert target.user_interface.get_user('test').password == '$2b$12$hashed'
+
+
+def test_json_round_trip_keeps_balances_reconciled(tmpdir, monkeypatch):
+    source = _app_setup(tmpdir, 'mett_source')
+    source.mett_store.create_account('test')
+    source.mett_store.change_balance('test', 5.0, 'admin')
+    source.mett_store.change_balance('test', -1.5, 'admin')
+    monkeypatch.chdir(tmpdir)
+    backup(source.app, source.user_interface, source.mett_store)
+
+    target = _app_setup(tmpdir, 'mett_target')
+    rollback(target.mett_store, target.user_interface, target.app, str(tmpdir / 'mett.backup.json'))
+
+    assert target.mett_store.get_account_information('test')['balance'] == 3.5
+    assert target.mett_store._deposit.count_documents({}) == 2
+    drifts = BalanceReconciliation(target.mett_store).run(datetime.now(timezone.utc) + timedelta(minutes=1), full=True)
+    assert [(drift.account, drift.drift) for drift in drifts] == [('test', 0.0)]
+
+
+def test_stream_restore_resolves_legacy_ids(tmpdir):
+    account_id, bun_id = ObjectId(), ObjectId()
+    path = tmpdir / 'mett.backup.ndjson'
+    with BackupWriter(path) as writer:
+        writer.write_section('mett.account', [{'_id': account_id, 'name': 'test', 'balance': 0.0}])
+        writer.write_section('mett.bun', [{'_id': bun_id, 'bun_class': 'Weizen', 'price': 0.5, 'mett': 50.0}])
+        writer.write_section('mett.order', [{'orders': [[account_id, bun_id]], 'processed': True, 'expiry_date': '2000-01-01'}])
+
+    target = _app_setup(tmpdir, 'mett_target')
+    assert _restore(target, path) == 3
+    assert target.mett_store._order.find_one()['orders'] == [['test', 'Weizen']]
+    assert target.mett_store.get_order_history('test')[1] == 1
+
+
+def test_stream_restore_into_filled_database(tmpdir):
+    path = tmpdir / 'mett.backup.ndjson'
+    with BackupWriter(path) as writer:
+        writer.write_section('mett.account', [{'_id': ObjectId(), 'name': 'test', 'balance': 0.0}])
+
+    target = _app_setup(tmpdir, 'mett_target')
+    target.mett_store.create_account('test')
+    with pytest.raises(StorageException):
+        _restore(target, path)
+
+
+def test_restore_increments(tmpdir):
+    source = _app_setup(tmpdir, 'mett_source')
+    source.mett_store.create_account('test')
+    source.mett_store.create_account('gone')
+    full, first, second = tmpdir / 'full.ndjson', tmpdir / 'first.ndjson', tmpdir / 'second.ndjson.gz'
+    stream_backup(source.user_interface, source.mett_store, full)
+
+    source.mett_store.delete_account('gone')
+    source.mett_store.create_account('new')
+    source.mett_store.create_order(HAS_NOT_EXPIRED)
+    source.mett_store.order_buns('test', 'Weizen', 2)
+    incremental_backup(source.user_interface, source.mett_store, first, full)
+
+    source.mett_store.change_bun_price('Roggen', 0.25)
+    source.mett_store.order_bun('new', 'Roggen')
+    source.mett_store.process_order()
+    incremental_backup(source.user_interface, source.mett_store, second, first, compression='gzip')
+
+    check_backup_chain(full, [first, second])
+    target = _app_setup(tmpdir, 'mett_target')
+    restore = StreamRestore(target.mett_store, target.user_interface, target.app, report=lambda _: None)
+    restore.restore(full)
+    restore.restore_increment(first)
+    restore.restore_increment(second)
+    restore.finish()
+
+    for collection in ['_account', '_order', '_buns', '_deposit', '_charge']:
+        assert list(getattr(target.mett_store, collection).find({}, {'bun_count': 0}).sort('_id')) == list(getattr(source.mett_store, collection).find({}, {'bun_count': 0}).sort('_id'))
+    assert target.mett_store.get_order_history('test')[1] == 2
+
+
+def test_backup_chain_mismatch(tmpdir):
+    source = _app_setup(tmpdir, 'mett_source')
+    full, first, second = tmpdir / 'full.ndjson', tmpdir / 'first.ndjson', tmpdir / 'second.ndjson'
+    stream_backup(source.user_interface, source.mett_store, full)
+    incremental_backup(source.user_interface, source.mett_store, first, full)
+    incremental_backup(source.user_interface, source.mett_store, second, full)
+
+    with pytest.raises(ValueError):
+        check_backup_chain(full, [second, first])
+
+
+def test_increment_needs_checkpoint(tmpdir):
+    source = _app_setup(tmpdir, 'mett_source')
+    old_backup = tmpdir / 'old.ndjson'
+    with BackupWriter(old_backup):
+        pass
+    with pytest.raises(StorageException):
+        incremental_backup(source.user_interface, source.mett_store, tmpdir / 'increment.ndjson', old_backup)
+
+
+def test_batches():
+    assert list(_batches(iter(range(5)), 2)) == [[0, 1], [2, 3], [4]]
+    assert not list(_batches([], 2))
+
+
+def test_replace_id_by_value():
+    assert _replace_id_by_value('ObjectId("1")', {'ObjectId("1")': 'test'}, 'name') == 'test'
+    with pytest.raises(ValueError):
+        _replace_id_by_value('ObjectId("2")', {'ObjectId("1")': 'test'}, 'name')
+
+
+def test_backup_format(tmpdir):
+    json_backup = tmpdir / 'mett.backup.json'
+    json_backup.write_text('{"auth": {}, "mett": {}}', encoding='utf-8')
+    assert backup_format(json_backup) == 'json'
+
+    stream_backup_path = tmpdir / 'mett.backup.ndjson.gz'
+    with BackupWriter(stream_backup_path, compression='gzip'):
+        pass
+    assert backup_format(stream_backup_path) == 'ndjson'
+    with gzip.open(str(stream_backup_path), 'rt') as backup_file:
+        assert json_util.loads(backup_file.readline())['format'] == 'mett-stream'
+
+    bson_backup_path = tmpdir / 'mett.backup.bson.gz'
+    with BackupWriter(bson_backup_path, compression='gzip', encoding='bson'):
+        pass
+    assert backup_format(bson_backup_path) == 'bson'
+
+
+def test_bson_round_trip(tmpdir):
+    source = _app_setup(tmpdir, 'mett_source')
+    source.mett_store.create_account('test')
+    source.mett_store.change_balance('test', 0.1 + 0.2, 'admin')
+    path = tmpdir / 'mett.backup.bson'
+    stream_backup(source.user_interface, source.mett_store, path, encoding='bson')
+
+    target = _app_setup(tmpdir, 'mett_target')
+    _restore(target, path)
+    assert list(target.mett_store._deposit.find()) == list(source.mett_store._deposit.find())
+    assert target.mett_store._account.find_one({'name': 'test'})['balance'] == 0.1 + 0.2
@@ -0,0 +1,26 @@
+import json
+
+from slow_queries import read_entries, summarize
+
+
+def _entry(shape, milliseconds, endpoint='order', store_call='mett_store.get_current_bun_order'):
+    return {'command': 'find', 'collection': 'order', 'shape': shape, 'milliseconds': milliseconds, 'documents': 1, 'endpoint': endpoint, 'store_call': store_call}
+
+
+def test_summarize():
+    summary = summarize([_entry('{"a": "?"}', 150), _entry('{"b": "?"}', 200), _entry('{"a": "?"}', 100, endpoint='admin')])
+    assert [query.shape for query in summary] == ['{"a": "?"}', '{"b": "?"}']
+    assert summary[0].count == 2
+    assert summary[0].total_ms == 250
+    assert summary[0].max_ms == 150
+    assert summary[0].endpoints == {'order': 1, 'admin': 1}
+
+
+def test_read_entries_with_rotated_logs(tmpdir):
+    log_file = tmpdir.join('slow.log')
+    log_file.write(json.dumps(_entry('new', 100)) + '\n')
+    tmpdir.join('slow.log.1').write(json.dumps(_entry('older', 100)) + '\nnot json\n')
+    tmpdir.join('slow.log.10').write(json.dumps(_entry('oldest', 100)) + '\n')
+
+    assert [entry['shape'] for entry in read_entries(str(log_file))] == ['oldest', 'older', 'new']
+    assert list(read_entries(str(tmpdir.join('missing.log')))) == []